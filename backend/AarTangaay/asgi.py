@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'AarTangaay.settings')
 
 application = get_asgi_application()
+
+# Le serveur de production ne démarre pas sans passerelles de livraison
+from notifications.livraison import verifier_passerelles  # noqa: E402
+verifier_passerelles()
@@ -11,7 +11,6 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
-from mongoengine import connect
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +45,7 @@ INSTALLED_APPS = [
     'vagues_chaleur',
     'recommandations',
     'statistiques',
+    'utils',
     'drf_yasg',
 
 ]
@@ -79,11 +79,161 @@ TEMPLATES = [
 ]
 
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'utils.auth.JWTAuthentication',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [],
+    # JSON encodé par orjson (utils.rendu), mêmes octets que JSONRenderer ;
+    # MessagePack et CBOR selon Accept / Content-Type
+    'DEFAULT_RENDERER_CLASSES': [
+        'utils.rendu.RenduJSON',
+        'utils.rendu.RenduMessagePack',
+        'utils.rendu.RenduCBOR',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'utils.rendu.AnalyseurMessagePack',
+        'utils.rendu.AnalyseurCBOR',
+    ],
+}
+
+# Pagination par curseur des listes (utils.pagination)
+PAGINATION_TAILLE_PAGE = int(os.environ.get('PAGINATION_TAILLE_PAGE', 50))
+PAGINATION_TAILLE_MAX = int(os.environ.get('PAGINATION_TAILLE_MAX', 500))
+# Listes en flux (?flux=1) : documents lus, représentés et envoyés par lots
+FLUX_TAILLE_LOT = int(os.environ.get('FLUX_TAILLE_LOT', 1000))
+
+# Listes lues en documents bruts sans instancier de Document (utils.brut) ;
+# 0 revient aux sérialiseurs. Comparaison : python manage.py benchmark_lecture
+LECTURE_BRUTE = os.environ.get('LECTURE_BRUTE', '1') == '1'
+
+# Durée de vie maximale (s) du cache des vagues actives ; les écritures le renouvellent dans tous les processus (utils.versions)
+VAGUES_ACTIVES_TTL = int(os.environ.get('VAGUES_ACTIVES_TTL', 60))
+# Les versions ne sont relues qu'une fois par VAGUES_ACTIVES_VERIFICATION secondes : les
+# écritures d'un autre processus sont vues avec au plus ce retard (celles du processus aussitôt)
+VAGUES_ACTIVES_VERIFICATION = float(os.environ.get('VAGUES_ACTIVES_VERIFICATION', 1.0))
+
+# Cache Django partagé entre processus (Redis ou Memcached en production,
+# mémoire locale par défaut)
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Cache des réponses des lectures fréquentes (utils.cache_reponses) : BackendMemoire
+# par processus, ou BackendDjango sur le cache CACHE_REPONSES_ALIAS, partagé par les
+# workers ; les entrées sont indexées par la version des collections lues, les deux
+# sont à jour pour tous les workers. TTL borne la durée de vie d'une entrée ;
+# ATTENTE (s) borne l'attente d'un calcul en cours de la même entrée
+CACHE_REPONSES_ACTIF = os.environ.get('CACHE_REPONSES_ACTIF', '1') == '1'
+CACHE_REPONSES_BACKEND = os.environ.get('CACHE_REPONSES_BACKEND', 'utils.cache_reponses.BackendMemoire')
+CACHE_REPONSES_ALIAS = 'default'
+CACHE_REPONSES_TTL = int(os.environ.get('CACHE_REPONSES_TTL', 60))
+CACHE_REPONSES_TAILLE = int(os.environ.get('CACHE_REPONSES_TAILLE', 1000))
+CACHE_REPONSES_ATTENTE = float(os.environ.get('CACHE_REPONSES_ATTENTE', 2.0))
+
+# Diffusion des alertes aux habitants (notifications.diffusion)
+DIFFUSION_WORKERS = int(os.environ.get('DIFFUSION_WORKERS', 2))
+DIFFUSION_TAILLE_LOT = int(os.environ.get('DIFFUSION_TAILLE_LOT', 1000))
+
+# Livraison multicanal des notifications (notifications.livraison) : une
+# passerelle par canal, DEBIT en messages/s et RAFALE en taille du seau à jetons.
+# Livraison désactivée par défaut (notifications laissées EN_ATTENTE). Aucune
+# passerelle par défaut : avec LIVRAISON_ACTIVE=1, le serveur ASGI et les commandes
+# de livraison refusent de démarrer sans PASSERELLE_SMS, PASSERELLE_PUSH et
+# PASSERELLE_EMAIL (notifications.passerelles.PasserelleLocale, factice, en développement)
+LIVRAISON_ACTIVE = os.environ.get('LIVRAISON_ACTIVE', '0') == '1'
+NOTIFICATIONS_PASSERELLES = {
+    'SMS': {
+        'CLASSE': os.environ.get('PASSERELLE_SMS'),
+        'DEBIT': 200, 'RAFALE': 400, 'TAILLE_LOT': 100, 'CONCURRENCE': 4,
+    },
+    'NOTIFICATION_PUSH': {
+        'CLASSE': os.environ.get('PASSERELLE_PUSH'),
+        'DEBIT': 2000, 'RAFALE': 4000, 'TAILLE_LOT': 500, 'CONCURRENCE': 4,
+    },
+    'EMAIL': {
+        'CLASSE': os.environ.get('PASSERELLE_EMAIL'),
+        'DEBIT': 500, 'RAFALE': 1000, 'TAILLE_LOT': 200, 'CONCURRENCE': 2,
+    },
 }
+LIVRAISON_FILE_MAX = 10000
+LIVRAISON_DELAI_LOT = 0.05
+LIVRAISON_TENTATIVES_MAX = 5
+LIVRAISON_BACKOFF_BASE = 1.0
+LIVRAISON_BACKOFF_MAX = 60.0
+
+# Coalescence des notifications (notifications.coalescence) : une seule
+# notification par utilisateur, vague et canal pendant la fenêtre (secondes,
+# 0 la désactive). Le filtre de Bloom est dimensionné pour CAPACITE clés
+NOTIFICATIONS_FENETRE_COALESCENCE = int(os.environ.get('NOTIFICATIONS_FENETRE_COALESCENCE', 3600))
+NOTIFICATIONS_COALESCENCE_CAPACITE = int(os.environ.get('NOTIFICATIONS_COALESCENCE_CAPACITE', 1000000))
+NOTIFICATIONS_COALESCENCE_FAUX_POSITIFS = 0.001
+
+# Rétention des notifications lues (notifications.archivage) : archiver_notifications
+# les déplace NOTIFICATIONS_RETENTION_JOURS jours après leur lecture vers la
+# collection compressée notifications_archives ; l'index TTL supprime celles qui
+# restent MARGE jours plus tard (à reporter en base par ensure_indexes --remplacer).
+# 0 désactive la rétention
+NOTIFICATIONS_RETENTION_JOURS = int(os.environ.get('NOTIFICATIONS_RETENTION_JOURS', 90))
+NOTIFICATIONS_TTL_MARGE_JOURS = int(os.environ.get('NOTIFICATIONS_TTL_MARGE_JOURS', 7))
+NOTIFICATIONS_ARCHIVE_COMPRESSION = os.environ.get('NOTIFICATIONS_ARCHIVE_COMPRESSION', 'zstd')
+NOTIFICATIONS_ARCHIVE_TAILLE_LOT = 1000
+
+# Bornes des bandes d'intensité du résumé détaillé des statistiques
+STATISTIQUES_BANDES_INTENSITE = [0, 1, 2, 3, 4, 5]
+
+# Cache des utilisateurs authentifiés (utils.auth) : nombre d'entrées et durée
+# de vie en secondes, qui borne le délai de prise en compte d'une désactivation
+# ou d'un changement de rôle fait par un autre processus
+AUTH_CACHE_TAILLE = int(os.environ.get('AUTH_CACHE_TAILLE', 10000))
+AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL', 60))
+
+# Hachage des mots de passe dans un pool de processus (authentification.hachage) :
+# 0 worker le garde dans le thread de la requête. Au-delà de HACHAGE_FILE_MAX
+# calculs en cours, connexion et inscription répondent 503 avec Retry-After
+HACHAGE_WORKERS = int(os.environ.get('HACHAGE_WORKERS', 2))
+HACHAGE_FILE_MAX = int(os.environ.get('HACHAGE_FILE_MAX', 64))
+HACHAGE_DELAI_MAX = float(os.environ.get('HACHAGE_DELAI_MAX', 10))
+
+# Import en masse des utilisateurs (authentification.imports) : la commande
+# importer_utilisateurs hache dans IMPORT_HACHAGE_WORKERS processus dédiés (0 : pool
+# de hachage du processus) ; l'API partage le pool HACHAGE_WORKERS du worker
+IMPORT_TAILLE_LOT = int(os.environ.get('IMPORT_TAILLE_LOT', 500))
+IMPORT_HACHAGE_WORKERS = int(os.environ.get('IMPORT_HACHAGE_WORKERS', 2))
+
+# Vérification au démarrage des index MongoDB déclarés (utils.indexes)
+INDEX_VERIFICATION_DEMARRAGE = os.environ.get('INDEX_VERIFICATION_DEMARRAGE', '1') == '1'
 
 WSGI_APPLICATION = 'AarTangaay.wsgi.application'
+ASGI_APPLICATION = 'AarTangaay.asgi.application'
+
+# Vues asynchrones de non_lues, actives, par_zone et me (AarTangaay.urls) :
+# à activer uniquement derrière un serveur ASGI (gunicorn.conf.py le fait)
+SERVICE_ASYNCHRONE = os.environ.get('SERVICE_ASYNCHRONE', '0') == '1'
+
+# Flux SSE des notifications (notifications.flux), publié par défaut sous le
+# service ASGI. BackendMongo partage les événements entre workers par une
+# collection plafonnée de NOTIFICATIONS_FLUX_TAILLE octets ; BackendMemoire
+# ne sert que les connexions du processus qui crée la notification
+NOTIFICATIONS_FLUX_ACTIF = os.environ.get('NOTIFICATIONS_FLUX_ACTIF', '1' if SERVICE_ASYNCHRONE else '0') == '1'
+NOTIFICATIONS_FLUX_BACKEND = os.environ.get('NOTIFICATIONS_FLUX_BACKEND', 'notifications.flux.BackendMongo')
+NOTIFICATIONS_FLUX_TAILLE = int(os.environ.get('NOTIFICATIONS_FLUX_TAILLE', 64 * 1024 * 1024))
+NOTIFICATIONS_FLUX_HISTORIQUE = 10000
+# Au-delà, la reprise par Last-Event-ID cède la place à un événement `resynchroniser`
+NOTIFICATIONS_FLUX_RATTRAPAGE_MAX = 1000
+NOTIFICATIONS_FLUX_FILE_MAX = 100
+NOTIFICATIONS_FLUX_PING = 15
+NOTIFICATIONS_FLUX_RECONNEXION_MS = 3000
+# Reprise du suivi de la collection : numéros relus pour ne pas manquer un événement inséré en retard
+NOTIFICATIONS_FLUX_MARGE_REPRISE = 1000
+# Validité (s) d'un ticket d'ouverture du flux, à usage unique
+NOTIFICATIONS_FLUX_TICKET_DUREE = 30
 
 
 # Database
@@ -96,14 +246,30 @@ WSGI_APPLICATION = 'AarTangaay.wsgi.application'
 #     }
 # }
 
-connect(
-    db='aartangaay_db',
-    host='mongo',
-    port=27017,
-    username='root',
-    password='at_db$',
-    authentication_source='admin',  # si nécessaire
-)
+# Connexion MongoDB, ouverte paresseusement dans chaque processus (utils.mongo)
+MONGODB = {
+    'db': os.environ.get('MONGO_DB', 'aartangaay_db'),
+    'host': os.environ.get('MONGO_HOST', 'mongo'),
+    'port': int(os.environ.get('MONGO_PORT', 27017)),
+    'username': os.environ.get('MONGO_USER', 'root'),
+    'password': os.environ.get('MONGO_PASSWORD', 'at_db$'),
+    'authentication_source': os.environ.get('MONGO_AUTH_SOURCE', 'admin'),
+    'maxPoolSize': int(os.environ.get('MONGO_MAX_POOL_SIZE', 100)),
+    'minPoolSize': int(os.environ.get('MONGO_MIN_POOL_SIZE', 0)),
+    'maxIdleTimeMS': int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', 300000)),
+    'waitQueueTimeoutMS': int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000)),
+    'connectTimeoutMS': int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000)),
+    'serverSelectionTimeoutMS': int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+    'socketTimeoutMS': int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 30000)),
+    'retryWrites': True,
+}
+if os.environ.get('MONGO_REPLICA_SET'):
+    MONGODB['replicaSet'] = os.environ['MONGO_REPLICA_SET']
+
+# Lectures des endpoints en lecture seule (listes, statistiques, recommandations)
+# envoyées de préférence aux secondaires, avec un retard maximal toléré en secondes
+MONGO_LECTURE_SECONDAIRE = os.environ.get('MONGO_LECTURE_SECONDAIRE', '0') == '1'
+MONGO_MAX_STALENESS_S = int(os.environ.get('MONGO_MAX_STALENESS_S', 90))
 
 
 # Password validation
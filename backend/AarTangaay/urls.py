@@ -14,7 +14,9 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.urls import path, include
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
@@ -44,4 +46,16 @@ urlpatterns = [
     path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
-]
\ No newline at end of file
+]
+
+# Fichiers statiques (admin, swagger) servis par Django en DEBUG, runserver ou non
+urlpatterns += staticfiles_urlpatterns()
+
+# Service ASGI : les lectures les plus fréquentes passent par des vues
+# asynchrones (pilote Mongo asynchrone), placées avant les routes DRF
+if settings.SERVICE_ASYNCHRONE:
+    urlpatterns = [
+        path('api/', include('authentification.urls_async')),
+        path('api/', include('vagues_chaleur.urls_async')),
+        path('api/', include('notifications.urls_async')),
+    ] + urlpatterns
\ No newline at end of file
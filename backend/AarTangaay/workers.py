@@ -0,0 +1,15 @@
+import os
+from uvicorn_worker import UvicornWorker
+
+
+class Worker(UvicornWorker):
+    """
+    Worker uvicorn de gunicorn.conf.py. Django ne gère pas le protocole
+    lifespan ; UVICORN_LIMITE_CONCURRENCE borne les connexions et requêtes
+    simultanées d'un worker, au-delà uvicorn répond 503.
+    """
+    CONFIG_KWARGS = {
+        **UvicornWorker.CONFIG_KWARGS,
+        'lifespan': 'off',
+        'limit_concurrency': int(os.environ.get('UVICORN_LIMITE_CONCURRENCE', 0)) or None,
+    }
@@ -0,0 +1,208 @@
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as DelaiDepasse
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, check_password, identify_hasher, get_hasher
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceSature(APIException):
+    """Le service de hachage refuse du travail : 503 avec l'en-tête Retry-After (attribut `wait`)"""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Service momentanément saturé, veuillez réessayer."
+    default_code = 'service_sature'
+
+    def __init__(self, wait, detail=None):
+        super().__init__(detail)
+        self.wait = wait
+
+
+# Fonctions exécutées dans les processus du pool
+
+def initialiser():
+    # Les hasheurs n'ont besoin que des réglages, pas du registre d'applications
+    settings.PASSWORD_HASHERS
+
+
+def hacher_mot_de_passe(mot_de_passe):
+    return make_password(mot_de_passe)
+
+
+def verifier_mot_de_passe(mot_de_passe, encode):
+    """(valide, nouveau hash si les paramètres du hasheur par défaut ont changé)"""
+    if not check_password(mot_de_passe, encode):
+        return False, None
+    try:
+        hasheur = identify_hasher(encode)
+    except ValueError:
+        return True, None
+    if hasheur.algorithm != get_hasher('default').algorithm or hasheur.must_update(encode):
+        return True, make_password(mot_de_passe)
+    return True, None
+
+
+def pool_dedie(workers):
+    """
+    Pool de processus de hachage. spawn : les processus ne dupliquent ni les
+    threads ni les connexions du worker HTTP. La commande d'import a son propre
+    pool ; dans un worker HTTP, l'import passe par celui du service (`appliquer`).
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=initialiser,
+    )
+
+
+class ServiceHachage:
+    """
+    Pool de processus dédié au hachage des mots de passe : le PBKDF2 ne
+    monopolise plus les workers HTTP. Le nombre de calculs en cours ou en
+    attente est borné ; au-delà, les demandes sont refusées immédiatement
+    (ServiceSature) plutôt que d'allonger la file.
+    """
+    def __init__(self, workers, file_max, delai_max):
+        self.pid = os.getpid()
+        self.workers = workers
+        self.file_max = file_max
+        self.delai_max = delai_max
+        self._pool = self._creer_pool()
+        self._places = threading.BoundedSemaphore(file_max)
+        self._verrou = threading.Lock()
+        self.en_cours = 0
+        self.traites = 0
+        self.rejetes = 0
+        self.duree_moyenne = 0.0
+
+    def _creer_pool(self):
+        return pool_dedie(self.workers)
+
+    def delai_estime(self):
+        """Secondes avant qu'une place se libère, pour Retry-After"""
+        return max(1, int(self.en_cours / self.workers * self.duree_moyenne) + 1)
+
+    def executer(self, fonction, *arguments):
+        if not self._places.acquire(blocking=False):
+            with self._verrou:
+                self.rejetes += 1
+            logger.warning("Hachage saturé : %d calculs en cours", self.en_cours)
+            raise ServiceSature(wait=self.delai_estime())
+
+        debut = time.monotonic()
+        with self._verrou:
+            self.en_cours += 1
+        try:
+            future = self._pool.submit(fonction, *arguments)
+        except BrokenProcessPool:
+            self._terminer(debut)
+            self._recreer_pool()
+            raise ServiceSature(wait=1)
+        # La place n'est rendue qu'à la fin réelle du calcul (ou à son annulation) :
+        # un calcul abandonné par la requête occupe encore le pool
+        future.add_done_callback(functools.partial(self._terminer, debut))
+        try:
+            return future.result(timeout=self.delai_max)
+        except DelaiDepasse:
+            # Sans effet si le calcul a déjà commencé
+            future.cancel()
+            raise ServiceSature(wait=self.delai_estime())
+        except BrokenProcessPool:
+            self._recreer_pool()
+            raise ServiceSature(wait=1)
+
+    def appliquer(self, fonction, elements):
+        """
+        Calculs en masse (import) sur le pool du service, au plus `workers`
+        soumis à la fois : les calculs des connexions s'intercalent au lieu
+        d'attendre la fin du lot. Résultats dans l'ordre des éléments.
+        """
+        en_vol = threading.BoundedSemaphore(self.workers)
+        futures = []
+        for element in elements:
+            en_vol.acquire()
+            future = self._pool.submit(fonction, element)
+            future.add_done_callback(lambda _: en_vol.release())
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def _recreer_pool(self):
+        logger.exception("Pool de hachage interrompu, recréation")
+        with self._verrou:
+            self._pool = self._creer_pool()
+
+    def _terminer(self, debut, future=None):
+        duree = time.monotonic() - debut
+        with self._verrou:
+            self.en_cours -= 1
+            self.traites += 1
+            # Moyenne mobile exponentielle de la durée d'un calcul (attente comprise)
+            self.duree_moyenne += (duree - self.duree_moyenne) * 0.1
+        self._places.release()
+
+    def metriques(self):
+        with self._verrou:
+            return {
+                'workers': self.workers,
+                'capacite': self.file_max,
+                'en_cours': self.en_cours,
+                'traites': self.traites,
+                'rejetes': self.rejetes,
+                'duree_moyenne_ms': round(self.duree_moyenne * 1000, 1),
+            }
+
+
+_service = None
+_verrou = threading.Lock()
+
+
+def service():
+    """Service du processus courant, recréé après un fork ; None si le hachage reste local"""
+    global _service
+    workers = getattr(settings, 'HACHAGE_WORKERS', 2)
+    if not workers:
+        return None
+    with _verrou:
+        if _service is None or _service.pid != os.getpid():
+            _service = ServiceHachage(
+                workers=workers,
+                file_max=getattr(settings, 'HACHAGE_FILE_MAX', 64),
+                delai_max=getattr(settings, 'HACHAGE_DELAI_MAX', 10),
+            )
+    return _service
+
+
+def hacher(mot_de_passe):
+    """Hash d'un mot de passe calculé hors du thread de la requête"""
+    pool = service()
+    if pool is None:
+        return hacher_mot_de_passe(mot_de_passe)
+    return pool.executer(hacher_mot_de_passe, mot_de_passe)
+
+
+def hacher_lot(mots_de_passe):
+    """Hashes d'une liste de mots de passe (import), sur le pool du processus"""
+    pool = service()
+    if pool is None:
+        return [hacher_mot_de_passe(mot_de_passe) for mot_de_passe in mots_de_passe]
+    return pool.appliquer(hacher_mot_de_passe, mots_de_passe)
+
+
+def verifier(mot_de_passe, encode):
+    """Vérifie un mot de passe ; retourne (valide, nouveau hash à enregistrer ou None)"""
+    pool = service()
+    if pool is None:
+        return verifier_mot_de_passe(mot_de_passe, encode)
+    return pool.executer(verifier_mot_de_passe, mot_de_passe, encode)
+
+
+def metriques():
+    pool = service()
+    return pool.metriques() if pool is not None else None
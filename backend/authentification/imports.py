@@ -0,0 +1,163 @@
+import contextlib
+import csv
+import datetime
+import itertools
+import re
+from bson import ObjectId
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from mongoengine.errors import ValidationError as ErreurValidation
+from pymongo.errors import BulkWriteError
+from utils import versions
+from zones_geographiques.models import ZoneGeographique
+from zones_geographiques.habitants import ajouter_habitants
+from .hachage import pool_dedie, hacher_mot_de_passe, hacher_lot
+from .models import User
+from .serializers import LigneImportSerializer, CHAMPS_UNIQUES
+
+# Nom de l'index dans le message d'erreur d'un doublon (serveurs sans keyValue)
+INDEX_DOUBLON = re.compile(r'index: (\w+?)_1')
+
+
+def lots(iterable, taille):
+    iterateur = iter(iterable)
+    while lot := list(itertools.islice(iterateur, taille)):
+        yield lot
+
+
+def lignes_csv(flux):
+    """Lit un CSV ligne à ligne : (numéro de ligne dans le fichier, valeurs non vides)"""
+    lecteur = csv.DictReader(flux)
+    for ligne in lecteur:
+        yield lecteur.line_num, {
+            cle.strip(): valeur.strip()
+            for cle, valeur in ligne.items()
+            if cle and valeur and valeur.strip()
+        }
+
+
+def champ_en_doublon(erreur):
+    """Champ de l'index unique violé par une erreur d'écriture 11000"""
+    cle = erreur.get('keyValue')
+    if cle:
+        return next(iter(cle))
+    trouve = INDEX_DOUBLON.search(erreur.get('errmsg', ''))
+    return trouve.group(1) if trouve else None
+
+
+class ImportUtilisateurs:
+    """
+    Import en masse d'utilisateurs par lots : validation des lignes, hachage
+    des mots de passe en parallèle, insert_many non ordonné et, si une zone est
+    indiquée (pour tout l'import ou par ligne), rattachement des habitants.
+    Les doublons sur les index uniques sont rapportés ligne par ligne.
+    `workers` : pool de hachage dédié de cette taille ; sans, le pool du
+    processus (authentification.hachage.service) est partagé.
+    """
+    def __init__(self, zone=None, taille_lot=None, workers=None):
+        self.zone_defaut = zone
+        self.taille_lot = taille_lot or getattr(settings, 'IMPORT_TAILLE_LOT', 500)
+        self.workers = workers
+        self.zones = {zone.id: zone} if zone is not None else {}
+        self.importes = 0
+        self.rattaches = 0
+        self.erreurs = []
+
+    def executer(self, lignes):
+        with contextlib.ExitStack() as pile:
+            hacher = hacher_lot
+            if self.workers:
+                pool = pile.enter_context(pool_dedie(self.workers))
+
+                def hacher(mots_de_passe):
+                    return list(pool.map(
+                        hacher_mot_de_passe, mots_de_passe,
+                        chunksize=max(1, len(mots_de_passe) // (self.workers * 4))
+                    ))
+            for lot in lots(lignes, self.taille_lot):
+                self.traiter_lot(lot, hacher)
+        return self.rapport()
+
+    def rapport(self):
+        return {
+            'importes': self.importes,
+            'rattaches': self.rattaches,
+            'nombre_erreurs': len(self.erreurs),
+            'erreurs': self.erreurs,
+        }
+
+    def erreur(self, numero, champ, message):
+        self.erreurs.append({'ligne': numero, 'champ': champ, 'erreur': str(message)})
+
+    def traiter_lot(self, lot, hacher):
+        lignes = []
+        for numero, ligne in lot:
+            serializer = LigneImportSerializer(data=ligne)
+            if not serializer.is_valid():
+                for champ, messages in serializer.errors.items():
+                    self.erreur(numero, champ, messages[0])
+                continue
+            lignes.append((numero, dict(serializer.validated_data)))
+
+        zones = self.resoudre_zones(lignes)
+        maintenant = datetime.datetime.now(datetime.timezone.utc)
+        candidats = []
+        for numero, donnees in lignes:
+            mot_de_passe = donnees.pop('password', None)
+            zone_id = donnees.pop('zone_id', None)
+            zone = zones.get(zone_id) if zone_id else self.zone_defaut
+            if zone_id and zone is None:
+                self.erreur(numero, 'zone_id', "Zone introuvable")
+                continue
+            utilisateur = User(**donnees, password='!', created_at=maintenant, updated_at=maintenant)
+            try:
+                utilisateur.validate()
+            except ErreurValidation as erreur:
+                for champ, message in (erreur.errors or {'non_field_errors': erreur}).items():
+                    self.erreur(numero, champ, message)
+                continue
+            candidats.append((numero, utilisateur, mot_de_passe, zone))
+
+        hashes = iter(hacher([mot_de_passe for _, _, mot_de_passe, _ in candidats if mot_de_passe]))
+        documents = []
+        for _, utilisateur, mot_de_passe, _ in candidats:
+            utilisateur.password = next(hashes) if mot_de_passe else make_password(None)
+            documents.append(utilisateur.to_mongo())
+        if not documents:
+            return
+
+        rejetes = {}
+        try:
+            User._get_collection().insert_many(documents, ordered=False)
+        except BulkWriteError as erreur:
+            rejetes = {e['index']: e for e in erreur.details['writeErrors']}
+        finally:
+            versions.toucher(User)
+        for index, erreur in rejetes.items():
+            numero = candidats[index][0]
+            if erreur['code'] == 11000:
+                champ = champ_en_doublon(erreur)
+                self.erreur(numero, champ or 'non_field_errors', CHAMPS_UNIQUES.get(champ, "Doublon"))
+            else:
+                self.erreur(numero, 'non_field_errors', erreur.get('errmsg'))
+        self.importes += len(documents) - len(rejetes)
+
+        habitants = {}
+        for index, (_, _, _, zone) in enumerate(candidats):
+            if zone is not None and index not in rejetes:
+                habitants.setdefault(zone.id, []).append(documents[index]['_id'])
+        for zone_id, utilisateurs_ids in habitants.items():
+            self.rattaches += ajouter_habitants(self.zones[zone_id], utilisateurs_ids)
+
+    def resoudre_zones(self, lignes):
+        """Zones désignées par les lignes du lot, chargées en une requête $in ; clés : zone_id texte"""
+        demandes = {donnees['zone_id'] for _, donnees in lignes if donnees.get('zone_id')}
+        a_charger = [ObjectId(z) for z in demandes if ObjectId.is_valid(z) and ObjectId(z) not in self.zones]
+        if a_charger:
+            for zone in ZoneGeographique.objects(id__in=a_charger).only('id'):
+                self.zones[zone.id] = zone
+        return {
+            z: self.zones[ObjectId(z)]
+            for z in demandes
+            if ObjectId.is_valid(z) and ObjectId(z) in self.zones
+        }
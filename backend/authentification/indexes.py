@@ -0,0 +1,6 @@
+from utils.indexes import declarer
+from .models import User
+
+# Index uniques des champs email, phone_number, last_name et user_id :
+# connexion par email, authentification par user_id, doublons à l'inscription
+declarer(User)
@@ -0,0 +1,41 @@
+from bson import ObjectId
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from authentification.imports import ImportUtilisateurs, lignes_csv
+from zones_geographiques.models import ZoneGeographique
+
+
+class Command(BaseCommand):
+    help = ("Importe des utilisateurs depuis un fichier CSV (email, last_name, "
+            "phone_number, first_name, password, role, zone_id) et rapporte les "
+            "lignes rejetées.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help="Chemin du fichier CSV (UTF-8, avec en-tête)")
+        parser.add_argument('--zone-id', help="Zone de rattachement des lignes sans zone_id")
+        parser.add_argument('--taille-lot', type=int, help="Nombre de lignes insérées par lot")
+        parser.add_argument('--workers', type=int, help="Nombre de processus de hachage (IMPORT_HACHAGE_WORKERS)")
+
+    def handle(self, *args, **options):
+        zone = None
+        if options['zone_id']:
+            if ObjectId.is_valid(options['zone_id']):
+                zone = ZoneGeographique.objects(id=options['zone_id']).only('id').first()
+            if zone is None:
+                raise CommandError("Zone géographique introuvable")
+
+        import_utilisateurs = ImportUtilisateurs(
+            zone=zone,
+            taille_lot=options['taille_lot'],
+            workers=options['workers'] if options['workers'] is not None
+            else getattr(settings, 'IMPORT_HACHAGE_WORKERS', 2),
+        )
+        with open(options['fichier'], newline='', encoding='utf-8-sig') as flux:
+            rapport = import_utilisateurs.executer(lignes_csv(flux))
+
+        for erreur in rapport['erreurs']:
+            self.stderr.write(f"Ligne {erreur['ligne']} ({erreur['champ']}) : {erreur['erreur']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{rapport['importes']} utilisateur(s) importé(s), {rapport['rattaches']} rattaché(s) "
+            f"à une zone, {rapport['nombre_erreurs']} ligne(s) rejetée(s)"
+        ))
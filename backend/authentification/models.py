@@ -1,10 +1,40 @@
-import datetime
 import uuid
 from mongoengine import Document, StringField, UUIDField, DateTimeField, BooleanField
 from django.contrib.auth.hashers import make_password, check_password
 from utils.enums import RoleEnum
+from utils.horodatage import Horodate, QuerySetHorodate
 
-class User(Document):
+
+class QuerySetUtilisateurs(QuerySetHorodate):
+    """
+    Les mises à jour groupées invalident aussi les utilisateurs visés dans le
+    cache d'authentification (utils.auth.principaux), comme les signaux de
+    save() et delete() : rôle, is_active ou mot de passe y sont lus.
+    """
+    def _principaux(self):
+        return self.clone().distinct('user_id')
+
+    def update(self, *args, **kwargs):
+        user_ids = self._principaux()
+        resultat = super().update(*args, **kwargs)
+        invalider_principaux(user_ids)
+        return resultat
+
+    def modify(self, *args, **kwargs):
+        user_ids = self._principaux()
+        resultat = super().modify(*args, **kwargs)
+        invalider_principaux(user_ids)
+        return resultat
+
+
+def invalider_principaux(user_ids):
+    # Import différé : utils.auth importe ce module
+    from utils.auth import principaux
+    for user_id in user_ids:
+        principaux.invalider(user_id)
+
+
+class User(Horodate):
     user_id = StringField(default=lambda: str(uuid.uuid4()), unique=True)
     last_name = StringField(required=True, unique=True, max_length=25)
     first_name  = StringField(max_length=30)
@@ -14,8 +44,10 @@ class User(Document):
     is_active = BooleanField(default=True)
     is_staff = BooleanField(default=False)
     role = StringField(choices=[r.name for r in RoleEnum], default=RoleEnum.USER.name)
-    created_at = DateTimeField(default=datetime.datetime.now(datetime.timezone.utc))
-    updated_at = DateTimeField(default=datetime.datetime.now(datetime.timezone.utc))
+
+    meta = {
+        'queryset_class': QuerySetUtilisateurs,
+    }
 
     def set_password(self, raw_password):   
         self.password = make_password(raw_password)
@@ -23,5 +55,13 @@ class User(Document):
     def check_password(self, raw_password):
         return check_password(raw_password, self.password)
     
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
+
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.role})"
@@ -1,6 +1,15 @@
 from rest_framework import serializers
+from mongoengine.queryset.visitor import Q
 from .models import User
 from utils.enums import RoleEnum
+from .hachage import hacher
+
+# Champs soumis à un index unique et message en cas de doublon
+CHAMPS_UNIQUES = {
+    'email': "Email déjà utilisé",
+    'phone_number': "Ce numéro est déjà utilisé.",
+    'last_name': "Ce nom est déjà utilisé.",
+}
 
 class RegisterSerializer(serializers.Serializer):
     email = serializers.EmailField()
@@ -13,17 +22,20 @@ class RegisterSerializer(serializers.Serializer):
         default=RoleEnum.USER.name
     )
 
-    def validate_email(self, value):
-        if User.objects(email=value).first():
-            raise serializers.ValidationError("Email déjà utilisé")
-        return value
-    
-    
-    def validate_phone_number(self, value):
-        """Vérifie si le numéro est déjà utilisé"""
-        if User.objects(phone_number=value).first():
-            raise serializers.ValidationError("Ce numéro est déjà utilisé.")
-        return value
+    def validate(self, attrs):
+        """Vérifie l'unicité de l'email, du numéro et du nom en une seule requête $or"""
+        existants = User.objects(
+            Q(email=attrs['email']) | Q(phone_number=attrs['phone_number']) | Q(last_name=attrs['last_name'])
+        ).only('email', 'phone_number', 'last_name')
+        
+        erreurs = {}
+        for existant in existants:
+            for champ in CHAMPS_UNIQUES:
+                if getattr(existant, champ) == attrs[champ]:
+                    erreurs[champ] = [CHAMPS_UNIQUES[champ]]
+        if erreurs:
+            raise serializers.ValidationError(erreurs)
+        return attrs
 
     def validate_role(self, value):
         """Valide le rôle selon l'enum"""
@@ -35,11 +47,25 @@ class RegisterSerializer(serializers.Serializer):
         """Crée un utilisateur avec un mot de passe hashé"""
         password = validated_data.pop('password')
         user = User(**validated_data)
-        user.set_password(password)
+        user.password = hacher(password)
         user.save()
         return user
 
 
+class LigneImportSerializer(RegisterSerializer):
+    """
+    Ligne d'un import en masse : l'unicité n'est pas vérifiée ici, les index
+    uniques la garantissent à l'insertion. Sans mot de passe, le compte est
+    créé avec un mot de passe inutilisable.
+    """
+    password = serializers.CharField(write_only=True, required=False, allow_blank=True)
+    first_name = serializers.CharField(required=False, allow_blank=True)
+    zone_id = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, attrs):
+        return attrs
+
+
 class LoginSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField(write_only=True)
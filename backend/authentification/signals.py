@@ -0,0 +1,12 @@
+from mongoengine import signals
+from utils.auth import principaux
+from .models import User
+
+
+def invalider_principal(sender, document, **kwargs):
+    # Rôle, is_active ou mot de passe modifiés : l'entrée du cache n'est plus sûre
+    principaux.invalider(document.user_id)
+
+
+signals.post_save.connect(invalider_principal, sender=User)
+signals.post_delete.connect(invalider_principal, sender=User)
@@ -1,3 +1,261 @@
-from django.test import TestCase
+import datetime
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import jwt
+from bson import ObjectId
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from utils.auth import principaux
+from utils.essais import TestMongo, creer_utilisateur, creer_zone
+from zones_geographiques.models import HabitantZone
+from . import hachage
+from .hachage import ServiceHachage, ServiceSature
+from .imports import ImportUtilisateurs, lignes_csv
+from .models import User
 
-# Create your tests here.
+
+@override_settings(HACHAGE_WORKERS=0)
+class ConnexionTests(TestMongo):
+    """L'inscription et la connexion ignorent un token périmé encore envoyé par le client"""
+
+    def entetes_expires(self):
+        expiration = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=1)
+        token = jwt.encode({'user_id': 'ancien', 'exp': expiration}, settings.SECRET_KEY, algorithm='HS256')
+        return {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def test_inscription_puis_connexion_avec_token_expire(self):
+        reponse = self.client.post('/api/register/', {
+            'email': 'awa@exemple.sn', 'password': 'secret-123', 'last_name': 'Diop', 'phone_number': '+221770000001',
+        }, format='json', **self.entetes_expires())
+        self.assertEqual(reponse.status_code, 201, reponse.content)
+
+        reponse = self.client.post('/api/login/', {
+            'email': 'awa@exemple.sn', 'password': 'secret-123',
+        }, format='json', **self.entetes_expires())
+        self.assertEqual(reponse.status_code, 200, reponse.content)
+        self.assertIn('token', reponse.json())
+
+    def test_token_expire_refuse_ailleurs(self):
+        reponse = self.client.get('/api/me/', **self.entetes_expires())
+        self.assertEqual(reponse.status_code, 401)
+
+
+class PrincipauxTests(TestMongo):
+    """Une mise à jour groupée d'un utilisateur invalide son entrée du cache d'authentification"""
+
+    def me(self, user):
+        return self.client.get('/api/me/', **self.entetes(user))
+
+    def test_desactivation_par_queryset(self):
+        user = creer_utilisateur(1)
+        self.assertEqual(self.me(user).status_code, 200)
+        self.assertIsNotNone(principaux.lire(user.user_id))
+
+        User.objects(id=user.id).update(set__is_active=False)
+        self.assertIsNone(principaux.lire(user.user_id))
+        self.assertEqual(self.me(user).status_code, 401)
+
+    def test_role_et_mot_de_passe(self):
+        user = creer_utilisateur(1, role='ADMIN')
+        self.assertEqual(self.me(user).json()['role'], 'ADMIN')
+        User.objects(role='ADMIN').update(set__role='USER')
+        self.assertEqual(self.me(user).json()['role'], 'USER')
+
+        # Chemin de la mise à niveau du hash à la connexion
+        User.objects(id=user.id).update_one(set__password='nouveau')
+        self.assertIsNone(principaux.lire(user.user_id))
+        self.me(user)
+        User.objects(id=user.id).modify(set__is_active=False)
+        self.assertEqual(self.me(user).status_code, 401)
+
+
+class ServiceHachageLocal(ServiceHachage):
+    """Pool de threads : les calculs de test n'ont pas à être sérialisables"""
+    def _creer_pool(self):
+        return ThreadPoolExecutor(max_workers=self.workers)
+
+
+class ServiceHachageTests(SimpleTestCase):
+    """Une place du service n'est rendue qu'à la fin réelle du calcul ; un calcul en attente expiré est annulé"""
+
+    def setUp(self):
+        self.libere = threading.Event()
+        self.addCleanup(self.libere.set)
+
+    def bloquer(self):
+        self.libere.wait(5)
+        return 'fait'
+
+    def test_place_gardee_apres_expiration(self):
+        service = ServiceHachageLocal(workers=1, file_max=1, delai_max=0.05)
+        with self.assertRaises(ServiceSature):
+            service.executer(self.bloquer)
+        # Le calcul abandonné tourne encore : pas de place pour un second
+        with self.assertRaises(ServiceSature):
+            service.executer(lambda: 'rapide')
+        self.assertEqual(service.rejetes, 1)
+
+        self.libere.set()
+        service._pool.shutdown(wait=True)
+        self.assertEqual(service.en_cours, 0)
+        service._pool = service._creer_pool()
+        self.assertEqual(service.executer(lambda: 'rapide'), 'rapide')
+
+    def test_calcul_en_attente_annule(self):
+        service = ServiceHachageLocal(workers=1, file_max=2, delai_max=0.05)
+        occupe = service._pool.submit(self.bloquer)
+        appels = []
+        with self.assertRaises(ServiceSature):
+            service.executer(appels.append, 'jamais')
+        # Annulé avant d'avoir commencé : la place est rendue sans attendre
+        self.assertEqual(service.en_cours, 0)
+        self.libere.set()
+        occupe.result()
+        service._pool.shutdown(wait=True)
+        self.assertEqual(appels, [])
+
+
+ENTETE = 'email,last_name,phone_number,first_name,password,zone_id\n'
+
+
+def fichier_csv(*lignes):
+    return ENTETE + ''.join(','.join(ligne) + '\n' for ligne in lignes)
+
+
+def ligne(numero, password='secret-123', zone_id='', **champs):
+    valeurs = dict(email=f'fatou{numero}@exemple.sn', last_name=f'Ndiaye{numero}', phone_number=f'+22178000{numero:04d}')
+    valeurs.update(champs)
+    return valeurs['email'], valeurs['last_name'], valeurs['phone_number'], 'Fatou', password, zone_id
+
+
+@override_settings(HACHAGE_WORKERS=0, IMPORT_HACHAGE_WORKERS=0)
+class ImportUtilisateursTests(TestMongo):
+    """Import CSV : lignes rejetées rapportées avec leur numéro dans le fichier, les autres importées"""
+
+    def importer(self, texte, **options):
+        return ImportUtilisateurs(**options).executer(lignes_csv(io.StringIO(texte)))
+
+    def erreurs(self, rapport):
+        return [(erreur['ligne'], erreur['champ']) for erreur in rapport['erreurs']]
+
+    def test_doublons_dans_le_fichier(self):
+        rapport = self.importer(fichier_csv(
+            ligne(1),
+            ligne(2, email='fatou1@exemple.sn'),
+            ligne(3),
+            ligne(4, phone_number='+221780000003'),
+            ligne(5, last_name='Ndiaye1'),
+            ligne(6),
+        ), taille_lot=4)
+        # Lignes du fichier (en-tête en ligne 1), lots de 4 : index de BulkWriteError propre à chaque lot
+        self.assertEqual(sorted(self.erreurs(rapport)), [(3, 'email'), (5, 'phone_number'), (6, 'last_name')])
+        self.assertEqual(rapport['erreurs'][0]['erreur'], "Email déjà utilisé")
+        self.assertEqual(rapport['importes'], 3)
+        self.assertEqual(
+            sorted(User.objects.distinct('last_name')), ['Ndiaye1', 'Ndiaye3', 'Ndiaye6']
+        )
+
+    def test_doublon_en_base(self):
+        existant = creer_utilisateur(1)
+        rapport = self.importer(fichier_csv(ligne(1, email=existant.email), ligne(2)))
+        self.assertEqual(self.erreurs(rapport), [(2, 'email')])
+        self.assertEqual(rapport['importes'], 1)
+        self.assertEqual(User.objects(email=existant.email).count(), 1)
+
+    def test_zone_inconnue(self):
+        zone = creer_zone()
+        rapport = self.importer(fichier_csv(
+            ligne(1, zone_id=str(ObjectId())),
+            ligne(2, zone_id='pas-un-id'),
+            ligne(3, zone_id=str(zone.id)),
+            ligne(4),
+        ))
+        self.assertEqual(self.erreurs(rapport), [(2, 'zone_id'), (3, 'zone_id')])
+        self.assertEqual((rapport['importes'], rapport['rattaches']), (2, 1))
+        self.assertEqual(HabitantZone.objects(zone=zone).count(), 1)
+
+    def test_mots_de_passe(self):
+        rapport = self.importer(fichier_csv(ligne(1), ligne(2, password=''), ligne(3, password='   ')))
+        self.assertEqual((rapport['importes'], rapport['nombre_erreurs']), (3, 0))
+        mots_de_passe = {user.last_name: user.password for user in User.objects}
+        self.assertTrue(check_password('secret-123', mots_de_passe['Ndiaye1']))
+        # Sans mot de passe : compte créé, connexion impossible
+        for nom in ('Ndiaye2', 'Ndiaye3'):
+            self.assertFalse(check_password('', mots_de_passe[nom]))
+            self.assertTrue(mots_de_passe[nom].startswith('!'))
+        reponse = self.client.post('/api/login/', {'email': 'fatou2@exemple.sn', 'password': ''}, format='json')
+        self.assertNotEqual(reponse.status_code, 200)
+
+    def test_lignes_invalides(self):
+        rapport = self.importer(fichier_csv(
+            ligne(1, email='pas-un-email'),
+            ligne(2, phone_number=''),
+            ligne(3),
+        ))
+        self.assertEqual(self.erreurs(rapport), [(2, 'email'), (3, 'phone_number')])
+        self.assertEqual(rapport['importes'], 1)
+
+    def test_succes_partiel_par_l_api(self):
+        admin = creer_utilisateur(1, role='ADMIN')
+        zone = creer_zone()
+        contenu = fichier_csv(ligne(1), ligne(2, email='fatou1@exemple.sn'), ligne(3, zone_id=str(ObjectId())), ligne(4))
+
+        def envoyer(utilisateur, **donnees):
+            fichier = SimpleUploadedFile('utilisateurs.csv', contenu.encode(), content_type='text/csv')
+            return self.client.post(
+                '/api/utilisateurs/import/', {'fichier': fichier, **donnees}, format='multipart',
+                **self.entetes(utilisateur)
+            )
+
+        self.assertEqual(envoyer(creer_utilisateur(2)).status_code, 403)
+        self.assertEqual(envoyer(admin, zone_id=str(ObjectId())).status_code, 404)
+        reponse = envoyer(admin, zone_id=str(zone.id))
+        self.assertEqual(reponse.status_code, 200, reponse.content)
+        rapport = reponse.json()
+        self.assertEqual((rapport['importes'], rapport['rattaches'], rapport['nombre_erreurs']), (2, 2, 2))
+        self.assertEqual(sorted(self.erreurs(rapport)), [(3, 'email'), (4, 'zone_id')])
+
+    def test_commande(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as fichier:
+            fichier.write(fichier_csv(ligne(1), ligne(2, email='fatou1@exemple.sn')))
+        self.addCleanup(os.remove, fichier.name)
+        sortie, erreurs = io.StringIO(), io.StringIO()
+        call_command('importer_utilisateurs', fichier.name, stdout=sortie, stderr=erreurs)
+        self.assertIn("1 utilisateur(s) importé(s)", sortie.getvalue())
+        self.assertIn("Ligne 3 (email) : Email déjà utilisé", erreurs.getvalue())
+
+
+class HachageEnMasseTests(SimpleTestCase):
+    """L'import en masse sur le pool partagé : résultats dans l'ordre, au plus `workers` calculs soumis"""
+
+    def test_appliquer(self):
+        service = ServiceHachageLocal(workers=2, file_max=4, delai_max=1)
+        self.addCleanup(service._pool.shutdown)
+        en_vol = []
+        maximum = []
+        verrou = threading.Lock()
+
+        def calculer(valeur):
+            with verrou:
+                en_vol.append(valeur)
+                maximum.append(len(en_vol))
+            threading.Event().wait(0.01)
+            with verrou:
+                en_vol.remove(valeur)
+            return valeur * 2
+
+        self.assertEqual(service.appliquer(calculer, range(10)), [valeur * 2 for valeur in range(10)])
+        self.assertLessEqual(max(maximum), 2)
+        # La capacité des connexions n'est pas consommée
+        self.assertEqual(service.executer(lambda: 'connexion'), 'connexion')
+
+    @override_settings(HACHAGE_WORKERS=0)
+    def test_hacher_lot_local(self):
+        hashes = hachage.hacher_lot(['a', 'b'])
+        self.assertTrue(check_password('a', hashes[0]) and check_password('b', hashes[1]))
@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import RegisterView, LoginView, MeView
+from .views import RegisterView, LoginView, MeView, ImportUtilisateursView
 
 urlpatterns = [
     path("register/", RegisterView.as_view()),
     path("login/", LoginView.as_view()),
     path("me/", MeView.as_view()),
+    path("utilisateurs/import/", ImportUtilisateursView.as_view()),
 ]
@@ -0,0 +1,6 @@
+from django.urls import path
+from . import views_async
+
+urlpatterns = [
+    path("me/", views_async.me),
+]
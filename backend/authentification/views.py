@@ -6,6 +6,14 @@ from .models import User
 from utils.enums import RoleEnum
 from utils.auth import authenticate_request
 from .serializers import RegisterSerializer, LoginSerializer, UserSerializer
+from .hachage import verifier, metriques
+from notifications.coalescence import metriques as metriques_coalescence
+from utils.cache_reponses import metriques as metriques_cache
+from .imports import ImportUtilisateurs, lignes_csv
+from zones_geographiques.models import ZoneGeographique
+from rest_framework.parsers import MultiPartParser
+from bson import ObjectId
+import codecs
 import jwt, datetime
 from django.conf import settings
 from drf_yasg.utils import swagger_auto_schema
@@ -24,6 +32,9 @@ def generate_jwt_token(user_id, email):
 
 
 class RegisterView(APIView):
+    # Un token expiré ou invalide encore envoyé par le client ne doit pas bloquer l'inscription
+    authentication_classes = []
+
     @swagger_auto_schema(
         operation_description="Créer un nouvel utilisateur.\n\n"
             "Permet de créer un compte utilisateur en fournissant les informations nécessaires.",
@@ -41,6 +52,12 @@ class RegisterView(APIView):
                     "application/json": {"email": ["Cet email existe déjà."]}
                 }
             ),
+            503: openapi.Response(
+                description="Service de hachage saturé (en-tête Retry-After)",
+                examples={
+                    "application/json": {"detail": "Service momentanément saturé, veuillez réessayer."}
+                }
+            ),
         }
     )
     def post(self, request):
@@ -52,6 +69,9 @@ class RegisterView(APIView):
 
 
 class LoginView(APIView):
+    # Un token expiré ou invalide encore envoyé par le client ne doit pas bloquer la connexion
+    authentication_classes = []
+
     @swagger_auto_schema(
         operation_description="Connexion utilisateur.\n\n"
             "Permet à un utilisateur de se connecter et de recevoir un token JWT.",
@@ -77,6 +97,12 @@ class LoginView(APIView):
                     "application/json": {"detail": "Identifiants invalides"}
                 }
             ),
+            503: openapi.Response(
+                description="Service de hachage saturé (en-tête Retry-After)",
+                examples={
+                    "application/json": {"detail": "Service momentanément saturé, veuillez réessayer."}
+                }
+            ),
         }
     )
     def post(self, request):
@@ -87,9 +113,16 @@ class LoginView(APIView):
         data = serializer.validated_data
         user = User.objects(email=data["email"]).first()
 
-        if not user or not user.check_password(data["password"]):
+        if not user:
             raise AuthenticationFailed("Identifiants invalides")
 
+        valide, nouveau_hash = verifier(data["password"], user.password)
+        if not valide:
+            raise AuthenticationFailed("Identifiants invalides")
+        if nouveau_hash:
+            # Paramètres du hasheur modifiés : le hash est mis à niveau à la connexion
+            User.objects(id=user.id).update_one(set__password=nouveau_hash)
+
         token = generate_jwt_token(user.user_id, user.email)
         user_data = UserSerializer(user).data
 
@@ -121,11 +154,7 @@ class MeView(APIView):
     def get(self, request):
         user = request.user
         serializer = UserSerializer(user)
-        serialized_data = serializer.data
-        
-        print("Serialized data:", serialized_data)
-        
-        return Response(serialized_data)
+        return Response(serializer.data)
 
 
 class AdminDashboardView(APIView):
@@ -136,7 +165,31 @@ class AdminDashboardView(APIView):
             200: openapi.Response(
                 description="Bienvenue sur le tableau de bord admin",
                 examples={
-                    "application/json": {"message": "Bienvenue sur le tableau de bord admin"}
+                    "application/json": {
+                        "message": "Bienvenue sur le tableau de bord admin",
+                        "hachage": {
+                            "workers": 2,
+                            "capacite": 64,
+                            "en_cours": 3,
+                            "traites": 1520,
+                            "rejetes": 0,
+                            "duree_moyenne_ms": 142.5
+                        },
+                        "coalescence": {
+                            "fenetre_s": 3600,
+                            "retenues": 120000,
+                            "supprimees": 3400,
+                            "suspectes": 3450,
+                            "faux_positifs": 50
+                        },
+                        "cache_reponses": {
+                            "backend": "BackendMemoire",
+                            "ttl_s": 60,
+                            "endpoints": {
+                                "recommandations.par_zone": {"succes": 980, "echecs": 15, "coalescees": 5, "taux_succes": 0.985}
+                            }
+                        }
+                    }
                 }
             ),
             403: openapi.Response(
@@ -152,4 +205,71 @@ class AdminDashboardView(APIView):
         if request.user.role != RoleEnum.ADMIN.name:
             return Response({"error": "Accès refusé, admin uniquement"}, status=403)
 
-        return Response({"message": "Bienvenue sur le tableau de bord admin"})
+        return Response({
+            "message": "Bienvenue sur le tableau de bord admin",
+            "hachage": metriques(),
+            "coalescence": metriques_coalescence(),
+            "cache_reponses": metriques_cache()
+        })
+
+
+class ImportUtilisateursView(APIView):
+    parser_classes = [MultiPartParser]
+
+    @swagger_auto_schema(
+        operation_description="Importer des utilisateurs depuis un CSV (admin uniquement).\n\n"
+            "Colonnes : email, last_name, phone_number, first_name, password, role, zone_id. "
+            "Le fichier est lu par lots ; chaque ligne rejetée (validation, doublon d'email, "
+            "de numéro ou de nom, zone inconnue) est rapportée avec son numéro.",
+        manual_parameters=[
+            openapi.Parameter('fichier', openapi.IN_FORM, description="Fichier CSV (UTF-8, en-tête obligatoire)", type=openapi.TYPE_FILE, required=True),
+            openapi.Parameter('zone_id', openapi.IN_FORM, description="Zone de rattachement des utilisateurs sans colonne zone_id", type=openapi.TYPE_STRING),
+        ],
+        responses={
+            200: openapi.Response(
+                description="Rapport d'import",
+                examples={
+                    "application/json": {
+                        "importes": 998,
+                        "rattaches": 998,
+                        "nombre_erreurs": 2,
+                        "erreurs": [
+                            {"ligne": 14, "champ": "email", "erreur": "Email déjà utilisé"},
+                            {"ligne": 352, "champ": "phone_number", "erreur": "Ce champ est obligatoire."}
+                        ]
+                    }
+                }
+            ),
+            400: openapi.Response(
+                description="Fichier manquant",
+                examples={"application/json": {"error": "fichier requis"}}
+            ),
+            403: openapi.Response(
+                description="Accès refusé",
+                examples={"application/json": {"error": "Accès refusé, admin uniquement"}}
+            ),
+            404: openapi.Response(
+                description="Zone introuvable",
+                examples={"application/json": {"error": "Zone géographique introuvable"}}
+            ),
+        }
+    )
+    @authenticate_request
+    def post(self, request):
+        if request.user.role != RoleEnum.ADMIN.name:
+            return Response({"error": "Accès refusé, admin uniquement"}, status=403)
+
+        fichier = request.FILES.get('fichier')
+        if fichier is None:
+            return Response({"error": "fichier requis"}, status=400)
+
+        zone = None
+        zone_id = request.data.get('zone_id')
+        if zone_id:
+            zone = ZoneGeographique.objects(id=zone_id).only('id').first() if ObjectId.is_valid(zone_id) else None
+            if zone is None:
+                return Response({"error": "Zone géographique introuvable"}, status=404)
+
+        # Lecture en flux : le fichier n'est jamais décodé en entier en mémoire
+        lignes = lignes_csv(codecs.iterdecode(fichier, 'utf-8-sig'))
+        return Response(ImportUtilisateurs(zone=zone).executer(lignes))
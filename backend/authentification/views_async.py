@@ -0,0 +1,12 @@
+from rest_framework.exceptions import AuthenticationFailed
+from utils.asynchrone import vue_async, authentifier, reponse
+from .serializers import UserSerializer
+
+
+@vue_async
+async def me(request):
+    """Informations de l'utilisateur connecté, servies depuis le cache des principaux"""
+    user = await authentifier(request)
+    if user is None:
+        raise AuthenticationFailed("Token JWT manquant")
+    return reponse(request, UserSerializer(user).data)
@@ -0,0 +1,29 @@
+# Configuration du serveur de production : gunicorn supervise des workers
+# uvicorn qui servent AarTangaay.asgi:application
+#   gunicorn AarTangaay.asgi:application -c gunicorn.conf.py
+import multiprocessing
+import os
+
+# Les vues asynchrones ne sont routées que derrière ce serveur
+os.environ.setdefault('SERVICE_ASYNCHRONE', '1')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = 'AarTangaay.workers.Worker'
+# Un processus par cœur suffit : chaque worker sert ses requêtes en asynchrone
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+backlog = int(os.environ.get('GUNICORN_BACKLOG', 2048))
+
+# Un worker muet pendant `timeout` secondes est redémarré
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Recyclage des workers pour contenir la dérive mémoire
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+reload = os.environ.get('GUNICORN_RELOAD', '0') == '1'
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1')
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
@@ -0,0 +1,114 @@
+import datetime
+import gzip
+import logging
+import os
+from bson import json_util
+from bson.json_util import RELAXED_JSON_OPTIONS
+from django.conf import settings
+from pymongo.errors import BulkWriteError
+from utils import versions
+from .models import Notification, NotificationArchivee
+
+logger = logging.getLogger(__name__)
+
+JOUR = 86400
+
+
+def parametre(nom, defaut):
+    return getattr(settings, nom, defaut)
+
+
+def index_retention():
+    """
+    Index partiel des notifications lues sur date_lecture. Avec une rétention,
+    il devient TTL : les notifications que l'archivage n'a pas déplacées sont
+    supprimées NOTIFICATIONS_TTL_MARGE_JOURS jours après l'échéance.
+    """
+    spec = {'fields': ['date_lecture'], 'partialFilterExpression': {'lue': True}}
+    jours = parametre('NOTIFICATIONS_RETENTION_JOURS', 90)
+    if jours:
+        spec['expireAfterSeconds'] = (jours + parametre('NOTIFICATIONS_TTL_MARGE_JOURS', 7)) * JOUR
+    return spec
+
+
+def filtre_expirees(limite):
+    """Notifications lues avant `limite` ; sans date_lecture (antérieures), la date d'envoi fait foi"""
+    return {'lue': True, '$or': [
+        {'date_lecture': {'$lt': limite}},
+        {'date_lecture': None, 'date_envoi': {'$lt': limite}},
+    ]}
+
+
+class ArchiveCollection:
+    """Archive dans la collection compressée notifications_archives, relue par ?archives=1"""
+    def ecrire(self, documents):
+        maintenant = datetime.datetime.now(datetime.timezone.utc)
+        try:
+            NotificationArchivee._get_collection().insert_many(
+                [dict(document, archived_at=maintenant) for document in documents], ordered=False
+            )
+        except BulkWriteError as erreur:
+            # Lot déjà archivé par une exécution interrompue avant la suppression
+            if any(e['code'] != 11000 for e in erreur.details['writeErrors']):
+                raise
+        versions.toucher(NotificationArchivee)
+
+    def fermer(self):
+        pass
+
+
+class ArchiveFichiers:
+    """Archive en fichiers NDJSON compressés (gzip), un par exécution, hors de MongoDB"""
+    def __init__(self, dossier):
+        os.makedirs(dossier, exist_ok=True)
+        horodatage = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d-%H%M%S')
+        self.chemin = os.path.join(dossier, f"notifications-{horodatage}.ndjson.gz")
+        self._fichier = None
+
+    def ecrire(self, documents):
+        if self._fichier is None:
+            self._fichier = gzip.open(self.chemin, 'ab')
+        for document in documents:
+            self._fichier.write(json_util.dumps(document, json_options=RELAXED_JSON_OPTIONS).encode() + b'\n')
+        # Le lot doit être sur disque avant d'être supprimé de la base
+        self._fichier.flush()
+        os.fsync(self._fichier.fileobj.fileno())
+
+    def fermer(self):
+        if self._fichier is not None:
+            self._fichier.close()
+
+
+def archiver(destination, jours=None, taille_lot=None):
+    """
+    Déplace par lots vers `destination` les notifications lues depuis plus de
+    `jours` jours : écriture du lot, puis suppression. Une exécution
+    interrompue reprend sans perte (au pire un lot est écrit deux fois dans
+    les fichiers). Retourne le nombre de notifications archivées.
+    """
+    jours = parametre('NOTIFICATIONS_RETENTION_JOURS', 90) if jours is None else jours
+    taille_lot = taille_lot or parametre('NOTIFICATIONS_ARCHIVE_TAILLE_LOT', 1000)
+    limite = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=jours)
+    collection = Notification._get_collection()
+    filtre = filtre_expirees(limite)
+    dernier_id = None
+    nombre = 0
+
+    try:
+        while True:
+            requete = dict(filtre)
+            if dernier_id is not None:
+                requete['_id'] = {'$gt': dernier_id}
+            lot = list(collection.find(requete).sort('_id', 1).limit(taille_lot))
+            if not lot:
+                break
+            destination.ecrire(lot)
+            # `lue` revérifié : une notification repassée non lue entre-temps reste active
+            collection.delete_many({'_id': {'$in': [document['_id'] for document in lot]}, 'lue': True})
+            versions.toucher(Notification)
+            nombre += len(lot)
+            dernier_id = lot[-1]['_id']
+            logger.info("%d notification(s) archivée(s)", nombre)
+    finally:
+        destination.fermer()
+    return nombre
@@ -0,0 +1,206 @@
+import datetime
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from .models import CleCoalescence
+
+
+def parametre(nom, defaut):
+    return getattr(settings, nom, defaut)
+
+
+def cle(document):
+    """Clé de coalescence d'une notification brute : (utilisateur, vague, canal)"""
+    return document['utilisateur'], document['vague_chaleur'], document['type']
+
+
+class FiltreBloom:
+    """Ensemble probabiliste : pas de faux négatif, `taux` de faux positifs à `capacite` éléments"""
+    def __init__(self, capacite, taux):
+        self.taille = max(64, int(-capacite * math.log(taux) / math.log(2) ** 2))
+        self.nombre_hachages = max(1, round(self.taille / capacite * math.log(2)))
+        self.bits = bytearray((self.taille + 7) // 8)
+
+    def _positions(self, element):
+        # Double hachage : k positions dérivées de deux entiers de 64 bits
+        empreinte = hashlib.blake2b(element, digest_size=16).digest()
+        a = int.from_bytes(empreinte[:8], 'little')
+        b = int.from_bytes(empreinte[8:], 'little') | 1
+        return [(a + i * b) % self.taille for i in range(self.nombre_hachages)]
+
+    def ajouter(self, element):
+        for position in self._positions(element):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, element):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(element))
+
+
+def empreinte(cle):
+    utilisateur, vague, canal = cle
+    return utilisateur.binary + vague.binary + canal.encode()
+
+
+class Coalesceur:
+    """
+    Supprime les notifications déjà émises pour le même (utilisateur, vague,
+    canal) depuis moins de `fenetre` secondes. La référence est la collection
+    cles_coalescence : chaque notification retenue y réserve sa clé par un
+    upsert sur l'index unique, la réservation concurrente perd sur la clé
+    dupliquée. Un filtre de Bloom des clés réservées par le processus évite
+    l'écriture pour les doublons probables, qui sont confirmés en une lecture
+    groupée : un faux positif n'entraîne jamais de suppression.
+    """
+    def __init__(self, fenetre, capacite, taux):
+        self.pid = os.getpid()
+        self.fenetre = fenetre
+        self.capacite = capacite
+        self.taux = taux
+        # Deux générations : une clé réservée reste dans le filtre au moins `fenetre` secondes
+        self._filtres = [FiltreBloom(capacite, taux), FiltreBloom(capacite, taux)]
+        self._rotation = time.monotonic() + fenetre
+        self._verrou = threading.Lock()
+        self.retenues = 0
+        self.supprimees = 0
+        self.suspectes = 0
+        self.faux_positifs = 0
+
+    def _memoriser(self, cles):
+        with self._verrou:
+            if time.monotonic() >= self._rotation:
+                self._filtres = [FiltreBloom(self.capacite, self.taux), self._filtres[0]]
+                self._rotation = time.monotonic() + self.fenetre
+            for c in cles:
+                self._filtres[0].ajouter(empreinte(c))
+
+    def _suspecte(self, c):
+        element = empreinte(c)
+        with self._verrou:
+            return any(element in filtre for filtre in self._filtres)
+
+    def _actives(self, cles, instant):
+        """Clés encore réservées parmi `cles`, une requête par (vague, canal)"""
+        groupes = defaultdict(list)
+        for utilisateur, vague, canal in cles:
+            groupes[(vague, canal)].append(utilisateur)
+        actives = set()
+        collection = CleCoalescence._get_collection()
+        for (vague, canal), utilisateurs in groupes.items():
+            for document in collection.find({
+                'utilisateur': {'$in': utilisateurs},
+                'vague_chaleur': vague,
+                'type': canal,
+                'expire_le': {'$gt': instant},
+            }, {'_id': 0, 'utilisateur': 1}):
+                actives.add((document['utilisateur'], vague, canal))
+        return actives
+
+    def _reserver(self, cles, instant):
+        """Réserve les clés ; retourne celles déjà réservées par un autre émetteur"""
+        expiration = instant + datetime.timedelta(seconds=self.fenetre)
+        operations = [
+            UpdateOne(
+                {'utilisateur': utilisateur, 'vague_chaleur': vague, 'type': canal, 'expire_le': {'$lte': instant}},
+                {'$set': {'expire_le': expiration}},
+                upsert=True
+            )
+            for utilisateur, vague, canal in cles
+        ]
+        if not operations:
+            return set()
+        try:
+            CleCoalescence._get_collection().bulk_write(operations, ordered=False)
+        except BulkWriteError as erreur:
+            # Clé dupliquée : une réservation encore valide existe (filtre expire_le non satisfait)
+            if any(e['code'] != 11000 for e in erreur.details['writeErrors']):
+                raise
+            return {cles[e['index']] for e in erreur.details['writeErrors']}
+        return set()
+
+    def coalescer(self, documents):
+        """Retourne (notifications à insérer, nombre de doublons supprimés)"""
+        instant = datetime.datetime.now(datetime.timezone.utc)
+        vues, uniques = set(), []
+        for document in documents:
+            c = cle(document)
+            if c not in vues:
+                vues.add(c)
+                uniques.append(document)
+
+        suspectes = [cle(document) for document in uniques if self._suspecte(cle(document))]
+        doublons = self._actives(suspectes, instant) if suspectes else set()
+        a_reserver = [cle(document) for document in uniques if cle(document) not in doublons]
+        doublons |= self._reserver(a_reserver, instant)
+
+        retenues = [document for document in uniques if cle(document) not in doublons]
+        self._memoriser(cle(document) for document in retenues)
+        supprimees = len(documents) - len(retenues)
+        with self._verrou:
+            self.retenues += len(retenues)
+            self.supprimees += supprimees
+            self.suspectes += len(suspectes)
+            self.faux_positifs += len([c for c in suspectes if c not in doublons])
+        return retenues, supprimees
+
+    def liberer(self, documents):
+        """Rend les clés de notifications finalement non insérées"""
+        cles = {cle(document) for document in documents}
+        if cles:
+            CleCoalescence._get_collection().delete_many({'$or': [
+                {'utilisateur': utilisateur, 'vague_chaleur': vague, 'type': canal}
+                for utilisateur, vague, canal in cles
+            ]})
+
+    def metriques(self):
+        with self._verrou:
+            return {
+                'fenetre_s': self.fenetre,
+                'retenues': self.retenues,
+                'supprimees': self.supprimees,
+                'suspectes': self.suspectes,
+                'faux_positifs': self.faux_positifs,
+            }
+
+
+_coalesceur = None
+_verrou = threading.Lock()
+
+
+def coalesceur():
+    """Coalesceur du processus courant, recréé après un fork ; None sans fenêtre"""
+    global _coalesceur
+    fenetre = parametre('NOTIFICATIONS_FENETRE_COALESCENCE', 3600)
+    if not fenetre:
+        return None
+    with _verrou:
+        if _coalesceur is None or _coalesceur.pid != os.getpid():
+            _coalesceur = Coalesceur(
+                fenetre=fenetre,
+                capacite=parametre('NOTIFICATIONS_COALESCENCE_CAPACITE', 1000000),
+                taux=parametre('NOTIFICATIONS_COALESCENCE_FAUX_POSITIFS', 0.001),
+            )
+    return _coalesceur
+
+
+def coalescer(documents):
+    instance = coalesceur()
+    if instance is None or not documents:
+        return documents, 0
+    return instance.coalescer(documents)
+
+
+def liberer(documents):
+    instance = coalesceur()
+    if instance is not None:
+        instance.liberer(documents)
+
+
+def metriques():
+    instance = coalesceur()
+    return instance.metriques() if instance is not None else None
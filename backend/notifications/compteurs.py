@@ -0,0 +1,81 @@
+import collections
+import datetime
+from pymongo import UpdateOne, ReplaceOne
+from pymongo.errors import BulkWriteError
+from .models import Notification, CompteurNonLues
+
+
+def maintenant():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def non_lues_par_utilisateur(documents):
+    """Nombre de notifications non lues par utilisateur dans des documents bruts"""
+    return collections.Counter(
+        document['utilisateur'] for document in documents if not document.get('lue', False)
+    )
+
+
+def incrementer(nombres):
+    """Ajoute {utilisateur_id: nombre} aux compteurs, créés au besoin, en une écriture groupée"""
+    operations = [
+        UpdateOne(
+            {'utilisateur': utilisateur},
+            {'$inc': {'non_lues': nombre}, '$set': {'updated_at': maintenant()}},
+            upsert=True
+        )
+        for utilisateur, nombre in nombres.items() if nombre
+    ]
+    if not operations:
+        return
+    try:
+        CompteurNonLues._get_collection().bulk_write(operations, ordered=False)
+    except BulkWriteError as erreur:
+        # Deux upserts simultanés du même compteur : le perdant est rejoué,
+        # le document existe désormais
+        rejouees = [operations[e['index']] for e in erreur.details['writeErrors'] if e['code'] == 11000]
+        if len(rejouees) < len(erreur.details['writeErrors']):
+            raise
+        CompteurNonLues._get_collection().bulk_write(rejouees, ordered=False)
+
+
+def decrementer(utilisateur, nombre):
+    """Retire `nombre` lectures du compteur, sans descendre sous zéro"""
+    if not nombre:
+        return
+    CompteurNonLues._get_collection().update_one({'utilisateur': utilisateur}, [{'$set': {
+        'non_lues': {'$max': [0, {'$subtract': [{'$ifNull': ['$non_lues', 0]}, nombre]}]},
+        'updated_at': maintenant(),
+    }}])
+
+
+def lire(utilisateur):
+    compteur = CompteurNonLues._get_collection().find_one({'utilisateur': utilisateur}, {'non_lues': 1})
+    return compteur['non_lues'] if compteur else 0
+
+
+def recalculer():
+    """
+    Reconstruit tous les compteurs depuis les notifications (index
+    (utilisateur, lue, ...)) ; corrige une éventuelle dérive. Retourne le
+    nombre d'utilisateurs ayant des notifications non lues.
+    """
+    debut = maintenant()
+    operations = [
+        ReplaceOne(
+            {'utilisateur': resultat['_id']},
+            {'utilisateur': resultat['_id'], 'non_lues': resultat['non_lues'], 'updated_at': debut},
+            upsert=True
+        )
+        for resultat in Notification._get_collection().aggregate([
+            {'$match': {'lue': False}},
+            {'$group': {'_id': '$utilisateur', 'non_lues': {'$sum': 1}}},
+        ])
+    ]
+    if operations:
+        CompteurNonLues._get_collection().bulk_write(operations, ordered=False)
+    # Utilisateurs sans notification non lue
+    CompteurNonLues._get_collection().update_many(
+        {'updated_at': {'$lt': debut}}, {'$set': {'non_lues': 0, 'updated_at': debut}}
+    )
+    return len(operations)
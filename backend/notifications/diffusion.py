@@ -0,0 +1,155 @@
+import datetime
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from pymongo.errors import BulkWriteError
+from utils.enums import TypeNotification, StatutDiffusion, StatutEnvoi
+from utils import versions
+from utils.prefetch import id_reference
+from zones_geographiques.models import ZoneGeographique, HabitantZone
+from .models import Notification, DiffusionVague
+from .livraison import livrer_documents
+from . import compteurs
+from .coalescence import coalescer, liberer
+from .flux import publier_documents
+
+logger = logging.getLogger(__name__)
+
+_executeur = None
+_verrou = threading.Lock()
+
+
+def executeur():
+    """Pool de threads de diffusion, créé à la première utilisation dans chaque processus"""
+    global _executeur
+    with _verrou:
+        if _executeur is None:
+            _executeur = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'DIFFUSION_WORKERS', 2),
+                thread_name_prefix='diffusion'
+            )
+    return _executeur
+
+
+def libelle_alerte(vague, zone):
+    libelle = f"Alerte vague de chaleur : {vague.temperature_max}°C"
+    if zone is not None:
+        libelle += f" à {zone.ville}"
+    return libelle[:200]
+
+
+def lancer_diffusion(vague):
+    """Crée la tâche de diffusion d'une nouvelle vague et la confie au pool, sans attendre"""
+    diffusion = DiffusionVague(vague_chaleur=vague).save()
+    executeur().submit(executer_diffusion, diffusion.id)
+    return diffusion
+
+
+def inserer_notifications(documents):
+    """
+    insert_many non ordonné : un document en échec n'interrompt pas le lot.
+    Retourne les documents effectivement insérés.
+    """
+    if not documents:
+        return []
+    try:
+        Notification._get_collection().insert_many(documents, ordered=False)
+        return documents
+    except BulkWriteError as erreur:
+        rejetes = {e['index'] for e in erreur.details['writeErrors']}
+        logger.warning("%d notification(s) rejetée(s) à l'insertion", len(rejetes))
+        liberer([documents[index] for index in rejetes])
+        return [document for index, document in enumerate(documents) if index not in rejetes]
+    finally:
+        versions.toucher(Notification)
+
+
+def executer_diffusion(diffusion_id):
+    """
+    Parcourt les habitants de la zone de la vague par lots (curseur sur l'index
+    (zone, utilisateur)) et insère une notification par habitant et par canal.
+    L'avancement est enregistré après chaque lot, la tâche peut donc reprendre
+    après une interruption.
+    """
+    diffusion = DiffusionVague.objects(id=diffusion_id).first()
+    if diffusion is None:
+        return
+    try:
+        vague = diffusion.vague_chaleur
+        zone_id = id_reference(vague._data.get('zone_geographique'))
+        zone = ZoneGeographique.objects(id=zone_id).only('ville').first() if zone_id else None
+
+        DiffusionVague.objects(id=diffusion.id).update_one(
+            set__statut=StatutDiffusion.EN_COURS.name,
+            set__total_habitants=HabitantZone.objects(zone=zone_id).count() if zone else 0,
+        )
+        if zone is not None:
+            diffuser_par_lots(diffusion, vague, zone)
+
+        DiffusionVague.objects(id=diffusion.id).update_one(
+            set__statut=StatutDiffusion.TERMINEE.name,
+            set__date_fin=datetime.datetime.now(datetime.timezone.utc),
+        )
+    except Exception as erreur:
+        logger.exception("Échec de la diffusion %s", diffusion_id)
+        DiffusionVague.objects(id=diffusion.id).update_one(
+            set__statut=StatutDiffusion.ECHEC.name,
+            set__erreur=str(erreur)[:1000],
+            set__date_fin=datetime.datetime.now(datetime.timezone.utc),
+        )
+
+
+def diffuser_par_lots(diffusion, vague, zone):
+    taille_lot = getattr(settings, 'DIFFUSION_TAILLE_LOT', 1000)
+    canaux = [canal.name for canal in TypeNotification]
+    libelle = libelle_alerte(vague, zone)
+    appartenances = HabitantZone._get_collection()
+    dernier = diffusion.dernier_habitant
+
+    while True:
+        filtre = {'zone': zone.id}
+        if dernier is not None:
+            filtre['utilisateur'] = {'$gt': dernier}
+        habitants = [
+            appartenance['utilisateur']
+            for appartenance in appartenances.find(filtre, {'_id': 0, 'utilisateur': 1})
+            .sort([('zone', 1), ('utilisateur', 1)])
+            .limit(taille_lot)
+        ]
+        if not habitants:
+            break
+
+        maintenant = datetime.datetime.now(datetime.timezone.utc)
+        documents = [
+            {
+                'libelle': libelle,
+                'type': canal,
+                'date_envoi': maintenant,
+                'lue': False,
+                'statut_envoi': StatutEnvoi.EN_ATTENTE.name,
+                'tentatives': 0,
+                'utilisateur': utilisateur_id,
+                'vague_chaleur': vague.id,
+                'created_at': maintenant,
+                'updated_at': maintenant,
+            }
+            for utilisateur_id in habitants
+            for canal in canaux
+        ]
+        documents, supprimees = coalescer(documents)
+        creees = inserer_notifications(documents)
+        compteurs.incrementer(compteurs.non_lues_par_utilisateur(creees))
+        publier_documents(creees, vague)
+        # Bloque tant que les files de livraison sont pleines : la diffusion
+        # avance au rythme des passerelles sans saturer la mémoire
+        livrer_documents(creees)
+
+        dernier = habitants[-1]
+        DiffusionVague.objects(id=diffusion.id).update_one(
+            inc__habitants_traites=len(habitants),
+            inc__notifications_creees=len(creees),
+            inc__notifications_supprimees=supprimees,
+            set__dernier_habitant=dernier,
+            set__updated_at=maintenant,
+        )
@@ -0,0 +1,364 @@
+import asyncio
+import collections
+import datetime
+import hashlib
+import itertools
+import logging
+import os
+import secrets
+import threading
+from dataclasses import dataclass
+from bson import ObjectId
+from django.conf import settings
+from django.utils.module_loading import import_string
+from pymongo import CursorType, ReturnDocument
+from authentification.models import User
+from utils.asynchrone import collection
+from utils.rendu import encoder
+from .models import EvenementFlux, SequenceFlux, TicketFlux
+from .representations import representation_notification, CHAMPS_UTILISATEUR
+
+logger = logging.getLogger(__name__)
+
+TYPE_NOTIFICATION = 'notification'
+TYPE_RESYNCHRONISATION = 'resynchroniser'
+
+
+def parametre(nom, defaut):
+    return getattr(settings, nom, defaut)
+
+
+@dataclass
+class Evenement:
+    """
+    Événement destiné aux connexions d'un utilisateur ; `id`, numéro croissant
+    attribué par le backend à la publication, sert de Last-Event-ID
+    """
+    id: int
+    utilisateur: ObjectId
+    type: str
+    donnees: str
+
+
+class Backend:
+    """
+    Transport des événements entre processus. `publier` numérote les
+    événements et est appelée depuis n'importe quel thread, `demarrer` dans
+    la boucle d'une nouvelle connexion ; `depuis` retourne les événements
+    d'un utilisateur postérieurs à un numéro, ou None s'ils ne sont plus tous
+    disponibles.
+    """
+    def __init__(self, courtier):
+        self.courtier = courtier
+
+    def publier(self, evenements):
+        raise NotImplementedError
+
+    def demarrer(self, boucle):
+        pass
+
+    async def depuis(self, utilisateur, dernier_id):
+        raise NotImplementedError
+
+
+def rattrapage(evenements):
+    """Au-delà de NOTIFICATIONS_FLUX_RATTRAPAGE_MAX événements, le client se resynchronise"""
+    if len(evenements) > parametre('NOTIFICATIONS_FLUX_RATTRAPAGE_MAX', 1000):
+        return None
+    return evenements
+
+
+class BackendMemoire(Backend):
+    """Événements du seul processus courant, historique borné en mémoire : un seul worker"""
+    def __init__(self, courtier):
+        super().__init__(courtier)
+        self.historique = collections.deque(maxlen=parametre('NOTIFICATIONS_FLUX_HISTORIQUE', 10000))
+        self._sequence = itertools.count(1)
+        self._verrou = threading.Lock()
+
+    def publier(self, evenements):
+        with self._verrou:
+            for evenement in evenements:
+                evenement.id = next(self._sequence)
+            self.historique.extend(evenements)
+        for evenement in evenements:
+            self.courtier.distribuer(evenement)
+
+    async def depuis(self, utilisateur, dernier_id):
+        with self._verrou:
+            historique = list(self.historique)
+        if not historique or historique[0].id > dernier_id:
+            return None
+        return rattrapage([
+            evenement for evenement in historique
+            if evenement.id > dernier_id and evenement.utilisateur == utilisateur
+        ])
+
+
+NOM_SEQUENCE = 'flux_notifications'
+
+
+class BackendMongo(Backend):
+    """
+    Événements partagés par tous les processus via la collection plafonnée
+    flux_notifications : chaque worker la suit avec un curseur tailable et
+    relaie à ses connexions les événements de leurs utilisateurs. Les
+    événements sont numérotés par la séquence SequenceFlux ($inc), commune
+    aux workers.
+    """
+    def __init__(self, courtier):
+        super().__init__(courtier)
+        self._boucle = None
+        self._suivi = None
+        self._verrou = threading.Lock()
+
+    def numeroter(self, evenements):
+        """Réserve un bloc de numéros consécutifs en une seule écriture"""
+        fin = SequenceFlux._get_collection().find_one_and_update(
+            {'_id': NOM_SEQUENCE}, {'$inc': {'valeur': len(evenements)}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )['valeur']
+        for numero, evenement in enumerate(evenements, start=fin - len(evenements) + 1):
+            evenement.id = numero
+
+    def publier(self, evenements):
+        self.numeroter(evenements)
+        EvenementFlux._get_collection().insert_many([
+            {'sequence': e.id, 'utilisateur': e.utilisateur, 'type': e.type, 'donnees': e.donnees}
+            for e in evenements
+        ], ordered=False)
+
+    def demarrer(self, boucle):
+        with self._verrou:
+            if self._boucle is boucle and not boucle.is_closed():
+                return
+            self._boucle = boucle
+            self._suivi = boucle.create_task(self._suivre())
+
+    async def _suivre(self):
+        # Crée la collection plafonnée si elle n'existe pas encore
+        await asyncio.to_thread(EvenementFlux._get_collection)
+        sequence = await collection(SequenceFlux).find_one({'_id': NOM_SEQUENCE})
+        # Seuls les événements publiés après le démarrage du suivi sont relayés
+        origine = dernier = sequence['valeur'] if sequence else 0
+        # Un numéro réservé par un autre worker peut être inséré après un numéro
+        # supérieur : à la reprise, les MARGE derniers numéros sont relus et ceux
+        # déjà relayés écartés
+        marge = parametre('NOTIFICATIONS_FLUX_MARGE_REPRISE', 1000)
+        relayes = set()
+        while True:
+            try:
+                debut = max(origine, dernier - marge)
+                relayes = {numero for numero in relayes if numero > debut}
+                curseur = collection(EvenementFlux).find(
+                    {'sequence': {'$gt': debut}}, cursor_type=CursorType.TAILABLE_AWAIT
+                )
+                async for document in curseur:
+                    numero = document['sequence']
+                    if numero in relayes:
+                        continue
+                    relayes.add(numero)
+                    dernier = max(dernier, numero)
+                    if len(relayes) > 2 * marge:
+                        relayes = {n for n in relayes if n > dernier - marge}
+                    self.courtier.distribuer(Evenement(
+                        numero, document['utilisateur'], document['type'], document['donnees']
+                    ))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Suivi du flux des notifications interrompu")
+            # Un curseur tailable se ferme sur une collection vide ou après une erreur
+            await asyncio.sleep(parametre('NOTIFICATIONS_FLUX_ATTENTE', 1.0))
+
+    async def depuis(self, utilisateur, dernier_id):
+        evenements = collection(EvenementFlux)
+        plus_ancien = await evenements.find_one({}, {'sequence': 1}, sort=[('$natural', 1)])
+        if plus_ancien is None or plus_ancien.get('sequence', 0) > dernier_id:
+            return None
+        documents = await evenements.find(
+            {'utilisateur': utilisateur, 'sequence': {'$gt': dernier_id}}
+        ).sort([('sequence', 1)]).limit(parametre('NOTIFICATIONS_FLUX_RATTRAPAGE_MAX', 1000) + 1).to_list(None)
+        return rattrapage([
+            Evenement(document['sequence'], document['utilisateur'], document['type'], document['donnees'])
+            for document in documents
+        ])
+
+
+def deposer(file, evenement):
+    try:
+        file.put_nowait(evenement)
+    except asyncio.QueueFull:
+        # Connexion trop lente : elle est fermée et reprendra depuis son Last-Event-ID
+        while not file.empty():
+            file.get_nowait()
+        file.put_nowait(None)
+
+
+class Courtier:
+    """
+    Abonnements aux événements des connexions du processus. Une connexion
+    reçoit une file bornée ; le backend y dépose les événements de son
+    utilisateur depuis n'importe quel thread.
+    """
+    def __init__(self):
+        self.pid = os.getpid()
+        self.abonnes = collections.defaultdict(set)
+        self._verrou = threading.Lock()
+        self.backend = import_string(
+            parametre('NOTIFICATIONS_FLUX_BACKEND', 'notifications.flux.BackendMemoire')
+        )(self)
+
+    def abonner(self, utilisateur):
+        boucle = asyncio.get_running_loop()
+        file = asyncio.Queue(maxsize=parametre('NOTIFICATIONS_FLUX_FILE_MAX', 100))
+        with self._verrou:
+            self.abonnes[utilisateur].add((boucle, file))
+        self.backend.demarrer(boucle)
+        return file
+
+    def desabonner(self, utilisateur, file):
+        with self._verrou:
+            # Sans get_running_loop : le générateur peut être finalisé hors de sa boucle
+            abonnes = {abonne for abonne in self.abonnes.get(utilisateur, ()) if abonne[1] is not file}
+            if abonnes:
+                self.abonnes[utilisateur] = abonnes
+            else:
+                self.abonnes.pop(utilisateur, None)
+
+    def connexions(self):
+        with self._verrou:
+            return sum(len(abonnes) for abonnes in self.abonnes.values())
+
+    def distribuer(self, evenement):
+        with self._verrou:
+            abonnes = list(self.abonnes.get(evenement.utilisateur, ()))
+        for boucle, file in abonnes:
+            try:
+                boucle.call_soon_threadsafe(deposer, file, evenement)
+            except RuntimeError:
+                # Boucle fermée : la connexion n'existe plus
+                pass
+
+    def publier(self, evenements):
+        if evenements:
+            self.backend.publier(evenements)
+
+
+_courtier = None
+_verrou = threading.Lock()
+
+
+def courtier():
+    """Courtier du processus courant, recréé après un fork"""
+    global _courtier
+    with _verrou:
+        if _courtier is None or _courtier.pid != os.getpid():
+            _courtier = Courtier()
+    return _courtier
+
+
+def publier_notifications(notifications):
+    """
+    Pousse des notifications aux connexions de leurs destinataires :
+    [(id de l'utilisateur, représentation de NotificationSerializer)].
+    Un échec du flux ne fait jamais échouer la création des notifications.
+    """
+    if not parametre('NOTIFICATIONS_FLUX_ACTIF', False) or not notifications:
+        return
+    try:
+        courtier().publier([
+            # Numérotés par le backend à la publication
+            Evenement(None, utilisateur, TYPE_NOTIFICATION, encoder(donnees).decode())
+            for utilisateur, donnees in notifications
+        ])
+    except Exception:
+        logger.exception("Publication de %d notification(s) dans le flux impossible", len(notifications))
+
+
+def publier_documents(documents, vague):
+    """Publie des notifications brutes d'une même vague : une requête $in pour les destinataires"""
+    if not parametre('NOTIFICATIONS_FLUX_ACTIF', False) or not documents:
+        return
+    utilisateurs = {
+        utilisateur['_id']: utilisateur
+        for utilisateur in User.objects(id__in=list({document['utilisateur'] for document in documents}))
+        .only(*CHAMPS_UTILISATEUR).as_pymongo()
+    }
+    vagues = {vague.id: vague.to_mongo()}
+    publier_notifications([
+        (document['utilisateur'], representation_notification(document, utilisateurs, vagues))
+        for document in documents
+    ])
+
+
+def empreinte_ticket(ticket):
+    return hashlib.sha256(ticket.encode()).hexdigest()
+
+
+def creer_ticket(utilisateur):
+    """Ticket d'ouverture du flux de `utilisateur`, valable NOTIFICATIONS_FLUX_TICKET_DUREE secondes"""
+    duree = parametre('NOTIFICATIONS_FLUX_TICKET_DUREE', 30)
+    ticket = secrets.token_urlsafe(32)
+    TicketFlux(
+        id=empreinte_ticket(ticket),
+        utilisateur=utilisateur,
+        expire_le=datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=duree),
+    ).save()
+    return ticket, duree
+
+
+async def consommer_ticket(ticket):
+    """Utilisateur d'un ticket valide, None sinon ; le ticket est supprimé à sa première présentation"""
+    document = await collection(TicketFlux).find_one_and_delete({
+        '_id': empreinte_ticket(ticket),
+        'expire_le': {'$gt': datetime.datetime.now(datetime.timezone.utc)},
+    })
+    return document['utilisateur'] if document else None
+
+
+def evenement_sse(type_evenement, donnees, identifiant=None):
+    lignes = [f"id: {identifiant}"] if identifiant is not None else []
+    lignes += [f"event: {type_evenement}", f"data: {donnees}"]
+    return "\n".join(lignes) + "\n\n"
+
+
+async def flux_sse(utilisateur, dernier_id=None):
+    """
+    Flux text/event-stream des notifications d'un utilisateur. Avec un
+    Last-Event-ID, les événements manqués sont rejoués avant le direct ;
+    s'ils ne sont plus disponibles, un événement `resynchroniser` invite le
+    client à relire non_lues.
+    """
+    abonnements = courtier()
+    # Abonnement avant le rattrapage : aucun événement ne tombe entre les deux
+    file = abonnements.abonner(utilisateur)
+    try:
+        yield f"retry: {parametre('NOTIFICATIONS_FLUX_RECONNEXION_MS', 3000)}\n\n"
+
+        rejoues = set()
+        if dernier_id:
+            try:
+                evenements = await abonnements.backend.depuis(utilisateur, int(dernier_id))
+            except ValueError:
+                evenements = None
+            if evenements is None:
+                yield evenement_sse(TYPE_RESYNCHRONISATION, "{}")
+            else:
+                for evenement in evenements:
+                    rejoues.add(evenement.id)
+                    yield evenement_sse(evenement.type, evenement.donnees, evenement.id)
+
+        while True:
+            try:
+                evenement = await asyncio.wait_for(file.get(), parametre('NOTIFICATIONS_FLUX_PING', 15))
+            except asyncio.TimeoutError:
+                # Commentaire SSE : garde la connexion ouverte à travers les proxys
+                yield ": ping\n\n"
+                continue
+            if evenement is None:
+                return
+            if evenement.id not in rejoues:
+                yield evenement_sse(evenement.type, evenement.donnees, evenement.id)
+    finally:
+        abonnements.desabonner(utilisateur, file)
@@ -0,0 +1,52 @@
+from utils.indexes import declarer
+from .archivage import index_retention
+from .models import Notification, NotificationArchivee, DiffusionVague, CompteurNonLues, CleCoalescence, EvenementFlux, TicketFlux
+
+declarer(
+    Notification,
+    # Clés de pagination (champ de tri, _id) des listes et filtres par utilisateur
+    ['date_envoi', 'id'],
+    ['utilisateur', 'date_envoi', 'id'],
+    ['utilisateur', 'lue', 'date_envoi', 'id'],
+    # Reprise des envois en attente
+    ['statut_envoi', 'id'],
+    # Sélection des notifications à archiver, et TTL de secours si la rétention est active
+    index_retention(),
+)
+
+declarer(
+    NotificationArchivee,
+    # Historique archivé d'un utilisateur (par_utilisateur?archives=1)
+    ['utilisateur', 'date_envoi', 'id'],
+)
+
+declarer(
+    DiffusionVague,
+    # Clé de pagination du filtre par vague
+    ['vague_chaleur', 'id'],
+    # Reprise des diffusions interrompues
+    'statut',
+)
+
+# Index unique de l'utilisateur, ajouté automatiquement
+declarer(CompteurNonLues)
+
+declarer(
+    CleCoalescence,
+    # Réservation d'une clé par upsert : une seule réservation par clé
+    {'fields': ['utilisateur', 'vague_chaleur', 'type'], 'unique': True},
+    # Purge des réservations expirées
+    {'fields': ['expire_le'], 'expireAfterSeconds': 0},
+)
+
+declarer(
+    EvenementFlux,
+    # Rattrapage d'un utilisateur depuis son dernier événement reçu
+    ['utilisateur', 'sequence'],
+)
+
+declarer(
+    TicketFlux,
+    # Purge des tickets expirés non utilisés
+    {'fields': ['expire_le'], 'expireAfterSeconds': 0},
+)
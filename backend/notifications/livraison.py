@@ -0,0 +1,361 @@
+import asyncio
+import datetime
+import logging
+import os
+import random
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from pymongo import UpdateOne
+from authentification.models import User
+from utils.enums import TypeNotification, StatutEnvoi
+from utils import versions
+from utils.prefetch import id_reference
+from .models import Notification
+from .passerelles import Message, ErreurPasserelle
+
+logger = logging.getLogger(__name__)
+
+CONFIGURATION_PAR_DEFAUT = {
+    'CLASSE': None,
+    'OPTIONS': {},
+    'DEBIT': 50,
+    'RAFALE': 100,
+    'TAILLE_LOT': 100,
+    'CONCURRENCE': 2,
+}
+
+
+def parametre(nom, defaut):
+    return getattr(settings, nom, defaut)
+
+
+def configurations():
+    """{canal: configuration complète} de NOTIFICATIONS_PASSERELLES"""
+    passerelles = parametre('NOTIFICATIONS_PASSERELLES', {})
+    return {
+        canal.name: {**CONFIGURATION_PAR_DEFAUT, **passerelles.get(canal.name, {})}
+        for canal in TypeNotification
+    }
+
+
+def verifier_passerelles():
+    """
+    Refuse une livraison active sans passerelle configurée pour chaque canal :
+    aucune passerelle factice n'est choisie implicitement. Appelée au
+    démarrage du serveur (AarTangaay.asgi), des commandes de livraison et
+    du pipeline.
+    """
+    if not parametre('LIVRAISON_ACTIVE', False):
+        return
+    manquantes = sorted(canal for canal, configuration in configurations().items() if not configuration['CLASSE'])
+    if manquantes:
+        raise ImproperlyConfigured(
+            f"Passerelle de livraison non configurée pour {', '.join(manquantes)} : renseigner "
+            f"NOTIFICATIONS_PASSERELLES (PASSERELLE_SMS, PASSERELLE_PUSH, PASSERELLE_EMAIL) "
+            f"ou désactiver la livraison (LIVRAISON_ACTIVE=0)"
+        )
+
+
+class SeauJetons:
+    """Seau à jetons : débit moyen de `debit` messages/s, rafales jusqu'à `capacite`"""
+    def __init__(self, debit, capacite):
+        self.debit = float(debit)
+        self.capacite = float(capacite)
+        self.jetons = float(capacite)
+        self.horodatage = time.monotonic()
+
+    def _remplir(self):
+        instant = time.monotonic()
+        self.jetons = min(self.capacite, self.jetons + (instant - self.horodatage) * self.debit)
+        self.horodatage = instant
+
+    async def acquerir(self, nombre):
+        # Utilisé depuis une seule boucle asyncio : pas de verrou nécessaire
+        while True:
+            self._remplir()
+            if self.jetons >= nombre:
+                self.jetons -= nombre
+                return
+            await asyncio.sleep((nombre - self.jetons) / self.debit)
+
+
+def destinataire(utilisateur, canal):
+    if canal == TypeNotification.SMS.name:
+        return utilisateur.get('phone_number')
+    if canal == TypeNotification.EMAIL.name:
+        return utilisateur.get('email')
+    return utilisateur.get('user_id')
+
+
+def construire_messages(documents):
+    """
+    (messages à livrer, échecs) pour des notifications brutes, une requête $in
+    pour les destinataires. Une notification sans utilisateur ou sans adresse
+    pour son canal ne sera jamais livrable : elle est en échec définitif.
+    """
+    ids = {document['utilisateur'] for document in documents}
+    utilisateurs = {
+        utilisateur['_id']: utilisateur
+        for utilisateur in User.objects(id__in=list(ids))
+        .only('phone_number', 'email', 'user_id').as_pymongo()
+    }
+    messages, echecs = [], []
+    for document in documents:
+        utilisateur = utilisateurs.get(document['utilisateur'])
+        adresse = destinataire(utilisateur, document['type']) if utilisateur else None
+        message = Message(
+            notification_id=document['_id'],
+            canal=document['type'],
+            destinataire=adresse,
+            contenu=document['libelle'],
+            tentatives=document.get('tentatives', 0),
+        )
+        if utilisateur is None:
+            echecs.append((message, ErreurPasserelle("Utilisateur introuvable", definitive=True)))
+        elif not adresse:
+            echecs.append((message, ErreurPasserelle(f"Aucune adresse pour le canal {document['type']}", definitive=True)))
+        else:
+            messages.append(message)
+    return messages, echecs
+
+
+def enregistrer_statuts(envoyes, echecs, relances):
+    """Reporte le résultat d'un lot sur les notifications en une seule écriture groupée"""
+    maintenant = datetime.datetime.now(datetime.timezone.utc)
+    operations = [
+        UpdateOne({'_id': message.notification_id}, {'$set': {
+            'statut_envoi': StatutEnvoi.ENVOYEE.name,
+            'date_livraison': maintenant,
+            'tentatives': message.tentatives,
+            'updated_at': maintenant,
+        }})
+        for message in envoyes
+    ]
+    operations += [
+        UpdateOne({'_id': message.notification_id}, {'$set': {
+            'statut_envoi': StatutEnvoi.ECHEC.name,
+            'erreur_envoi': str(erreur)[:500],
+            'tentatives': message.tentatives,
+            'updated_at': maintenant,
+        }})
+        for message, erreur in echecs
+    ]
+    operations += [
+        UpdateOne({'_id': message.notification_id}, {'$set': {
+            'erreur_envoi': str(erreur)[:500],
+            'tentatives': message.tentatives,
+            'updated_at': maintenant,
+        }})
+        for message, erreur in relances
+    ]
+    if operations:
+        Notification._get_collection().bulk_write(operations, ordered=False)
+        versions.toucher(Notification)
+
+
+class Livreur:
+    """
+    Pipeline de livraison d'un processus : une boucle asyncio dans un thread
+    dédié, une file bornée par canal et plusieurs travailleurs par canal qui
+    regroupent les messages en lots, respectent le débit du fournisseur et
+    relancent les échecs temporaires avec un délai exponentiel.
+    """
+    def __init__(self):
+        verifier_passerelles()
+        self.pid = os.getpid()
+        self.boucle = asyncio.new_event_loop()
+        self.files = {}
+        self.passerelles = {}
+        self._travailleurs = []
+        self._relances = set()
+        self._pret = threading.Event()
+        self._thread = threading.Thread(target=self._executer, name='livraison', daemon=True)
+        self._thread.start()
+        self._pret.wait()
+
+    def _executer(self):
+        asyncio.set_event_loop(self.boucle)
+        self.boucle.run_until_complete(self._demarrer())
+        self._pret.set()
+        self.boucle.run_forever()
+
+    async def _demarrer(self):
+        for canal, configuration in configurations().items():
+            passerelle = import_string(configuration['CLASSE'])(**configuration['OPTIONS'])
+            file = asyncio.Queue(maxsize=parametre('LIVRAISON_FILE_MAX', 10000))
+            seau = SeauJetons(configuration['DEBIT'], configuration['RAFALE'])
+            taille_lot = max(1, min(configuration['TAILLE_LOT'], configuration['RAFALE']))
+
+            self.passerelles[canal] = passerelle
+            self.files[canal] = file
+            for _ in range(configuration['CONCURRENCE']):
+                self._travailleurs.append(self.boucle.create_task(self._travailleur(file, passerelle, seau, taille_lot)))
+
+    def soumettre(self, messages, attendre=True):
+        """
+        Confie des messages au pipeline depuis n'importe quel thread. Avec
+        `attendre`, l'appelant est bloqué tant que les files sont pleines
+        (contre-pression sur la diffusion) ; sinon les messages qui ne trouvent
+        pas de place restent EN_ATTENTE et seront repris par relancer_envois.
+        """
+        if attendre:
+            asyncio.run_coroutine_threadsafe(self._enfiler(messages), self.boucle).result()
+        else:
+            self.boucle.call_soon_threadsafe(self._enfiler_sans_attendre, messages)
+
+    async def _enfiler(self, messages):
+        for message in messages:
+            await self.files[message.canal].put(message)
+
+    def _enfiler_sans_attendre(self, messages):
+        for message in messages:
+            try:
+                self.files[message.canal].put_nowait(message)
+            except asyncio.QueueFull:
+                logger.warning("File %s pleine, notification %s laissée en attente", message.canal, message.notification_id)
+
+    async def _lot(self, file, taille_lot):
+        """Attend un premier message puis complète le lot pendant au plus LIVRAISON_DELAI_LOT"""
+        lot = [await file.get()]
+        echeance = self.boucle.time() + parametre('LIVRAISON_DELAI_LOT', 0.05)
+        while len(lot) < taille_lot:
+            restant = echeance - self.boucle.time()
+            if restant <= 0:
+                break
+            try:
+                lot.append(await asyncio.wait_for(file.get(), restant))
+            except asyncio.TimeoutError:
+                break
+        return lot
+
+    async def _travailleur(self, file, passerelle, seau, taille_lot):
+        while True:
+            lot = await self._lot(file, taille_lot)
+            try:
+                await seau.acquerir(len(lot))
+                try:
+                    resultats = await passerelle.envoyer_lot(lot)
+                except Exception as erreur:
+                    resultats = [erreur] * len(lot)
+                await self._traiter_resultats(lot, resultats)
+            except Exception:
+                logger.exception("Erreur du travailleur de livraison")
+            finally:
+                for _ in lot:
+                    file.task_done()
+
+    async def _traiter_resultats(self, lot, resultats):
+        tentatives_max = parametre('LIVRAISON_TENTATIVES_MAX', 5)
+        envoyes, echecs, relances = [], [], []
+        for message, erreur in zip(lot, resultats):
+            message.tentatives += 1
+            if erreur is None:
+                envoyes.append(message)
+            elif getattr(erreur, 'definitive', False) or message.tentatives >= tentatives_max:
+                echecs.append((message, erreur))
+            else:
+                relances.append((message, erreur))
+
+        # L'écriture Mongo est bloquante : elle quitte la boucle
+        await self.boucle.run_in_executor(None, enregistrer_statuts, envoyes, echecs, relances)
+
+        for message, _ in relances:
+            tache = self.boucle.create_task(self._relancer(message))
+            self._relances.add(tache)
+            tache.add_done_callback(self._relances.discard)
+
+    async def _relancer(self, message):
+        delai = min(
+            parametre('LIVRAISON_BACKOFF_BASE', 1.0) * 2 ** (message.tentatives - 1),
+            parametre('LIVRAISON_BACKOFF_MAX', 60.0)
+        )
+        # Gigue pour étaler les relances d'un même lot
+        await asyncio.sleep(delai * random.uniform(0.5, 1.0))
+        await self.files[message.canal].put(message)
+
+    def fermer(self):
+        """
+        Attend que tous les messages soumis soient livrés ou en échec, relances
+        comprises, puis arrête les travailleurs, les passerelles et la boucle.
+        Le thread de livraison est un démon : un processus court (commande)
+        perdrait sinon les messages encore en file ou en attente de relance.
+        """
+        asyncio.run_coroutine_threadsafe(self._fermer(), self.boucle).result()
+        self.boucle.call_soon_threadsafe(self.boucle.stop)
+        self._thread.join()
+        self.boucle.close()
+
+    async def _vider(self):
+        # Une relance remet son message en file : on attend files et relances jusqu'à épuisement
+        while True:
+            for file in self.files.values():
+                await file.join()
+            if not self._relances:
+                return
+            await asyncio.wait(list(self._relances))
+
+    async def _fermer(self):
+        await self._vider()
+        for tache in self._travailleurs:
+            tache.cancel()
+        await asyncio.gather(*self._travailleurs, return_exceptions=True)
+        for passerelle in self.passerelles.values():
+            await passerelle.fermer()
+
+
+_livreur = None
+_verrou = threading.Lock()
+
+
+def livreur():
+    """Pipeline du processus courant, recréé après un fork"""
+    global _livreur
+    with _verrou:
+        if _livreur is None or _livreur.pid != os.getpid():
+            _livreur = Livreur()
+    return _livreur
+
+
+def fermer_livreur():
+    """Vide puis arrête le pipeline du processus courant s'il a été démarré"""
+    global _livreur
+    with _verrou:
+        instance, _livreur = _livreur, None
+    if instance is not None and instance.pid == os.getpid():
+        instance.fermer()
+
+
+def livrer_documents(documents, attendre=True):
+    """
+    Livre des notifications brutes (dictionnaires Mongo avec _id) ; celles qui
+    n'ont pas de destinataire passent en ECHEC dans une même écriture groupée.
+    Les notifications sont déjà enregistrées : sans passerelles configurées,
+    elles restent EN_ATTENTE (relancer_envois) au lieu de faire échouer
+    l'écriture qui les a créées.
+    """
+    if not parametre('LIVRAISON_ACTIVE', False) or not documents:
+        return
+    try:
+        pipeline = livreur()
+    except ImproperlyConfigured:
+        logger.exception("Livraison non configurée : %d notification(s) laissée(s) EN_ATTENTE", len(documents))
+        return
+    messages, echecs = construire_messages(documents)
+    if echecs:
+        enregistrer_statuts([], echecs, [])
+    if messages:
+        pipeline.soumettre(messages, attendre=attendre)
+
+
+def livrer(notification):
+    """Livre une notification créée depuis l'API sans bloquer la requête"""
+    livrer_documents([{
+        '_id': notification.id,
+        'type': notification.type,
+        'libelle': notification.libelle,
+        'utilisateur': id_reference(notification._data.get('utilisateur')),
+        'tentatives': notification.tentatives,
+    }], attendre=False)
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from notifications.archivage import archiver, ArchiveCollection, ArchiveFichiers
+
+
+class Command(BaseCommand):
+    help = ("Déplace les notifications lues depuis plus de NOTIFICATIONS_RETENTION_JOURS "
+            "jours vers la collection compressée notifications_archives (ou vers des "
+            "fichiers NDJSON gzip avec --dossier), puis les supprime de la collection active.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jours', type=int, default=None,
+                            help="Ancienneté de lecture minimale en jours (défaut : NOTIFICATIONS_RETENTION_JOURS)")
+        parser.add_argument('--taille-lot', type=int, default=None)
+        parser.add_argument('--dossier', default=None,
+                            help="Archive en fichiers .ndjson.gz dans ce dossier plutôt qu'en base")
+
+    def handle(self, *args, **options):
+        if options['jours'] is None and not getattr(settings, 'NOTIFICATIONS_RETENTION_JOURS', 90):
+            self.stdout.write(self.style.WARNING("Rétention désactivée (NOTIFICATIONS_RETENTION_JOURS=0)"))
+            return
+        destination = ArchiveFichiers(options['dossier']) if options['dossier'] else ArchiveCollection()
+        nombre = archiver(destination, jours=options['jours'], taille_lot=options['taille_lot'])
+        self.stdout.write(self.style.SUCCESS(f"{nombre} notification(s) archivée(s)"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from notifications.compteurs import recalculer
+
+
+class Command(BaseCommand):
+    help = ("Reconstruit les compteurs de notifications non lues de tous les "
+            "utilisateurs à partir des notifications.")
+
+    def handle(self, *args, **options):
+        nombre = recalculer()
+        self.stdout.write(self.style.SUCCESS(f"Compteurs recalculés : {nombre} utilisateur(s) avec des notifications non lues"))
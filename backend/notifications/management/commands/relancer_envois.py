@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from notifications.livraison import livrer_documents, fermer_livreur, verifier_passerelles
+from notifications.models import Notification
+from utils.enums import StatutEnvoi
+
+
+class Command(BaseCommand):
+    help = ("Soumet de nouveau au pipeline de livraison les notifications restées "
+            "EN_ATTENTE (après un redémarrage ou une file saturée) et attend la fin des envois.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--taille-lot', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        verifier_passerelles()
+        collection = Notification._get_collection()
+        filtre = {'statut_envoi': StatutEnvoi.EN_ATTENTE.name}
+        projection = {'type': 1, 'libelle': 1, 'utilisateur': 1, 'tentatives': 1}
+        dernier_id = None
+        nombre = 0
+
+        while True:
+            requete = dict(filtre)
+            if dernier_id is not None:
+                requete['_id'] = {'$gt': dernier_id}
+            lot = list(collection.find(requete, projection).sort('_id', 1).limit(options['taille_lot']))
+            if not lot:
+                break
+            livrer_documents(lot)
+            nombre += len(lot)
+            dernier_id = lot[-1]['_id']
+
+        # Le pipeline tourne dans un thread démon : la commande attend la fin des envois et des relances
+        fermer_livreur()
+        self.stdout.write(self.style.SUCCESS(f"{nombre} notification(s) traitée(s) par la livraison"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from notifications.diffusion import executer_diffusion
+from notifications.livraison import fermer_livreur, verifier_passerelles
+from notifications.models import DiffusionVague
+from utils.enums import StatutDiffusion
+
+
+class Command(BaseCommand):
+    help = ("Reprend les diffusions d'alertes interrompues (en attente ou en cours), "
+            "à partir du dernier habitant traité.")
+
+    def handle(self, *args, **options):
+        verifier_passerelles()
+        diffusions = DiffusionVague.objects(
+            statut__in=[StatutDiffusion.EN_ATTENTE.name, StatutDiffusion.EN_COURS.name]
+        ).only('id')
+        nombre = 0
+        for diffusion in diffusions:
+            self.stdout.write(f"Reprise de la diffusion {diffusion.id}")
+            executer_diffusion(diffusion.id)
+            nombre += 1
+        # Les notifications créées sont encore en file de livraison
+        fermer_livreur()
+        self.stdout.write(self.style.SUCCESS(f"{nombre} diffusion(s) reprise(s)"))
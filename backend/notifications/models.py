@@ -1,28 +1,167 @@
 import datetime
-from mongoengine import Document, StringField, DateTimeField, BooleanField, ReferenceField
+from django.conf import settings
+from mongoengine import Document, StringField, DateTimeField, BooleanField, ReferenceField, IntField, ObjectIdField
+from pymongo.errors import CollectionInvalid
 from authentification.models import User
 from vagues_chaleur.models import VagueChaleur
-from utils.enums import TypeNotification
+from utils.enums import TypeNotification, StatutDiffusion, StatutEnvoi
+from utils.horodatage import Horodate
 
-class Notification(Document):
+class BaseNotification(Horodate):
     libelle = StringField(required=True, max_length=200)
     type = StringField(choices=[t.name for t in TypeNotification], required=True)
     date_envoi = DateTimeField(required=True)
     lue = BooleanField(default=False)
+    # Renseignée au passage à lue : départ de la rétention (notifications.archivage)
+    date_lecture = DateTimeField()
+    
+    # Suivi de la livraison par la passerelle du canal (notifications.livraison)
+    statut_envoi = StringField(choices=[s.name for s in StatutEnvoi], default=StatutEnvoi.EN_ATTENTE.name)
+    tentatives = IntField(default=0)
+    date_livraison = DateTimeField()
+    erreur_envoi = StringField()
     
     # Relations
     # Un utilisateur reçoit des notifications (1 vers 0..*)
     utilisateur = ReferenceField(User, required=True)
     # Une notification provient d'une vague de chaleur (1 vers 0..*)
     vague_chaleur = ReferenceField(VagueChaleur, required=True)
-    
-    created_at = DateTimeField(default=datetime.datetime.now(datetime.timezone.utc))
-    updated_at = DateTimeField(default=datetime.datetime.now(datetime.timezone.utc))
 
     def __str__(self):
         return f"Notification {self.type} - {self.libelle}"
 
     meta = {
-        'collection': 'notifications'
+        'abstract': True,
+    }
+
+
+class Notification(BaseNotification):
+    meta = {
+        'collection': 'notifications',
+    }
+
+
+class NotificationArchivee(BaseNotification):
+    """Notification lue déplacée hors de la collection active par archiver_notifications"""
+    archived_at = DateTimeField()
+
+    meta = {
+        'collection': 'notifications_archives',
+    }
+
+    @classmethod
+    def _get_collection(cls):
+        # Collection compressée par le moteur de stockage, créée au premier accès
+        if getattr(cls, '_collection', None) is None:
+            db = cls._get_db()
+            nom = cls._get_collection_name()
+            if not db.list_collection_names(filter={'name': nom}):
+                compression = getattr(settings, 'NOTIFICATIONS_ARCHIVE_COMPRESSION', 'zstd')
+                try:
+                    db.create_collection(nom, storageEngine={
+                        'wiredTiger': {'configString': f'block_compressor={compression}'}
+                    })
+                except CollectionInvalid:
+                    pass
+        return super()._get_collection()
+
+
+class DiffusionVague(Document):
+    """Tâche de diffusion des alertes d'une vague de chaleur aux habitants de sa zone"""
+    vague_chaleur = ReferenceField(VagueChaleur, required=True)
+    statut = StringField(choices=[s.name for s in StatutDiffusion], default=StatutDiffusion.EN_ATTENTE.name)
+    total_habitants = IntField(default=0)
+    habitants_traites = IntField(default=0)
+    notifications_creees = IntField(default=0)
+    # Doublons écartés par la coalescence (notifications.coalescence)
+    notifications_supprimees = IntField(default=0)
+    # Dernier habitant traité : permet de reprendre une diffusion interrompue
+    dernier_habitant = ObjectIdField()
+    erreur = StringField()
+    
+    created_at = DateTimeField(default=lambda: datetime.datetime.now(datetime.timezone.utc))
+    updated_at = DateTimeField(default=lambda: datetime.datetime.now(datetime.timezone.utc))
+    date_fin = DateTimeField()
+
+    def __str__(self):
+        return f"Diffusion {self.statut} - {self.habitants_traites}/{self.total_habitants} habitants"
+
+    meta = {
+        'collection': 'diffusions',
     }
 
+
+class CompteurNonLues(Document):
+    """
+    Nombre de notifications non lues d'un utilisateur, maintenu par des
+    incréments atomiques à chaque création et lecture (notifications.compteurs)
+    """
+    utilisateur = ReferenceField(User, required=True, unique=True)
+    non_lues = IntField(default=0)
+    updated_at = DateTimeField()
+
+    def __str__(self):
+        return f"{self.non_lues} notification(s) non lue(s)"
+
+    meta = {
+        'collection': 'compteurs_non_lues',
+    }
+
+
+class CleCoalescence(Document):
+    """Notification émise pour (utilisateur, vague, canal) : les suivantes sont supprimées jusqu'à `expire_le`"""
+    utilisateur = ObjectIdField(required=True)
+    vague_chaleur = ObjectIdField(required=True)
+    type = StringField(required=True)
+    expire_le = DateTimeField(required=True)
+
+    meta = {
+        'collection': 'cles_coalescence',
+    }
+
+
+class EvenementFlux(Document):
+    """
+    Événement du flux temps réel (notifications.flux), écrit dans une collection
+    plafonnée que chaque worker ASGI suit pour le relayer à ses connexions
+    """
+    # Numéro d'ordre commun à tous les workers (SequenceFlux), Last-Event-ID du client
+    sequence = IntField(required=True)
+    utilisateur = ObjectIdField(required=True)
+    type = StringField(required=True)
+    # Représentation JSON déjà rendue, envoyée telle quelle aux clients
+    donnees = StringField(required=True)
+
+    meta = {
+        'collection': 'flux_notifications',
+        'max_size': getattr(settings, 'NOTIFICATIONS_FLUX_TAILLE', 64 * 1024 * 1024),
+    }
+
+
+class SequenceFlux(Document):
+    """
+    Dernier numéro attribué aux événements du flux, incrémenté par $inc : une
+    séquence croissante partagée par les workers, contrairement aux ObjectId
+    de processus différents dans une même seconde
+    """
+    id = StringField(primary_key=True)
+    valeur = IntField(default=0)
+
+    meta = {
+        'collection': 'sequences_flux',
+    }
+
+
+class TicketFlux(Document):
+    """
+    Ticket d'ouverture du flux SSE, délivré à un utilisateur authentifié : à
+    usage unique et de courte durée, il remplace le JWT dans l'URL d'EventSource.
+    Seule son empreinte est enregistrée.
+    """
+    id = StringField(primary_key=True)
+    utilisateur = ObjectIdField(required=True)
+    expire_le = DateTimeField(required=True)
+
+    meta = {
+        'collection': 'tickets_flux',
+    }
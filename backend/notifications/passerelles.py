@@ -0,0 +1,66 @@
+import asyncio
+import random
+from collections import deque
+from dataclasses import dataclass
+from bson import ObjectId
+
+
+@dataclass
+class Message:
+    """Message à livrer pour une notification sur un canal"""
+    notification_id: ObjectId
+    canal: str
+    destinataire: str
+    contenu: str
+    tentatives: int = 0
+
+
+class ErreurPasserelle(Exception):
+    """Erreur d'envoi signalée par une passerelle ; `definitive` empêche toute nouvelle tentative"""
+    def __init__(self, message, definitive=False):
+        super().__init__(message)
+        self.definitive = definitive
+
+
+class Passerelle:
+    """
+    Passerelle d'envoi d'un canal (SMS, push, email). Une implémentation
+    fournisseur surcharge `envoyer_lot`, qui retourne pour chaque message None
+    en cas de succès ou l'exception rencontrée.
+    """
+    def __init__(self, **options):
+        self.options = options
+
+    async def envoyer_lot(self, messages):
+        raise NotImplementedError
+
+    async def fermer(self):
+        pass
+
+
+class PasserelleLocale(Passerelle):
+    """
+    Passerelle factice pour les tests et le développement, à configurer
+    explicitement : rien n'est livré. Seuls les HISTORIQUE derniers messages
+    sont conservés en mémoire, `nombre_envoyes` les compte tous.
+    `TAUX_ECHEC` simule des erreurs temporaires.
+    """
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.envoyes = deque(maxlen=options.get('HISTORIQUE', 1000))
+        self.nombre_envoyes = 0
+        self.taux_echec = options.get('TAUX_ECHEC', 0.0)
+        self.latence = options.get('LATENCE', 0.0)
+
+    async def envoyer_lot(self, messages):
+        if self.latence:
+            await asyncio.sleep(self.latence)
+        resultats = []
+        for message in messages:
+            if self.taux_echec and random.random() < self.taux_echec:
+                resultats.append(ErreurPasserelle("Échec simulé"))
+            else:
+                self.envoyes.append(message)
+                self.nombre_envoyes += 1
+                resultats.append(None)
+        return resultats
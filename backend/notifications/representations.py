@@ -0,0 +1,25 @@
+from authentification.models import User
+from utils.brut import Mappeur, Lecture, Reference, COMPLETE
+from vagues_chaleur.models import VagueChaleur
+from .models import Notification
+
+CHAMPS_NOTIFICATION = ('libelle', 'type', 'date_envoi', 'lue', 'statut_envoi', 'date_livraison', 'created_at', 'updated_at')
+CHAMPS_UTILISATEUR = ('first_name', 'last_name', 'email')
+CHAMPS_VAGUE = ('temperature_max', 'date_debut', 'date_fin')
+
+
+class LectureNotifications(Lecture):
+    mappeur = Mappeur(Notification, CHAMPS_NOTIFICATION)
+    relations = {
+        'utilisateur': Reference(User, Mappeur(User, CHAMPS_UTILISATEUR, noms={'first_name': 'prenom', 'last_name': 'nom'})),
+        'vague_chaleur': Reference(VagueChaleur, Mappeur(VagueChaleur, CHAMPS_VAGUE)),
+    }
+
+
+lecture = LectureNotifications()
+
+
+def representation_notification(document, utilisateurs, vagues, selection=COMPLETE):
+    """Représentation de NotificationSerializer construite depuis un document brut"""
+    charges = {'utilisateur': utilisateurs, 'vague_chaleur': vagues}
+    return lecture.assembler([document], charges, selection)[0]
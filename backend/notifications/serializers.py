@@ -1,9 +1,15 @@
+import datetime
+from bson import ObjectId
 from rest_framework import serializers
 from .models import Notification
+from .livraison import livrer
+from .flux import publier_notifications
 from authentification.models import User
 from vagues_chaleur.models import VagueChaleur
+from utils.prefetch import PrefetchMixin, id_reference
+from .representations import LectureNotifications
 
-class NotificationSerializer(serializers.Serializer):
+class NotificationSerializer(PrefetchMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     libelle = serializers.CharField(max_length=200)
     type = serializers.CharField()
@@ -14,6 +20,14 @@ class NotificationSerializer(serializers.Serializer):
     created_at = serializers.DateTimeField(read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
     
+    # Listes : lecture des documents bruts, à l'identique de to_representation
+    lecture_brute = LectureNotifications()
+    
+    references_prechargees = {
+        'utilisateur': (User, ('first_name', 'last_name', 'email')),
+        'vague_chaleur': (VagueChaleur, ('temperature_max', 'date_debut', 'date_fin')),
+    }
+    
     def create(self, validated_data):
         utilisateur_id = validated_data.pop('utilisateur_id')
         vague_chaleur_id = validated_data.pop('vague_chaleur_id')
@@ -30,12 +44,17 @@ class NotificationSerializer(serializers.Serializer):
         notification.utilisateur = utilisateur
         notification.vague_chaleur = vague_chaleur
         notification.save()
+        livrer(notification)
+        publier_notifications([(utilisateur.id, self.to_representation(notification))])
         return notification
     
     def update(self, instance, validated_data):
         utilisateur_id = validated_data.pop('utilisateur_id', None)
         vague_chaleur_id = validated_data.pop('vague_chaleur_id', None)
         
+        if 'lue' in validated_data and validated_data['lue'] != instance.lue:
+            instance.date_lecture = datetime.datetime.now(datetime.timezone.utc) if validated_data['lue'] else None
+        
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         
@@ -63,27 +82,77 @@ class NotificationSerializer(serializers.Serializer):
             'type': instance.type,
             'date_envoi': instance.date_envoi,
             'lue': instance.lue,
+            'statut_envoi': instance.statut_envoi,
+            'date_livraison': instance.date_livraison,
             'created_at': instance.created_at,
             'updated_at': instance.updated_at
         }
         
         # Ajouter les informations de l'utilisateur
-        if instance.utilisateur:
+        utilisateur = self.reference(instance, 'utilisateur')
+        if utilisateur:
             data['utilisateur'] = {
-                'id': str(instance.utilisateur.id),
-                'prenom': instance.utilisateur.first_name,
-                'nom': instance.utilisateur.last_name,
-                'email': instance.utilisateur.email
+                'id': str(utilisateur.id),
+                'prenom': utilisateur.first_name,
+                'nom': utilisateur.last_name,
+                'email': utilisateur.email
             }
         
         # Ajouter les informations de la vague de chaleur
-        if instance.vague_chaleur:
+        vague_chaleur = self.reference(instance, 'vague_chaleur')
+        if vague_chaleur:
             data['vague_chaleur'] = {
-                'id': str(instance.vague_chaleur.id),
-                'temperature_max': instance.vague_chaleur.temperature_max,
-                'date_debut': instance.vague_chaleur.date_debut,
-                'date_fin': instance.vague_chaleur.date_fin
+                'id': str(vague_chaleur.id),
+                'temperature_max': vague_chaleur.temperature_max,
+                'date_debut': vague_chaleur.date_debut,
+                'date_fin': vague_chaleur.date_fin
             }
         
         return data
 
+
+class MarquerLuesSerializer(serializers.Serializer):
+    """Sélection des notifications d'un utilisateur à marquer comme lues : par ids ou par date"""
+    utilisateur_id = serializers.CharField()
+    ids = serializers.ListField(child=serializers.CharField(), required=False, allow_empty=False, max_length=1000)
+    avant = serializers.DateTimeField(required=False)
+    
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('avant' in attrs):
+            raise serializers.ValidationError("Indiquer soit ids, soit avant")
+        for identifiant in [attrs['utilisateur_id']] + attrs.get('ids', []):
+            if not ObjectId.is_valid(identifiant):
+                raise serializers.ValidationError(f"Identifiant invalide : {identifiant}")
+        return attrs
+
+
+class DiffusionSerializer(serializers.Serializer):
+    id = serializers.CharField(read_only=True)
+    statut = serializers.CharField(read_only=True)
+    total_habitants = serializers.IntegerField(read_only=True)
+    habitants_traites = serializers.IntegerField(read_only=True)
+    notifications_creees = serializers.IntegerField(read_only=True)
+    notifications_supprimees = serializers.IntegerField(read_only=True)
+    erreur = serializers.CharField(read_only=True)
+    created_at = serializers.DateTimeField(read_only=True)
+    updated_at = serializers.DateTimeField(read_only=True)
+    date_fin = serializers.DateTimeField(read_only=True)
+    
+    def to_representation(self, instance):
+        progression = 0.0
+        if instance.total_habitants:
+            progression = round(min(instance.habitants_traites / instance.total_habitants, 1.0) * 100, 1)
+        return {
+            'id': str(instance.id),
+            'vague_chaleur_id': str(id_reference(instance._data.get('vague_chaleur'))),
+            'statut': instance.statut,
+            'total_habitants': instance.total_habitants,
+            'habitants_traites': instance.habitants_traites,
+            'notifications_creees': instance.notifications_creees,
+            'notifications_supprimees': instance.notifications_supprimees,
+            'progression': progression,
+            'erreur': instance.erreur,
+            'created_at': instance.created_at,
+            'updated_at': instance.updated_at,
+            'date_fin': instance.date_fin
+        }
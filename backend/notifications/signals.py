@@ -0,0 +1,46 @@
+from mongoengine import signals
+from utils.prefetch import id_reference
+from .models import Notification
+from . import compteurs
+
+
+def etat(notification):
+    """(utilisateur, non lue) d'une notification, ce qui détermine sa part dans les compteurs"""
+    return id_reference(notification._data.get('utilisateur')), not notification.lue
+
+
+def memoriser_etat(sender, document, **kwargs):
+    """Avant une mise à jour, relit l'état enregistré si l'utilisateur ou la lecture change"""
+    if document.pk is None:
+        return
+    modifies = {champ.split('.')[0] for champ in document._get_changed_fields()}
+    if modifies.isdisjoint(('utilisateur', 'lue')):
+        return
+    precedent = Notification._get_collection().find_one({'_id': document.pk}, {'utilisateur': 1, 'lue': 1})
+    if precedent is not None:
+        document._etat_precedent = (precedent.get('utilisateur'), not precedent.get('lue', False))
+
+
+def appliquer_sauvegarde(sender, document, created=False, **kwargs):
+    utilisateur, non_lue = etat(document)
+    if created:
+        if non_lue:
+            compteurs.incrementer({utilisateur: 1})
+        return
+    precedent = document.__dict__.pop('_etat_precedent', None)
+    if precedent is not None and precedent != (utilisateur, non_lue):
+        if precedent[1]:
+            compteurs.decrementer(precedent[0], 1)
+        if non_lue:
+            compteurs.incrementer({utilisateur: 1})
+
+
+def appliquer_suppression(sender, document, **kwargs):
+    utilisateur, non_lue = etat(document)
+    if non_lue:
+        compteurs.decrementer(utilisateur, 1)
+
+
+signals.pre_save.connect(memoriser_etat, sender=Notification)
+signals.post_save.connect(appliquer_sauvegarde, sender=Notification)
+signals.post_delete.connect(appliquer_suppression, sender=Notification)
@@ -1,3 +1,370 @@
-from django.test import TestCase
+import datetime
+import io
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from asgiref.sync import async_to_sync
+from bson import ObjectId
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import override_settings
+from utils.essais import TestMongo, creer_utilisateur, creer_zone, creer_vague, creer_notification, maintenant
+from vagues_chaleur.models import VagueChaleur
+from zones_geographiques.models import HabitantZone
+from .coalescence import Coalesceur, cle
+from .diffusion import executer_diffusion
+from .flux import BackendMongo, Evenement, consommer_ticket
+from .livraison import livrer_documents, fermer_livreur, verifier_passerelles
+from .models import DiffusionVague, Notification, NotificationArchivee, CleCoalescence
+from .passerelles import Passerelle, ErreurPasserelle
 
-# Create your tests here.
+
+class RequetesListesTests(TestMongo):
+    """Les listes font un nombre de requêtes indépendant du nombre de lignes (références chargées par $in)"""
+
+    def setUp(self):
+        super().setUp()
+        self.utilisateurs = []
+
+    def ajouter(self, nombre):
+        for _ in range(nombre):
+            utilisateur = creer_utilisateur(len(self.utilisateurs))
+            self.utilisateurs.append(utilisateur)
+            vague = creer_vague(creer_zone(len(self.utilisateurs)))
+            creer_notification(utilisateur, vague)
+            creer_notification(self.utilisateurs[0], vague)
+
+    def urls(self):
+        utilisateur_id = self.utilisateurs[0].id
+        return [
+            '/api/notifications/',
+            f'/api/notifications/par_utilisateur/?utilisateur_id={utilisateur_id}',
+            f'/api/notifications/non_lues/?utilisateur_id={utilisateur_id}',
+        ]
+
+    def test_nombre_de_requetes_constant(self):
+        self.assertRequetesConstantes(self.ajouter, self.urls)
+
+    def test_lecture_brute_identique(self):
+        self.ajouter(3)
+        # Champs facultatifs absents en base, relation vers une vague supprimée
+        incomplete = creer_notification(self.utilisateurs[1], creer_vague())
+        Notification._get_collection().update_one(
+            {'_id': incomplete.id}, {'$unset': {'statut_envoi': '', 'lue': '', 'date_livraison': ''}}
+        )
+        orpheline = creer_notification(self.utilisateurs[2], creer_vague())
+        VagueChaleur._get_collection().delete_one({'_id': orpheline.vague_chaleur.id})
+        self.assertLecturesIdentiques(self.urls() + [
+            f'/api/notifications/{incomplete.id}/',
+            f'/api/notifications/par_utilisateur/?utilisateur_id={self.utilisateurs[1].id}',
+            f'/api/notifications/par_utilisateur/?utilisateur_id={self.utilisateurs[2].id}',
+        ])
+
+
+@override_settings(LIVRAISON_ACTIVE=False, DIFFUSION_TAILLE_LOT=2)
+class DiffusionTests(TestMongo):
+    """Diffusion d'une vague aux habitants de sa zone, par lots avec avancement enregistré"""
+
+    def setUp(self):
+        super().setUp()
+        self.zone = creer_zone()
+        self.habitants = sorted((creer_utilisateur(numero) for numero in range(5)), key=lambda u: u.id)
+        for habitant in self.habitants:
+            HabitantZone(zone=self.zone, utilisateur=habitant).save()
+        self.vague = creer_vague(self.zone)
+
+    def avancement(self, diffusion):
+        reponse = self.client.get(f'/api/diffusions/{diffusion.id}/')
+        self.assertEqual(reponse.status_code, 200)
+        return reponse.json()
+
+    def test_avancement_par_lot(self):
+        diffusion = DiffusionVague(vague_chaleur=self.vague).save()
+        traites = []
+
+        def livrer(documents):
+            traites.append(DiffusionVague.objects.get(id=diffusion.id).habitants_traites)
+
+        with mock.patch('notifications.diffusion.livrer_documents', side_effect=livrer):
+            executer_diffusion(diffusion.id)
+
+        # L'avancement est enregistré après chaque lot de DIFFUSION_TAILLE_LOT habitants
+        self.assertEqual(traites, [0, 2, 4])
+        avancement = self.avancement(diffusion)
+        self.assertEqual(avancement['statut'], 'TERMINEE')
+        self.assertEqual((avancement['total_habitants'], avancement['habitants_traites']), (5, 5))
+        self.assertEqual(avancement['notifications_creees'], 15)
+        self.assertEqual(avancement['progression'], 100.0)
+        self.assertIsNotNone(avancement['date_fin'])
+        self.assertEqual(Notification.objects.count(), 15)
+
+    def test_reprise_apres_interruption(self):
+        # Deux habitants traités avant l'interruption
+        diffusion = DiffusionVague(
+            vague_chaleur=self.vague, habitants_traites=2, dernier_habitant=self.habitants[1].id
+        ).save()
+        executer_diffusion(diffusion.id)
+
+        avancement = self.avancement(diffusion)
+        self.assertEqual((avancement['habitants_traites'], avancement['notifications_creees']), (5, 9))
+        self.assertEqual(
+            set(Notification.objects.distinct('utilisateur')),
+            set(self.habitants[2:])
+        )
+
+
+class PasserelleInstable(Passerelle):
+    """Échoue temporairement à la première tentative de chaque message"""
+    async def envoyer_lot(self, messages):
+        return [ErreurPasserelle("Indisponible") if message.tentatives == 0 else None for message in messages]
+
+
+def passerelles(classe):
+    return {canal: {'CLASSE': classe, 'DEBIT': 1000, 'RAFALE': 1000} for canal in ('SMS', 'NOTIFICATION_PUSH', 'EMAIL')}
+
+
+@override_settings(
+    LIVRAISON_ACTIVE=True, NOTIFICATIONS_PASSERELLES=passerelles('notifications.tests.PasserelleInstable'),
+    LIVRAISON_DELAI_LOT=0, LIVRAISON_BACKOFF_BASE=0.01,
+)
+class LivraisonTests(TestMongo):
+    """Pipeline de livraison : fin des envois attendue, notifications sans destinataire en échec"""
+
+    def tearDown(self):
+        fermer_livreur()
+        super().tearDown()
+
+    def statuts(self):
+        return {
+            document['_id']: (document['statut_envoi'], document['tentatives'], document.get('erreur_envoi'))
+            for document in Notification._get_collection().find()
+        }
+
+    def test_fermer_attend_les_relances(self):
+        utilisateur = creer_utilisateur(1)
+        vague = creer_vague(creer_zone())
+        livrables = [creer_notification(utilisateur, vague, type=canal) for canal in ('SMS', 'EMAIL')]
+        orpheline = creer_notification(utilisateur, vague)
+        Notification._get_collection().update_one({'_id': orpheline.id}, {'$set': {'utilisateur': ObjectId()}})
+
+        livrer_documents(list(Notification._get_collection().find()))
+        fermer_livreur()
+
+        statuts = self.statuts()
+        for notification in livrables:
+            self.assertEqual(statuts[notification.id][:2], ('ENVOYEE', 2))
+        self.assertEqual(statuts[orpheline.id], ('ECHEC', 0, 'Utilisateur introuvable'))
+
+    def test_passerelles_requises(self):
+        with override_settings(NOTIFICATIONS_PASSERELLES=passerelles(None)):
+            with self.assertRaises(ImproperlyConfigured):
+                verifier_passerelles()
+            with override_settings(LIVRAISON_ACTIVE=False):
+                verifier_passerelles()
+
+    @override_settings(NOTIFICATIONS_PASSERELLES=passerelles(None))
+    def test_ecritures_sans_passerelles(self):
+        utilisateur = creer_utilisateur(1)
+        zone = creer_zone()
+        HabitantZone(zone=zone, utilisateur=utilisateur).save()
+        vague = creer_vague(zone)
+        with self.assertLogs('notifications.livraison', 'ERROR'):
+            reponse = self.client.post('/api/notifications/', {
+                'libelle': 'Alerte', 'type': 'SMS', 'date_envoi': maintenant().isoformat(),
+                'utilisateur_id': str(utilisateur.id), 'vague_chaleur_id': str(vague.id),
+            }, format='json')
+        self.assertEqual(reponse.status_code, 201, reponse.content)
+
+        diffusion = DiffusionVague(vague_chaleur=vague).save()
+        with self.assertLogs('notifications.livraison', 'ERROR'):
+            executer_diffusion(diffusion.id)
+        self.assertEqual(DiffusionVague.objects.get(id=diffusion.id).statut, 'TERMINEE')
+        # Écritures conservées, livraison laissée à relancer_envois
+        self.assertEqual({statut for statut, _, _ in self.statuts().values()}, {'EN_ATTENTE'})
+        with self.assertRaises(ImproperlyConfigured):
+            call_command('relancer_envois', stdout=io.StringIO())
+
+
+class FluxTests(TestMongo):
+    """Flux SSE : tickets d'ouverture à usage unique, événements numérotés par une séquence commune"""
+
+    def test_ticket_a_usage_unique(self):
+        utilisateur = creer_utilisateur(1)
+        self.assertEqual(self.client.post('/api/notifications/ticket_flux/').status_code, 401)
+
+        reponse = self.client.post('/api/notifications/ticket_flux/', **self.entetes(utilisateur))
+        self.assertEqual(reponse.status_code, 200)
+        ticket = reponse.json()['ticket']
+        self.assertEqual(async_to_sync(consommer_ticket)(ticket), utilisateur.id)
+        self.assertIsNone(async_to_sync(consommer_ticket)(ticket))
+        self.assertIsNone(async_to_sync(consommer_ticket)('inconnu'))
+
+    @override_settings(NOTIFICATIONS_FLUX_TICKET_DUREE=-1)
+    def test_ticket_expire(self):
+        utilisateur = creer_utilisateur(1)
+        ticket = self.client.post('/api/notifications/ticket_flux/', **self.entetes(utilisateur)).json()['ticket']
+        self.assertIsNone(async_to_sync(consommer_ticket)(ticket))
+
+    def test_sequence_commune_aux_workers(self):
+        utilisateur = ObjectId()
+        # Deux workers publient en alternance : les numéros se suivent dans l'ordre de publication
+        workers = [BackendMongo(courtier=None), BackendMongo(courtier=None)]
+        publies = []
+        for rang in range(6):
+            evenements = [Evenement(None, utilisateur, 'notification', f'{{"rang": {rang}}}')]
+            workers[rang % 2].publier(evenements)
+            publies.append(evenements[0].id)
+        self.assertEqual(publies, list(range(publies[0], publies[0] + 6)))
+
+        rejoues = async_to_sync(workers[0].depuis)(utilisateur, publies[1])
+        self.assertEqual([evenement.id for evenement in rejoues], publies[2:])
+        self.assertEqual([evenement.donnees for evenement in rejoues], [f'{{"rang": {rang}}}' for rang in range(2, 6)])
+
+
+class CompteursTests(TestMongo):
+    """CompteurNonLues reste égal au nombre de notifications non lues, quelle que soit la façon de les lire"""
+
+    def setUp(self):
+        super().setUp()
+        vague = creer_vague(creer_zone())
+        self.awa, self.binta = creer_utilisateur(1), creer_utilisateur(2)
+        instant = maintenant()
+        self.notifications = [
+            creer_notification(self.awa, vague, date_envoi=instant - datetime.timedelta(hours=heures))
+            for heures in range(6)
+        ]
+        self.autre = creer_notification(self.binta, vague)
+
+    def compteur(self, utilisateur):
+        reponse = self.client.get(f'/api/notifications/compteur_non_lues/?utilisateur_id={utilisateur.id}')
+        self.assertEqual(reponse.status_code, 200)
+        return reponse.json()['non_lues']
+
+    def verifier(self, attendu_awa):
+        for utilisateur, attendu in ((self.awa, attendu_awa), (self.binta, 1)):
+            self.assertEqual(Notification.objects(utilisateur=utilisateur, lue=False).count(), attendu)
+            self.assertEqual(self.compteur(utilisateur), attendu)
+
+    def marquer_lues(self, **donnees):
+        reponse = self.client.post(
+            '/api/notifications/marquer_lues/', {'utilisateur_id': str(self.awa.id), **donnees}, format='json'
+        )
+        self.assertEqual(reponse.status_code, 200, reponse.content)
+        return reponse.json()
+
+    def test_marquer_lues_par_ids(self):
+        # La notification d'un autre utilisateur n'est ni marquée ni décomptée
+        ids = [str(n.id) for n in self.notifications[:3]] + [str(self.autre.id)]
+        self.assertEqual(self.marquer_lues(ids=ids), {'modifiees': 3, 'non_lues': 3})
+        # Rejouée, la requête ne modifie plus rien
+        self.assertEqual(self.marquer_lues(ids=ids), {'modifiees': 0, 'non_lues': 3})
+        self.verifier(3)
+
+    def test_marquer_lues_avant(self):
+        avant = self.notifications[3].date_envoi.isoformat()
+        self.assertEqual(self.marquer_lues(avant=avant)['modifiees'], 3)
+        self.verifier(3)
+
+    def test_marquer_comme_lue_deux_fois(self):
+        for _ in range(2):
+            reponse = self.client.patch(f'/api/notifications/{self.notifications[0].id}/marquer_comme_lue/')
+            self.assertEqual(reponse.status_code, 200)
+        self.verifier(5)
+
+    def test_lectures_concurrentes(self):
+        ids = [str(n.id) for n in self.notifications]
+        lots = [ids[:4], ids[2:], ids[1:5], ids]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            modifiees = sum(pool.map(lambda lot: self.marquer_lues(ids=lot)['modifiees'], lots))
+        # Chaque notification n'est comptée qu'une fois, par l'appel qui l'a fait passer à lue
+        self.assertEqual(modifiees, 6)
+        self.verifier(0)
+
+    def test_sauvegarde_et_suppression(self):
+        self.notifications[0].lue = True
+        self.notifications[0].save()
+        self.notifications[1].delete()
+        self.verifier(4)
+        call_command('recalculer_compteurs', stdout=io.StringIO())
+        self.verifier(4)
+
+
+class CoalescenceTests(TestMongo):
+    """Une seule notification par utilisateur, vague et canal pendant la fenêtre, y compris entre processus"""
+
+    def setUp(self):
+        super().setUp()
+        self.vague = creer_vague(creer_zone())
+        self.utilisateurs = [ObjectId() for _ in range(3)]
+
+    def coalesceur(self):
+        return Coalesceur(fenetre=3600, capacite=1000, taux=0.001)
+
+    def documents(self, utilisateurs, canaux=('SMS', 'EMAIL')):
+        return [
+            {'utilisateur': utilisateur, 'vague_chaleur': self.vague.id, 'type': canal}
+            for utilisateur in utilisateurs for canal in canaux
+        ]
+
+    def test_doublons_d_un_lot(self):
+        retenues, supprimees = self.coalesceur().coalescer(self.documents(self.utilisateurs * 2))
+        self.assertEqual((len(retenues), supprimees), (6, 6))
+        self.assertEqual(len({cle(document) for document in retenues}), 6)
+
+    def test_doublons_entre_processus(self):
+        premier, second = self.coalesceur(), self.coalesceur()
+        premier.coalescer(self.documents(self.utilisateurs[:2]))
+        # Filtre de Bloom vide : la réservation en base écarte seule les doublons
+        retenues, supprimees = second.coalescer(self.documents(self.utilisateurs))
+        self.assertEqual(supprimees, 4)
+        self.assertEqual({document['utilisateur'] for document in retenues}, {self.utilisateurs[2]})
+
+    def test_faux_positif_sans_suppression(self):
+        coalesceur = self.coalesceur()
+        coalesceur.coalescer(self.documents(self.utilisateurs))
+        # Clés encore dans le filtre mais réservations disparues : tout est retenu
+        CleCoalescence.objects.delete()
+        retenues, supprimees = coalesceur.coalescer(self.documents(self.utilisateurs))
+        self.assertEqual((len(retenues), supprimees), (6, 0))
+        self.assertEqual(coalesceur.metriques()['faux_positifs'], 6)
+
+    def test_fenetre_expiree(self):
+        coalesceur = self.coalesceur()
+        coalesceur.coalescer(self.documents(self.utilisateurs))
+        CleCoalescence._get_collection().update_many({}, {'$set': {'expire_le': maintenant() - datetime.timedelta(seconds=1)}})
+        retenues, supprimees = coalesceur.coalescer(self.documents(self.utilisateurs))
+        self.assertEqual((len(retenues), supprimees), (6, 0))
+
+    @override_settings(LIVRAISON_ACTIVE=False)
+    def test_diffusions_successives(self):
+        zone = creer_zone(2)
+        for numero in range(3):
+            HabitantZone(zone=zone, utilisateur=creer_utilisateur(numero)).save()
+        vague = creer_vague(zone)
+        for _ in range(2):
+            executer_diffusion(DiffusionVague(vague_chaleur=vague).save().id)
+
+        premiere, seconde = DiffusionVague.objects.order_by('id')
+        self.assertEqual((premiere.notifications_creees, premiere.notifications_supprimees), (9, 0))
+        self.assertEqual((seconde.notifications_creees, seconde.notifications_supprimees), (0, 9))
+        self.assertEqual(Notification.objects(vague_chaleur=vague).count(), 9)
+
+
+class ArchivesTests(TestMongo):
+    """La liste ne lit que la collection active : ses validateurs ignorent les archives"""
+
+    def test_liste_independante_des_archives(self):
+        utilisateur = creer_utilisateur(1)
+        vague = creer_vague(creer_zone())
+        notification = creer_notification(utilisateur, vague)
+
+        for url in ('/api/notifications/', '/api/notifications/?archives=1'):
+            reponse = self.client.get(url)
+            self.assertEqual([n['id'] for n in reponse.json()['results']], [str(notification.id)])
+            NotificationArchivee(
+                libelle='Ancienne', type='SMS', date_envoi=maintenant(), lue=True,
+                utilisateur=utilisateur, vague_chaleur=vague, archived_at=maintenant(),
+            ).save()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=reponse['ETag']).status_code, 304)
+
+        reponse = self.client.get(f'/api/notifications/par_utilisateur/?utilisateur_id={utilisateur.id}&archives=1')
+        self.assertEqual(len(reponse.json()['results']), 2)
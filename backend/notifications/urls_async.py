@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views_async
+
+urlpatterns = [
+    path('notifications/non_lues/', views_async.non_lues),
+    path('notifications/compteur_non_lues/', views_async.compteur_non_lues),
+    path('notifications/flux/', views_async.flux),
+]
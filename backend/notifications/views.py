@@ -1,38 +1,61 @@
+import datetime
+from bson import ObjectId
 from rest_framework import status, viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from .models import Notification
-from .serializers import NotificationSerializer
+from .models import Notification, NotificationArchivee, DiffusionVague
+from .serializers import NotificationSerializer, DiffusionSerializer, MarquerLuesSerializer
+from . import compteurs
+from .flux import creer_ticket
 from authentification.models import User
+from vagues_chaleur.models import VagueChaleur
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from utils.swagger_decorators import PARAMETRES_SELECTION, PARAMETRE_FLUX
+from utils.pagination import PaginationCurseur
+from utils.brut import page, element
+from utils.prefetch import id_reference
+from utils.conditionnel import conditionnel
+from utils.auth import authenticate_request
+from utils import versions
+
+def source_notifications(request):
+    """Collection active, ou archives sur demande explicite (?archives=1)"""
+    if request.query_params.get('archives') == '1':
+        return NotificationArchivee
+    return Notification
+
 
 class NotificationViewSet(viewsets.ViewSet):
     @swagger_auto_schema(
+        manual_parameters=PARAMETRES_SELECTION + [PARAMETRE_FLUX],
         operation_description="Lister toutes les notifications.",
         responses={200: openapi.Response(
             description="Liste des notifications",
             examples={
-                "application/json": [
-                    {
-                        "id": "1",
-                        "libelle": "Alerte canicule",
-                        "type": "ALERTE",
-                        "date_envoi": "2024-07-24T12:00:00Z",
-                        "lue": False,
-                        "utilisateur": "662f1e7b8e4b0c001e8b4569",
-                        "vague_chaleur": "662f1e7b8e4b0c001e8b4568",
-                        "created_at": "2024-07-24T12:00:00Z",
-                        "updated_at": "2024-07-24T12:00:00Z"
-                    }
-                ]
+                "application/json": {
+                    "next": "http://localhost:8000/api/notifications/?curseur=W3siJGRhdGUiOiAiMjAyNC0wNy0yMFQxMjowMDowMFoifSwgeyIkb2lkIjogIjY2MmYxZTdiOGU0YjBjMDAxZThiNDU2OCJ9XQ",
+                    "results": [
+                        {
+                            "id": "1",
+                            "libelle": "Alerte canicule",
+                            "type": "ALERTE",
+                            "date_envoi": "2024-07-24T12:00:00Z",
+                            "lue": False,
+                            "utilisateur": "662f1e7b8e4b0c001e8b4569",
+                            "vague_chaleur": "662f1e7b8e4b0c001e8b4568",
+                            "created_at": "2024-07-24T12:00:00Z",
+                            "updated_at": "2024-07-24T12:00:00Z"
+                        }
+                    ]
+                }
             }
         )}
     )
+    # La liste ne lit que la collection active, ?archives=1 ne s'applique qu'au détail et à par_utilisateur
+    @conditionnel(Notification, User, VagueChaleur)
     def list(self, request):
-        notifications = Notification.objects.all()
-        serializer = NotificationSerializer(notifications, many=True)
-        return Response(serializer.data)
+        return page(PaginationCurseur(tri='-date_envoi'), Notification.objects.all(), request, NotificationSerializer)
     
     @swagger_auto_schema(
         operation_description="Créer une notification.",
@@ -77,13 +100,17 @@ class NotificationViewSet(viewsets.ViewSet):
             return Response(NotificationSerializer(notification).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @swagger_auto_schema(
+        manual_parameters=PARAMETRES_SELECTION + [
+            openapi.Parameter('archives', openapi.IN_QUERY, description="1 : chercher dans les notifications archivées", type=openapi.TYPE_STRING)
+        ]
+    )
+    @conditionnel(Notification, NotificationArchivee, User, VagueChaleur, source=source_notifications)
     def retrieve(self, request, pk=None):
-        try:
-            notification = Notification.objects.get(id=pk)
-            serializer = NotificationSerializer(notification)
-            return Response(serializer.data)
-        except Notification.DoesNotExist:
+        data = element(source_notifications(request).objects(id=pk), request, NotificationSerializer)
+        if data is None:
             return Response({'error': 'Notification introuvable'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
     
     def update(self, request, pk=None):
         try:
@@ -104,7 +131,16 @@ class NotificationViewSet(viewsets.ViewSet):
         except Notification.DoesNotExist:
             return Response({'error': 'Notification introuvable'}, status=status.HTTP_404_NOT_FOUND)
     
+    @swagger_auto_schema(
+        operation_description="Récupérer les notifications d'un utilisateur, ou son historique archivé avec archives=1.",
+        manual_parameters=PARAMETRES_SELECTION + [
+            PARAMETRE_FLUX,
+            openapi.Parameter('utilisateur_id', openapi.IN_QUERY, description="ID de l'utilisateur", type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('archives', openapi.IN_QUERY, description="1 : notifications archivées (lues depuis plus de NOTIFICATIONS_RETENTION_JOURS jours)", type=openapi.TYPE_STRING),
+        ]
+    )
     @action(detail=False, methods=['get'])
+    @conditionnel(Notification, NotificationArchivee, User, VagueChaleur, source=source_notifications)
     def par_utilisateur(self, request):
         """Récupérer les notifications d'un utilisateur"""
         utilisateur_id = request.query_params.get('utilisateur_id')
@@ -117,16 +153,18 @@ class NotificationViewSet(viewsets.ViewSet):
         
         try:
             utilisateur = User.objects.get(id=utilisateur_id)
-            notifications = Notification.objects.filter(utilisateur=utilisateur)
-            serializer = NotificationSerializer(notifications, many=True)
-            return Response(serializer.data)
+            return page(
+                PaginationCurseur(tri='-date_envoi'), source_notifications(request).objects.filter(utilisateur=utilisateur), request, NotificationSerializer
+            )
         except User.DoesNotExist:
             return Response(
                 {'error': 'Utilisateur introuvable'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
     
+    @swagger_auto_schema(manual_parameters=PARAMETRES_SELECTION + [PARAMETRE_FLUX])
     @action(detail=False, methods=['get'])
+    @conditionnel(Notification, User, VagueChaleur)
     def non_lues(self, request):
         """Récupérer les notifications non lues d'un utilisateur"""
         utilisateur_id = request.query_params.get('utilisateur_id')
@@ -139,12 +177,9 @@ class NotificationViewSet(viewsets.ViewSet):
         
         try:
             utilisateur = User.objects.get(id=utilisateur_id)
-            notifications = Notification.objects.filter(
-                utilisateur=utilisateur, 
-                lue=False
+            return page(
+                PaginationCurseur(tri='-date_envoi'), Notification.objects.filter(utilisateur=utilisateur, lue=False), request, NotificationSerializer
             )
-            serializer = NotificationSerializer(notifications, many=True)
-            return Response(serializer.data)
         except User.DoesNotExist:
             return Response(
                 {'error': 'Utilisateur introuvable'}, 
@@ -154,13 +189,173 @@ class NotificationViewSet(viewsets.ViewSet):
     @action(detail=True, methods=['patch'])
     def marquer_comme_lue(self, request, pk=None):
         """Marquer une notification comme lue"""
+        maintenant = datetime.datetime.now(datetime.timezone.utc)
+        # Mise à jour atomique : seul l'appel qui fait passer la notification à lue décrémente le compteur
+        notification = Notification.objects(id=pk, lue=False).no_dereference().modify(
+            set__lue=True, set__date_lecture=maintenant, set__updated_at=maintenant, new=True
+        )
+        if notification is not None:
+            compteurs.decrementer(id_reference(notification._data.get('utilisateur')), 1)
+        else:
+            notification = Notification.objects(id=pk).first()
+            if notification is None:
+                return Response({'error': 'Notification introuvable'}, status=status.HTTP_404_NOT_FOUND)
+        
+        serializer = NotificationSerializer(notification)
+        return Response(serializer.data)
+    
+    @swagger_auto_schema(
+        operation_description="Obtenir un ticket d'ouverture du flux SSE (GET /api/notifications/flux/?ticket=...) : "
+            "à usage unique, valable quelques secondes, il évite de placer le JWT dans l'URL d'EventSource.",
+        responses={
+            200: openapi.Response(
+                description="Ticket de l'utilisateur connecté",
+                examples={"application/json": {"ticket": "Qm9uam91ci4uLg", "expire_dans": 30}}
+            ),
+            401: openapi.Response(description="Token JWT manquant ou invalide"),
+        }
+    )
+    @action(detail=False, methods=['post'])
+    @authenticate_request
+    def ticket_flux(self, request):
+        """Délivrer un ticket d'ouverture du flux SSE à l'utilisateur connecté"""
+        ticket, duree = creer_ticket(request.user.id)
+        return Response({'ticket': ticket, 'expire_dans': duree})
+    
+    @swagger_auto_schema(
+        operation_description="Marquer comme lues, en une seule écriture, des notifications d'un utilisateur : "
+            "celles dont l'id est dans `ids`, ou toutes celles envoyées jusqu'à `avant`.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=["utilisateur_id"],
+            properties={
+                "utilisateur_id": openapi.Schema(type=openapi.TYPE_STRING, description="ID de l'utilisateur"),
+                "ids": openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING),
+                                      description="IDs des notifications (1000 au plus)"),
+                "avant": openapi.Schema(type=openapi.TYPE_STRING, format="date-time",
+                                        description="Date d'envoi maximale incluse"),
+            }
+        ),
+        responses={
+            200: openapi.Response(
+                description="Nombre de notifications marquées et compteur mis à jour",
+                examples={"application/json": {"modifiees": 12, "non_lues": 3}}
+            ),
+            400: openapi.Response(
+                description="Erreur de validation",
+                examples={"application/json": {"non_field_errors": ["Indiquer soit ids, soit avant"]}}
+            ),
+            404: openapi.Response(
+                description="Utilisateur introuvable",
+                examples={"application/json": {"error": "Utilisateur introuvable"}}
+            ),
+        }
+    )
+    @action(detail=False, methods=['post'])
+    def marquer_lues(self, request):
+        """Marquer comme lues plusieurs notifications d'un utilisateur"""
+        serializer = MarquerLuesSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        donnees = serializer.validated_data
+        
+        utilisateur = ObjectId(donnees['utilisateur_id'])
+        if not User.objects(id=utilisateur).only('id').first():
+            return Response({'error': 'Utilisateur introuvable'}, status=status.HTTP_404_NOT_FOUND)
+        
+        # Index (utilisateur, lue, date_envoi, _id)
+        filtre = {'utilisateur': utilisateur, 'lue': False}
+        if 'ids' in donnees:
+            filtre['_id'] = {'$in': [ObjectId(identifiant) for identifiant in donnees['ids']]}
+        else:
+            filtre['date_envoi'] = {'$lte': donnees['avant']}
+        maintenant = datetime.datetime.now(datetime.timezone.utc)
+        resultat = Notification._get_collection().update_many(
+            filtre, {'$set': {'lue': True, 'date_lecture': maintenant, 'updated_at': maintenant}}
+        )
+        if resultat.modified_count:
+            versions.toucher(Notification)
+        compteurs.decrementer(utilisateur, resultat.modified_count)
+        
+        return Response({
+            'modifiees': resultat.modified_count,
+            'non_lues': compteurs.lire(utilisateur),
+        })
+    
+    @swagger_auto_schema(
+        operation_description="Nombre de notifications non lues d'un utilisateur (badge).",
+        manual_parameters=[
+            openapi.Parameter('utilisateur_id', openapi.IN_QUERY, description="ID de l'utilisateur", type=openapi.TYPE_STRING, required=True)
+        ],
+        responses={200: openapi.Response(
+            description="Compteur de notifications non lues",
+            examples={"application/json": {"utilisateur_id": "662f1e7b8e4b0c001e8b4569", "non_lues": 3}}
+        )}
+    )
+    @action(detail=False, methods=['get'])
+    def compteur_non_lues(self, request):
+        """Nombre de notifications non lues d'un utilisateur, lu dans son compteur"""
+        utilisateur_id = request.query_params.get('utilisateur_id')
+        
+        if not utilisateur_id or not ObjectId.is_valid(utilisateur_id):
+            return Response(
+                {'error': 'utilisateur_id requis en paramètre'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            'utilisateur_id': utilisateur_id,
+            'non_lues': compteurs.lire(ObjectId(utilisateur_id)),
+        })
+
+
+class DiffusionViewSet(viewsets.ViewSet):
+    @swagger_auto_schema(
+        operation_description="Lister les diffusions d'alertes, éventuellement pour une vague de chaleur.",
+        manual_parameters=[
+            openapi.Parameter('vague_id', openapi.IN_QUERY, description="ID de la vague de chaleur", type=openapi.TYPE_STRING)
+        ],
+        responses={200: openapi.Response(description="Page de diffusions, les plus récentes d'abord")}
+    )
+    def list(self, request):
+        diffusions = DiffusionVague.objects.all()
+        vague_id = request.query_params.get('vague_id')
+        if vague_id:
+            diffusions = diffusions.filter(vague_chaleur=vague_id)
+        return page(PaginationCurseur(tri='-id'), diffusions, request, DiffusionSerializer)
+    
+    @swagger_auto_schema(
+        operation_description="Suivre l'avancement d'une diffusion d'alertes.",
+        responses={
+            200: openapi.Response(
+                description="Avancement de la diffusion",
+                examples={
+                    "application/json": {
+                        "id": "662f1e7b8e4b0c001e8b4570",
+                        "vague_chaleur_id": "662f1e7b8e4b0c001e8b4568",
+                        "statut": "EN_COURS",
+                        "total_habitants": 50000,
+                        "habitants_traites": 12000,
+                        "notifications_creees": 36000,
+                        "notifications_supprimees": 0,
+                        "progression": 24.0,
+                        "erreur": None,
+                        "created_at": "2024-07-24T12:00:00Z",
+                        "updated_at": "2024-07-24T12:00:05Z",
+                        "date_fin": None
+                    }
+                }
+            ),
+            404: openapi.Response(
+                description="Diffusion introuvable",
+                examples={"application/json": {"error": "Diffusion introuvable"}}
+            ),
+        }
+    )
+    def retrieve(self, request, pk=None):
         try:
-            notification = Notification.objects.get(id=pk)
-            notification.lue = True
-            notification.save()
-            
-            serializer = NotificationSerializer(notification)
+            diffusion = DiffusionVague.objects.get(id=pk)
+            serializer = DiffusionSerializer(diffusion)
             return Response(serializer.data)
-        except Notification.DoesNotExist:
-            return Response({'error': 'Notification introuvable'}, status=status.HTTP_404_NOT_FOUND)
-
+        except DiffusionVague.DoesNotExist:
+            return Response({'error': 'Diffusion introuvable'}, status=status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,110 @@
+from bson import ObjectId
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from authentification.models import User
+from utils.asynchrone import vue_async, authentifier, collection, charger_references, reponse, reponse_flux, utilisateur_du_token
+from utils.auth import token_de_la_requete
+from utils.brut import Selection, flux_demande, taille_lot_flux
+from utils.conditionnel import conditionnel_async
+from utils.pagination import PaginationCurseur
+from vagues_chaleur.models import VagueChaleur
+from .flux import flux_sse, consommer_ticket
+from .models import Notification, CompteurNonLues
+from .representations import representation_notification, lecture, CHAMPS_UTILISATEUR, CHAMPS_VAGUE
+
+
+@vue_async
+@conditionnel_async(Notification, User, VagueChaleur)
+async def non_lues(request):
+    """Récupérer les notifications non lues d'un utilisateur"""
+    await authentifier(request)
+    utilisateur_id = request.GET.get('utilisateur_id')
+    
+    if not utilisateur_id:
+        return reponse(
+            request,
+            {'error': 'utilisateur_id requis en paramètre'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    utilisateur = None
+    if ObjectId.is_valid(utilisateur_id):
+        projection = {User._fields[champ].db_field: 1 for champ in CHAMPS_UTILISATEUR}
+        utilisateur = await collection(User).find_one({'_id': ObjectId(utilisateur_id)}, projection)
+    if utilisateur is None:
+        return reponse(
+            request,
+            {'error': 'Utilisateur introuvable'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    selection = Selection.depuis(request, lecture)
+    pagination = PaginationCurseur(tri='-date_envoi')
+    filtre = {'utilisateur': utilisateur['_id'], 'lue': False}
+
+    async def representer(notifications):
+        vagues = {}
+        if selection.developpe('vague_chaleur'):
+            vagues = await charger_references(
+                VagueChaleur, (notification.get('vague_chaleur') for notification in notifications), CHAMPS_VAGUE
+            )
+        return [
+            representation_notification(notification, {utilisateur['_id']: utilisateur}, vagues, selection)
+            for notification in notifications
+        ]
+
+    if flux_demande(request):
+        return reponse_flux(
+            pagination, collection(Notification), filtre, request, lecture.projection_mongo(selection),
+            representer, taille_lot_flux()
+        )
+    notifications = await pagination.paginer_collection(
+        collection(Notification), filtre, request, lecture.projection_mongo(selection)
+    )
+    return reponse(request, pagination.donnees_paginees(await representer(notifications)))
+
+
+@vue_async
+async def compteur_non_lues(request):
+    """Nombre de notifications non lues d'un utilisateur, lu dans son compteur"""
+    await authentifier(request)
+    utilisateur_id = request.GET.get('utilisateur_id')
+    
+    if not utilisateur_id or not ObjectId.is_valid(utilisateur_id):
+        return reponse(
+            request,
+            {'error': 'utilisateur_id requis en paramètre'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    compteur = await collection(CompteurNonLues).find_one({'utilisateur': ObjectId(utilisateur_id)}, {'non_lues': 1})
+    return reponse(request, {
+        'utilisateur_id': utilisateur_id,
+        'non_lues': compteur['non_lues'] if compteur else 0,
+    })
+
+
+@vue_async
+async def flux(request):
+    """Flux SSE des nouvelles notifications de l'utilisateur connecté"""
+    # EventSource ne permet pas d'ajouter d'en-tête : il présente un ticket à usage
+    # unique (POST notifications/ticket_flux/), jamais le JWT, que l'URL exposerait
+    # aux journaux d'accès
+    token = token_de_la_requete(request)
+    if token:
+        user, _ = await utilisateur_du_token(token)
+        utilisateur = user.id
+    elif request.GET.get('ticket'):
+        utilisateur = await consommer_ticket(request.GET['ticket'])
+        if utilisateur is None:
+            raise AuthenticationFailed("Ticket invalide, expiré ou déjà utilisé")
+    else:
+        raise AuthenticationFailed("Token JWT ou ticket manquant")
+    
+    dernier_id = request.headers.get('Last-Event-ID') or request.GET.get('dernier_id')
+    resultat = StreamingHttpResponse(flux_sse(utilisateur, dernier_id), content_type='text/event-stream')
+    resultat['Cache-Control'] = 'no-cache'
+    # Pas de mise en tampon par un proxy nginx
+    resultat['X-Accel-Buffering'] = 'no'
+    return resultat
@@ -0,0 +1,8 @@
+from utils.indexes import declarer
+from .models import Recommandation
+
+declarer(
+    Recommandation,
+    # Clé de pagination du filtre par zone
+    ['zone_geographique', 'id'],
+)
@@ -0,0 +1,13 @@
+from utils.brut import Mappeur, Lecture, Reference
+from zones_geographiques.models import ZoneGeographique
+from .models import Recommandation
+
+CHAMPS_RECOMMANDATION = ('libelle', 'description', 'created_at', 'updated_at')
+CHAMPS_ZONE = ('ville', 'rue', 'numero')
+
+
+class LectureRecommandations(Lecture):
+    mappeur = Mappeur(Recommandation, CHAMPS_RECOMMANDATION)
+    relations = {
+        'zone_geographique': Reference(ZoneGeographique, Mappeur(ZoneGeographique, CHAMPS_ZONE)),
+    }
@@ -1,3 +1,195 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from asgiref.sync import async_to_sync
+import orjson
+from django.test import AsyncClient, override_settings
+from utils import cache_reponses
+from utils.essais import TestMongo, creer_zone
+from utils.versions import Version
+from .models import Recommandation
+from .serializers import RecommandationSerializer
 
-# Create your tests here.
+
+class RequetesListesTests(TestMongo):
+    """Les listes font un nombre de requêtes indépendant du nombre de lignes (références chargées par $in)"""
+
+    def setUp(self):
+        super().setUp()
+        self.zones = []
+
+    def ajouter(self, nombre):
+        for _ in range(nombre):
+            zone = creer_zone(len(self.zones) + 1)
+            self.zones.append(zone)
+            Recommandation(libelle='Hydratez-vous', description='Buvez de l\'eau', zone_geographique=zone).save()
+            Recommandation(libelle='Restez à l\'ombre', description='Évitez le soleil', zone_geographique=self.zones[0]).save()
+
+    def urls(self):
+        return [
+            '/api/recommandations/',
+            f'/api/recommandations/par_zone/?zone_id={self.zones[0].id}',
+        ]
+
+    def test_nombre_de_requetes_constant(self):
+        self.assertRequetesConstantes(self.ajouter, self.urls)
+
+    def test_lecture_brute_identique(self):
+        self.ajouter(3)
+        recommandation = Recommandation.objects.first()
+        self.assertLecturesIdentiques(self.urls() + [f'/api/recommandations/{recommandation.id}/'])
+
+
+class CacheReponsesTests(TestMongo):
+    """Cache des réponses : entrées suivies par les versions de tous les workers, calculs coalescés"""
+
+    def setUp(self):
+        super().setUp()
+        self.zone = creer_zone()
+        self.recommandation = Recommandation(
+            libelle='Hydratez-vous', description='Buvez de l\'eau', zone_geographique=self.zone
+        ).save()
+        self.url = f'/api/recommandations/par_zone/?zone_id={self.zone.id}'
+
+    def lire(self):
+        reponse = self.client.get(self.url)
+        self.assertEqual(reponse.status_code, 200)
+        return reponse['ETag'], [r['libelle'] for r in reponse.json()['results']]
+
+    def compteurs(self):
+        return cache_reponses.metriques()['endpoints']['recommandations.par_zone']
+
+    def test_lecture_servie_par_le_cache(self):
+        premiere = self.lire()
+        with self.commandes.compter() as commandes:
+            self.assertEqual(self.lire(), premiere)
+        # Seul le compte estimé de l'ETag (métadonnées de la collection) reste lu
+        self.assertEqual([nom for nom, cible in commandes if cible == 'recommandations'], ['count'])
+        self.assertEqual(self.compteurs()['succes'], 1)
+
+    def test_ecriture_d_un_autre_processus(self):
+        etag, libelles = self.lire()
+        # Un autre worker écrit : ce processus n'en est informé que par la collection versions
+        Recommandation._get_collection().update_one(
+            {'_id': self.recommandation.id}, {'$set': {'libelle': 'Restez à l\'ombre'}}
+        )
+        Version._get_collection().update_one({'_id': 'recommandations'}, {'$inc': {'version': 1}})
+        nouvel_etag, libelles = self.lire()
+        self.assertEqual(libelles, ['Restez à l\'ombre'])
+        self.assertNotEqual(nouvel_etag, etag)
+
+    def test_suppression_non_versionnee(self):
+        # Suppression de l'index TTL : seul le nombre de documents change, l'ETag et le corps suivent
+        autre = Recommandation(libelle='Évitez le soleil', description='-', zone_geographique=self.zone).save()
+        etag, libelles = self.lire()
+        self.assertEqual(len(libelles), 2)
+        Recommandation._get_collection().delete_one({'_id': autre.id})
+        nouvel_etag, libelles = self.lire()
+        self.assertEqual(libelles, ['Hydratez-vous'])
+        self.assertNotEqual(nouvel_etag, etag)
+
+    @override_settings(CACHE_REPONSES_BACKEND='utils.cache_reponses.BackendDjango')
+    def test_backend_partage(self):
+        self.vider_caches()
+        premiere = self.lire()
+        # Nouveau processus : cache du processus vide, entrée partagée
+        cache_reponses._cache = None
+        self.assertEqual(self.lire(), premiere)
+        self.assertEqual(self.compteurs()['succes'], 1)
+
+    def test_calculs_simultanes_coalesces(self):
+        instance = cache_reponses.CacheReponses()
+        calculs = []
+        depart = threading.Barrier(8)
+
+        def calculer():
+            calculs.append(1)
+            time.sleep(0.2)
+            return 'valeur', None
+
+        def obtenir():
+            depart.wait()
+            return instance.obtenir('essai', 'cle', calculer)[0]
+
+        with ThreadPoolExecutor(8) as executeur:
+            valeurs = list(executeur.map(lambda _: obtenir(), range(8)))
+        self.assertEqual(valeurs, ['valeur'] * 8)
+        self.assertEqual(len(calculs), 1)
+        self.assertEqual(instance.metriques()['endpoints']['essai']['coalescees'], 7)
+
+    def test_calculs_simultanes_coalesces_async(self):
+        instance = cache_reponses.CacheReponses()
+        calculs = []
+
+        async def calculer():
+            calculs.append(1)
+            await asyncio.sleep(0.05)
+            return 'valeur', None
+
+        async def obtenir():
+            resultats = await asyncio.gather(*(instance.obtenir_async('essai', 'cle', calculer) for _ in range(8)))
+            return [valeur for valeur, _ in resultats]
+
+        self.assertEqual(async_to_sync(obtenir)(), ['valeur'] * 8)
+        self.assertEqual(len(calculs), 1)
+
+
+@override_settings(FLUX_TAILLE_LOT=3)
+class FluxTests(TestMongo):
+    """La liste en flux (?flux=1) a le contenu de toutes les pages, envoyé lot par lot sous ASGI"""
+
+    def setUp(self):
+        super().setUp()
+        self.zone = creer_zone()
+        for numero in range(7):
+            Recommandation(libelle=f'Conseil {numero}', description='-', zone_geographique=self.zone).save()
+
+    def pages(self, url):
+        resultats = []
+        while url:
+            reponse = self.client.get(url)
+            self.assertEqual(reponse.status_code, 200)
+            donnees = reponse.json()
+            resultats += donnees['results']
+            url = donnees['next']
+        return resultats
+
+    def flux(self, url):
+        reponse = self.client.get(url + '&flux=1')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertTrue(reponse.streaming)
+        return b''.join(reponse.streaming_content)
+
+    def flux_asgi(self, url):
+        async def lire():
+            reponse = await AsyncClient().get(url + '&flux=1')
+            self.assertEqual(reponse.status_code, 200)
+            self.assertTrue(reponse.is_async)
+            return [morceau async for morceau in reponse.streaming_content]
+        return async_to_sync(lire)()
+
+    def test_flux_egal_aux_pages(self):
+        for url in (
+            '/api/recommandations/?taille=2',
+            '/api/recommandations/?taille=2&fields=id,libelle',
+            f'/api/recommandations/par_zone/?zone_id={self.zone.id}&taille=2',
+        ):
+            with self.subTest(url=url):
+                corps = self.flux(url)
+                self.assertEqual(orjson.loads(corps), {'next': None, 'results': self.pages(url)})
+
+    def test_flux_sans_lecture_brute(self):
+        url = '/api/recommandations/?taille=2'
+        with override_settings(LECTURE_BRUTE=False), mock.patch.object(
+            RecommandationSerializer.lecture_brute, 'representer', side_effect=AssertionError
+        ):
+            self.assertEqual(orjson.loads(self.flux(url)), {'next': None, 'results': self.pages(url)})
+
+    def test_flux_asynchrone_sous_asgi(self):
+        url = '/api/recommandations/?taille=2'
+        morceaux = self.flux_asgi(url)
+        # Début, trois lots de 3, 3 et 1 documents, fin
+        self.assertEqual(len(morceaux), 5)
+        self.assertEqual(b''.join(morceaux), self.flux(url))
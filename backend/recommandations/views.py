@@ -6,30 +6,39 @@ from .serializers import RecommandationSerializer
 from zones_geographiques.models import ZoneGeographique
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from utils.swagger_decorators import PARAMETRES_SELECTION, PARAMETRE_FLUX
+from utils.pagination import PaginationCurseur
+from utils.brut import page, element
+from utils.mongo import lecture_secondaire
+from utils.conditionnel import conditionnel
+from utils.cache_reponses import en_cache
 
 class RecommandationViewSet(viewsets.ViewSet):
     @swagger_auto_schema(
+        manual_parameters=PARAMETRES_SELECTION + [PARAMETRE_FLUX],
         operation_description="Lister toutes les recommandations.",
         responses={200: openapi.Response(
             description="Liste des recommandations",
             examples={
-                "application/json": [
-                    {
-                        "id": "1",
-                        "libelle": "Hydratez-vous",
-                        "description": "Buvez au moins 1,5L d'eau par jour.",
-                        "zone_geographique": "662f1e7b8e4b0c001e8b4567",
-                        "created_at": "2024-07-24T12:00:00Z",
-                        "updated_at": "2024-07-24T12:00:00Z"
-                    }
-                ]
+                "application/json": {
+                    "next": "http://localhost:8000/api/recommandations/?curseur=W3siJG9pZCI6ICI2NjJmMWU3YjhlNGIwYzAwMWU4YjQ1NjcifSwgeyIkb2lkIjogIjY2MmYxZTdiOGU0YjBjMDAxZThiNDU2NyJ9XQ",
+                    "results": [
+                        {
+                            "id": "1",
+                            "libelle": "Hydratez-vous",
+                            "description": "Buvez au moins 1,5L d'eau par jour.",
+                            "zone_geographique": "662f1e7b8e4b0c001e8b4567",
+                            "created_at": "2024-07-24T12:00:00Z",
+                            "updated_at": "2024-07-24T12:00:00Z"
+                        }
+                    ]
+                }
             }
         )}
     )
+    @conditionnel(Recommandation, ZoneGeographique, secondaire=True)
     def list(self, request):
-        recommandations = Recommandation.objects.all()
-        serializer = RecommandationSerializer(recommandations, many=True)
-        return Response(serializer.data)
+        return page(PaginationCurseur(tri='-id'), lecture_secondaire(Recommandation.objects.all()), request, RecommandationSerializer)
     
     @swagger_auto_schema(
         operation_description="Créer une recommandation.",
@@ -69,13 +78,13 @@ class RecommandationViewSet(viewsets.ViewSet):
             return Response(RecommandationSerializer(recommandation).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @swagger_auto_schema(manual_parameters=PARAMETRES_SELECTION)
+    @conditionnel(Recommandation, ZoneGeographique)
     def retrieve(self, request, pk=None):
-        try:
-            recommandation = Recommandation.objects.get(id=pk)
-            serializer = RecommandationSerializer(recommandation)
-            return Response(serializer.data)
-        except Recommandation.DoesNotExist:
+        data = element(Recommandation.objects(id=pk), request, RecommandationSerializer)
+        if data is None:
             return Response({'error': 'Recommandation introuvable'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
     
     def update(self, request, pk=None):
         try:
@@ -96,7 +105,10 @@ class RecommandationViewSet(viewsets.ViewSet):
         except Recommandation.DoesNotExist:
             return Response({'error': 'Recommandation introuvable'}, status=status.HTTP_404_NOT_FOUND)
     
+    @swagger_auto_schema(manual_parameters=PARAMETRES_SELECTION + [PARAMETRE_FLUX])
     @action(detail=False, methods=['get'])
+    @conditionnel(Recommandation, ZoneGeographique, secondaire=True)
+    @en_cache(Recommandation, ZoneGeographique)
     def par_zone(self, request):
         """Récupérer les recommandations par zone géographique"""
         zone_id = request.query_params.get('zone_id')
@@ -109,9 +121,9 @@ class RecommandationViewSet(viewsets.ViewSet):
         
         try:
             zone = ZoneGeographique.objects.get(id=zone_id)
-            recommandations = Recommandation.objects.filter(zone_geographique=zone)
-            serializer = RecommandationSerializer(recommandations, many=True)
-            return Response(serializer.data)
+            return page(
+                PaginationCurseur(tri='-id'), lecture_secondaire(Recommandation.objects.filter(zone_geographique=zone)), request, RecommandationSerializer
+            )
         except ZoneGeographique.DoesNotExist:
             return Response(
                 {'error': 'Zone géographique introuvable'}, 
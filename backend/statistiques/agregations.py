@@ -0,0 +1,128 @@
+from django.conf import settings
+from utils.mongo import lecture_secondaire
+from vagues_chaleur.models import VagueChaleur
+from .models import Statistique
+
+
+def arrondi(valeur, chiffres=2):
+    return round(valeur, chiffres) if valeur is not None else None
+
+
+def resume_global():
+    """Totaux des statistiques calculés par MongoDB ($group), None si la collection est vide"""
+    resultat = list(lecture_secondaire(Statistique.objects).aggregate([
+        {'$group': {
+            '_id': None,
+            'total_statistiques': {'$sum': 1},
+            'total_vagues_enregistrees': {'$sum': '$nombre_vague'},
+            'temperature_moyenne_globale': {'$avg': '$temperature_moyenne'},
+        }},
+    ]))
+    if not resultat or not resultat[0]['total_statistiques']:
+        return None
+    resume = resultat[0]
+    return {
+        'total_statistiques': resume['total_statistiques'],
+        'total_vagues_enregistrees': resume['total_vagues_enregistrees'],
+        'temperature_moyenne_globale': arrondi(resume['temperature_moyenne_globale'])
+    }
+
+
+def mesures_vagues():
+    """Accumulateurs communs aux répartitions des vagues de chaleur"""
+    return {
+        'nombre_vagues': {'$sum': 1},
+        'temperature_max_moyenne': {'$avg': '$temperature_max'},
+        'temperature_max_record': {'$max': '$temperature_max'},
+        'intensite_moyenne': {'$avg': '$intensite'},
+        'humidite_moyenne': {'$avg': '$humidite'},
+    }
+
+
+def formater_mesures(groupe):
+    return {
+        'nombre_vagues': groupe['nombre_vagues'],
+        'temperature_max_moyenne': arrondi(groupe['temperature_max_moyenne']),
+        'temperature_max_record': groupe['temperature_max_record'],
+        'intensite_moyenne': arrondi(groupe['intensite_moyenne']),
+        'humidite_moyenne': arrondi(groupe['humidite_moyenne']),
+    }
+
+
+def repartitions(debut=None, fin=None, limite_zones=50):
+    """
+    Répartitions des vagues par zone, par mois (de date_debut) et par bande
+    d'intensité, calculées en une seule agrégation $facet côté serveur.
+    """
+    filtre = {}
+    if debut is not None:
+        filtre.setdefault('date_debut', {})['$gte'] = debut
+    if fin is not None:
+        filtre.setdefault('date_debut', {})['$lt'] = fin
+    
+    bandes = getattr(settings, 'STATISTIQUES_BANDES_INTENSITE', [0, 1, 2, 3, 4, 5])
+    pipeline = [{'$match': filtre}] if filtre else []
+    pipeline.append({'$facet': {
+        'par_zone': [
+            {'$group': {'_id': '$zone_geographique', **mesures_vagues()}},
+            {'$sort': {'nombre_vagues': -1, '_id': 1}},
+            {'$limit': limite_zones},
+            {'$lookup': {
+                'from': 'zones_geographiques',
+                'localField': '_id',
+                'foreignField': '_id',
+                'as': 'zone',
+            }},
+            {'$set': {'zone': {'$arrayElemAt': ['$zone', 0]}}},
+            {'$project': {'zone.ville': 1, 'zone.rue': 1, 'zone.numero': 1, **{c: 1 for c in mesures_vagues()}}},
+        ],
+        'par_mois': [
+            {'$group': {
+                '_id': {'$dateToString': {'format': '%Y-%m', 'date': '$date_debut'}},
+                **mesures_vagues()
+            }},
+            {'$sort': {'_id': 1}},
+        ],
+        'par_intensite': [
+            {'$bucket': {
+                'groupBy': '$intensite',
+                'boundaries': bandes,
+                'default': 'hors_bandes',
+                'output': mesures_vagues(),
+            }},
+        ],
+    }})
+    
+    resultat = next(lecture_secondaire(VagueChaleur.objects).aggregate(pipeline))
+    
+    par_zone = []
+    for groupe in resultat['par_zone']:
+        zone = groupe.get('zone') or {}
+        par_zone.append({
+            'zone_geographique_id': str(groupe['_id']) if groupe['_id'] else None,
+            'ville': zone.get('ville'),
+            'rue': zone.get('rue'),
+            'numero': zone.get('numero'),
+            **formater_mesures(groupe)
+        })
+    
+    par_mois = [{'mois': groupe['_id'], **formater_mesures(groupe)} for groupe in resultat['par_mois']]
+    
+    bornes = dict(zip(bandes, bandes[1:]))
+    par_intensite = []
+    for groupe in resultat['par_intensite']:
+        if groupe['_id'] == 'hors_bandes':
+            bande = {'bande': 'hors_bandes', 'intensite_min': None, 'intensite_max': None}
+        else:
+            bande = {
+                'bande': f"{groupe['_id']}-{bornes[groupe['_id']]}",
+                'intensite_min': groupe['_id'],
+                'intensite_max': bornes[groupe['_id']],
+            }
+        par_intensite.append({**bande, **formater_mesures(groupe)})
+    
+    return {
+        'par_zone': par_zone,
+        'par_mois': par_mois,
+        'par_intensite': par_intensite,
+    }
@@ -0,0 +1,139 @@
+import datetime
+from pymongo import UpdateOne
+from utils.prefetch import id_reference
+from vagues_chaleur.models import VagueChaleur
+from .models import CumulVagues
+
+TOUTES_PERIODES = 'tout'
+
+# Champs d'une vague qui entrent dans les cumuls
+CHAMPS_CUMULES = ('zone_geographique', 'date_debut', 'temperature_max', 'intensite')
+
+
+def periode(date):
+    """Mois 'AAAA-MM' (UTC) d'une date de début"""
+    if date.tzinfo is not None:
+        date = date.astimezone(datetime.timezone.utc)
+    return date.strftime('%Y-%m')
+
+
+def bornes_periode(mois):
+    debut = datetime.datetime.strptime(mois, '%Y-%m')
+    fin = (debut + datetime.timedelta(days=32)).replace(day=1)
+    return debut, fin
+
+
+def contribution(vague):
+    """Valeurs d'une vague utiles aux cumuls, depuis un document ou un dictionnaire brut"""
+    if isinstance(vague, dict):
+        return {
+            'zone': vague.get('zone_geographique'),
+            'periode': periode(vague['date_debut']),
+            'temperature': vague['temperature_max'],
+            'intensite': vague['intensite'],
+        }
+    return {
+        'zone': id_reference(vague._data.get('zone_geographique')),
+        'periode': periode(vague.date_debut),
+        'temperature': vague.temperature_max,
+        'intensite': vague.intensite,
+    }
+
+
+def cles(contribution):
+    """Les cumuls touchés par une vague : (zone, mois), (zone, tout) et leurs équivalents toutes zones"""
+    zones = [None] if contribution['zone'] is None else [contribution['zone'], None]
+    return [
+        {'zone': zone, 'periode': periode}
+        for zone in zones
+        for periode in (contribution['periode'], TOUTES_PERIODES)
+    ]
+
+
+def ajouter(contribution):
+    maintenant = datetime.datetime.now(datetime.timezone.utc)
+    temperature = contribution['temperature']
+    CumulVagues._get_collection().bulk_write([
+        UpdateOne(cle, {
+            '$inc': {
+                'nombre': 1,
+                'somme_temperature': temperature,
+                'somme_intensite': contribution['intensite'],
+            },
+            '$min': {'temperature_min': temperature},
+            '$max': {'temperature_max': temperature},
+            '$set': {'updated_at': maintenant},
+        }, upsert=True)
+        for cle in cles(contribution)
+    ], ordered=False)
+
+
+def retirer(contribution):
+    """
+    Décrémente les cumuls. Un minimum ou un maximum ne se décrémente pas : si la
+    vague retirée en était un, il est recalculé sur les vagues restantes.
+    """
+    collection = CumulVagues._get_collection()
+    maintenant = datetime.datetime.now(datetime.timezone.utc)
+    temperature = contribution['temperature']
+    a_recalculer = []
+    for cle in cles(contribution):
+        cumul = collection.find_one_and_update(cle, {
+            '$inc': {
+                'nombre': -1,
+                'somme_temperature': -temperature,
+                'somme_intensite': -contribution['intensite'],
+            },
+            '$set': {'updated_at': maintenant},
+        }, projection={'nombre': 1, 'temperature_min': 1, 'temperature_max': 1})
+        if cumul is None:
+            continue
+        if cumul['nombre'] <= 1:
+            collection.delete_one({**cle, 'nombre': {'$lte': 0}})
+        elif temperature <= cumul['temperature_min'] or temperature >= cumul['temperature_max']:
+            a_recalculer.append(cle)
+
+    for cle in a_recalculer:
+        extremes = list(VagueChaleur.objects(**filtre_vagues(cle)).aggregate([
+            {'$group': {
+                '_id': None,
+                'temperature_min': {'$min': '$temperature_max'},
+                'temperature_max': {'$max': '$temperature_max'},
+            }},
+        ]))
+        if extremes:
+            collection.update_one(cle, {'$set': {
+                'temperature_min': extremes[0]['temperature_min'],
+                'temperature_max': extremes[0]['temperature_max'],
+            }})
+
+
+def filtre_vagues(cle):
+    """Filtre mongoengine des vagues d'un cumul"""
+    filtre = {}
+    if cle['zone'] is not None:
+        filtre['zone_geographique'] = cle['zone']
+    if cle['periode'] != TOUTES_PERIODES:
+        debut, fin = bornes_periode(cle['periode'])
+        filtre['date_debut__gte'] = debut
+        filtre['date_debut__lt'] = fin
+    return filtre
+
+
+def arrondi(valeur):
+    return round(valeur, 2) if valeur is not None else None
+
+
+def representation(cumul):
+    """Représentation API d'un cumul brut (dictionnaire Mongo)"""
+    nombre = cumul.get('nombre', 0)
+    return {
+        'zone_geographique_id': str(cumul['zone']) if cumul.get('zone') else None,
+        'periode': cumul['periode'],
+        'nombre_vagues': nombre,
+        'temperature_max_moyenne': arrondi(cumul['somme_temperature'] / nombre) if nombre else None,
+        'temperature_max_min': cumul.get('temperature_min'),
+        'temperature_max_record': cumul.get('temperature_max'),
+        'intensite_moyenne': arrondi(cumul['somme_intensite'] / nombre) if nombre else None,
+        'updated_at': cumul.get('updated_at'),
+    }
@@ -0,0 +1,11 @@
+from utils.indexes import declarer
+from .models import Statistique, CumulVagues
+
+# Index unique de vague_chaleur : filtre par vague
+declarer(Statistique)
+
+declarer(
+    CumulVagues,
+    # Un cumul par zone et par période, lu et incrémenté par cette clé
+    {'fields': ['zone', 'periode'], 'unique': True},
+)
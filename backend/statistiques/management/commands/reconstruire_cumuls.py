@@ -0,0 +1,97 @@
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from pymongo import ReplaceOne
+from vagues_chaleur.models import VagueChaleur
+from statistiques.models import CumulVagues
+from statistiques.cumuls import TOUTES_PERIODES
+
+
+def fusionner(cumuls, cle, partiel):
+    cumul = cumuls.get(cle)
+    if cumul is None:
+        cumuls[cle] = dict(partiel)
+        return
+    cumul['nombre'] += partiel['nombre']
+    cumul['somme_temperature'] += partiel['somme_temperature']
+    cumul['somme_intensite'] += partiel['somme_intensite']
+    cumul['temperature_min'] = min(cumul['temperature_min'], partiel['temperature_min'])
+    cumul['temperature_max'] = max(cumul['temperature_max'], partiel['temperature_max'])
+
+
+class Command(BaseCommand):
+    help = ("Recalcule entièrement les cumuls des vagues de chaleur (par zone et "
+            "par mois) en agrégeant la collection par tranches d'_id en parallèle.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tranches', type=int, default=16,
+                            help="Nombre de tranches d'_id agrégées séparément")
+        parser.add_argument('--workers', type=int, default=4,
+                            help="Nombre d'agrégations exécutées en parallèle")
+
+    def handle(self, *args, **options):
+        debut = datetime.datetime.now(datetime.timezone.utc)
+        collection = VagueChaleur._get_collection()
+
+        # Bornes de tranches de tailles égales calculées par le serveur
+        bornes = [
+            tranche['_id']['min']
+            for tranche in collection.aggregate([
+                {'$bucketAuto': {'groupBy': '$_id', 'buckets': max(1, options['tranches'])}},
+            ])
+        ]
+        intervalles = list(zip(bornes, bornes[1:] + [None]))
+
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            partiels = pool.map(lambda intervalle: self.agreger(collection, *intervalle), intervalles)
+            cumuls = {}
+            for resultats in partiels:
+                for partiel in resultats:
+                    zone, mois = partiel['_id'].get('zone'), partiel['_id']['periode']
+                    zones = [None] if zone is None else [zone, None]
+                    for cle_zone in zones:
+                        for cle_periode in (mois, TOUTES_PERIODES):
+                            fusionner(cumuls, (cle_zone, cle_periode), partiel)
+
+        operations = [
+            ReplaceOne({'zone': zone, 'periode': periode}, {
+                'zone': zone,
+                'periode': periode,
+                'nombre': cumul['nombre'],
+                'somme_temperature': cumul['somme_temperature'],
+                'somme_intensite': cumul['somme_intensite'],
+                'temperature_min': cumul['temperature_min'],
+                'temperature_max': cumul['temperature_max'],
+                'updated_at': debut,
+            }, upsert=True)
+            for (zone, periode), cumul in cumuls.items()
+        ]
+        destination = CumulVagues._get_collection()
+        if operations:
+            destination.bulk_write(operations, ordered=False)
+        # Les cumuls non réécrits ni modifiés depuis le début ne correspondent plus à aucune vague
+        supprimes = destination.delete_many({'updated_at': {'$lt': debut}}).deleted_count
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(operations)} cumul(s) reconstruit(s) depuis {len(intervalles)} tranche(s), "
+            f"{supprimes} cumul(s) obsolète(s) supprimé(s)"
+        ))
+
+    def agreger(self, collection, debut, fin):
+        filtre = {'$gte': debut}
+        if fin is not None:
+            filtre['$lt'] = fin
+        return list(collection.aggregate([
+            {'$match': {'_id': filtre}},
+            {'$group': {
+                '_id': {
+                    'zone': '$zone_geographique',
+                    'periode': {'$dateToString': {'format': '%Y-%m', 'date': '$date_debut'}},
+                },
+                'nombre': {'$sum': 1},
+                'somme_temperature': {'$sum': '$temperature_max'},
+                'somme_intensite': {'$sum': '$intensite'},
+                'temperature_min': {'$min': '$temperature_max'},
+                'temperature_max': {'$max': '$temperature_max'},
+            }},
+        ]))
@@ -1,17 +1,15 @@
-import datetime
-from mongoengine import Document, FloatField, IntField, DateTimeField, ReferenceField
+from mongoengine import Document, FloatField, IntField, DateTimeField, ReferenceField, StringField
 from vagues_chaleur.models import VagueChaleur
+from zones_geographiques.models import ZoneGeographique
+from utils.horodatage import Horodate
 
-class Statistique(Document):
+class Statistique(Horodate):
     temperature_moyenne = FloatField(required=True)
     nombre_vague = IntField(required=True)
     
     # Relations
     # Une statistique est liée à une vague de chaleur (1 vers 1)
     vague_chaleur = ReferenceField(VagueChaleur, required=True, unique=True)
-    
-    created_at = DateTimeField(default=datetime.datetime.now(datetime.timezone.utc))
-    updated_at = DateTimeField(default=datetime.datetime.now(datetime.timezone.utc))
 
     def __str__(self):
         return f"Statistique - Temp moy: {self.temperature_moyenne}°C, Nb vagues: {self.nombre_vague}"
@@ -20,3 +18,25 @@ class Statistique(Document):
         'collection': 'statistiques'
     }
 
+
+class CumulVagues(Document):
+    """
+    Cumul des vagues de chaleur d'une zone (ou de toutes les zones si zone est
+    vide) sur une période : un mois 'AAAA-MM' ou 'tout'. Maintenu par des
+    incréments atomiques à chaque écriture d'une VagueChaleur.
+    """
+    zone = ReferenceField(ZoneGeographique)
+    periode = StringField(required=True, max_length=7)
+    nombre = IntField(default=0)
+    somme_temperature = FloatField(default=0.0)
+    somme_intensite = FloatField(default=0.0)
+    temperature_min = FloatField()
+    temperature_max = FloatField()
+    updated_at = DateTimeField()
+
+    def __str__(self):
+        return f"Cumul {self.periode} - {self.nombre} vague(s)"
+
+    meta = {
+        'collection': 'cumuls_vagues',
+    }
@@ -0,0 +1,13 @@
+from utils.brut import Mappeur, Lecture, Reference
+from vagues_chaleur.models import VagueChaleur
+from .models import Statistique
+
+CHAMPS_STATISTIQUE = ('temperature_moyenne', 'nombre_vague', 'created_at', 'updated_at')
+CHAMPS_VAGUE = ('temperature_max', 'intensite', 'date_debut', 'date_fin')
+
+
+class LectureStatistiques(Lecture):
+    mappeur = Mappeur(Statistique, CHAMPS_STATISTIQUE)
+    relations = {
+        'vague_chaleur': Reference(VagueChaleur, Mappeur(VagueChaleur, CHAMPS_VAGUE)),
+    }
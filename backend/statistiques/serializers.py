@@ -1,8 +1,10 @@
 from rest_framework import serializers
 from .models import Statistique
 from vagues_chaleur.models import VagueChaleur
+from utils.prefetch import PrefetchMixin
+from .representations import LectureStatistiques
 
-class StatistiqueSerializer(serializers.Serializer):
+class StatistiqueSerializer(PrefetchMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     temperature_moyenne = serializers.FloatField()
     nombre_vague = serializers.IntegerField()
@@ -10,6 +12,13 @@ class StatistiqueSerializer(serializers.Serializer):
     created_at = serializers.DateTimeField(read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
     
+    # Listes : lecture des documents bruts, à l'identique de to_representation
+    lecture_brute = LectureStatistiques()
+    
+    references_prechargees = {
+        'vague_chaleur': (VagueChaleur, ('temperature_max', 'intensite', 'date_debut', 'date_fin')),
+    }
+    
     def create(self, validated_data):
         vague_chaleur_id = validated_data.pop('vague_chaleur_id')
         try:
@@ -48,13 +57,14 @@ class StatistiqueSerializer(serializers.Serializer):
         }
         
         # Ajouter les informations de la vague de chaleur
-        if instance.vague_chaleur:
+        vague_chaleur = self.reference(instance, 'vague_chaleur')
+        if vague_chaleur:
             data['vague_chaleur'] = {
-                'id': str(instance.vague_chaleur.id),
-                'temperature_max': instance.vague_chaleur.temperature_max,
-                'intensite': instance.vague_chaleur.intensite,
-                'date_debut': instance.vague_chaleur.date_debut,
-                'date_fin': instance.vague_chaleur.date_fin
+                'id': str(vague_chaleur.id),
+                'temperature_max': vague_chaleur.temperature_max,
+                'intensite': vague_chaleur.intensite,
+                'date_debut': vague_chaleur.date_debut,
+                'date_fin': vague_chaleur.date_fin
             }
         
         return data
@@ -0,0 +1,50 @@
+from mongoengine import signals
+from vagues_chaleur.models import VagueChaleur, mise_a_jour_groupee
+from . import cumuls
+
+
+def memoriser_contribution(sender, document, **kwargs):
+    """Avant une mise à jour, relit l'ancienne contribution de la vague si un champ cumulé change"""
+    if document.pk is None:
+        return
+    modifies = {champ.split('.')[0] for champ in document._get_changed_fields()}
+    if modifies.isdisjoint(cumuls.CHAMPS_CUMULES):
+        return
+    precedente = VagueChaleur._get_collection().find_one(
+        {'_id': document.pk}, {champ: 1 for champ in cumuls.CHAMPS_CUMULES}
+    )
+    if precedente is not None:
+        document._contribution_precedente = cumuls.contribution(precedente)
+
+
+def appliquer_sauvegarde(sender, document, created=False, **kwargs):
+    if created:
+        cumuls.ajouter(cumuls.contribution(document))
+        return
+    precedente = document.__dict__.pop('_contribution_precedente', None)
+    if precedente is not None:
+        cumuls.retirer(precedente)
+        cumuls.ajouter(cumuls.contribution(document))
+
+
+def appliquer_suppression(sender, document, **kwargs):
+    cumuls.retirer(cumuls.contribution(document))
+
+
+def appliquer_mise_a_jour(sender, avant, apres, **kwargs):
+    """Mise à jour groupée : chaque vague dont la contribution change est retirée puis rajoutée"""
+    precedentes = {document['_id']: cumuls.contribution(document) for document in avant}
+    for document in apres:
+        nouvelle = cumuls.contribution(document)
+        precedente = precedentes.get(document['_id'])
+        if precedente == nouvelle:
+            continue
+        if precedente is not None:
+            cumuls.retirer(precedente)
+        cumuls.ajouter(nouvelle)
+
+
+signals.pre_save.connect(memoriser_contribution, sender=VagueChaleur)
+signals.post_save.connect(appliquer_sauvegarde, sender=VagueChaleur)
+signals.post_delete.connect(appliquer_suppression, sender=VagueChaleur)
+mise_a_jour_groupee.connect(appliquer_mise_a_jour, sender=VagueChaleur)
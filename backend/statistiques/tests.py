@@ -1,3 +1,116 @@
-from django.test import TestCase
+import datetime
+from utils.essais import TestMongo, creer_zone, creer_vague
+from vagues_chaleur.models import VagueChaleur
+from .models import Statistique
 
-# Create your tests here.
+
+class RequetesListesTests(TestMongo):
+    """Les listes font un nombre de requêtes indépendant du nombre de lignes (références chargées par $in)"""
+
+    def setUp(self):
+        super().setUp()
+        self.vagues = []
+
+    def ajouter(self, nombre):
+        for _ in range(nombre):
+            vague = creer_vague(creer_zone(len(self.vagues) + 1))
+            self.vagues.append(vague)
+            Statistique(temperature_moyenne=38.5, nombre_vague=1, vague_chaleur=vague).save()
+
+    def urls(self):
+        return [
+            '/api/statistiques/',
+            f'/api/statistiques/par_vague/?vague_id={self.vagues[0].id}',
+        ]
+
+    def test_nombre_de_requetes_constant(self):
+        self.assertRequetesConstantes(self.ajouter, self.urls)
+
+    def test_lecture_brute_identique(self):
+        self.ajouter(3)
+        statistique = Statistique.objects.first()
+        self.assertLecturesIdentiques(self.urls() + [f'/api/statistiques/{statistique.id}/'])
+
+
+class CumulsTests(TestMongo):
+    """Cumuls maintenus à chaque écriture de vague : $inc, puis $min/$max recalculés au retrait d'un extrême"""
+
+    def setUp(self):
+        super().setUp()
+        self.zone = creer_zone()
+        self.vagues = [self.vague(temperature) for temperature in (40.0, 45.0, 38.0, 42.0)]
+        # Autre mois, même zone : seul le cumul 'tout' de la zone la compte
+        self.aout = self.vague(50.0, mois=8)
+
+    def vague(self, temperature, mois=7):
+        debut = datetime.datetime(2025, mois, 10, tzinfo=datetime.timezone.utc)
+        return creer_vague(self.zone, temperature_max=temperature, intensite=temperature / 10, date_debut=debut)
+
+    def cumul(self, periode, zone=True):
+        parametres = f'periode={periode}' + (f'&zone_id={self.zone.id}' if zone else '')
+        reponse = self.client.get(f'/api/statistiques/cumuls/?{parametres}')
+        self.assertEqual(reponse.status_code, 200)
+        donnees = reponse.json()
+        return (
+            donnees['nombre_vagues'], donnees['temperature_max_min'],
+            donnees['temperature_max_record'], donnees['temperature_max_moyenne'],
+        )
+
+    def attendu(self, vagues):
+        temperatures = [vague.temperature_max for vague in vagues]
+        if not temperatures:
+            return 0, None, None, None
+        return len(temperatures), min(temperatures), max(temperatures), round(sum(temperatures) / len(temperatures), 2)
+
+    def verifier(self):
+        juillet = self.vagues
+        self.assertEqual(self.cumul('2025-07'), self.attendu(juillet))
+        self.assertEqual(self.cumul('tout'), self.attendu(juillet + [self.aout]))
+        self.assertEqual(self.cumul('tout', zone=False), self.attendu(juillet + [self.aout]))
+
+    def test_creations(self):
+        self.verifier()
+
+    def test_suppression_des_extremes(self):
+        for temperature in (45.0, 38.0):
+            vague = next(v for v in self.vagues if v.temperature_max == temperature)
+            vague.delete()
+            self.vagues.remove(vague)
+            self.verifier()
+
+    def test_suppression_de_toutes_les_vagues(self):
+        for vague in self.vagues:
+            vague.delete()
+        self.vagues = []
+        self.verifier()
+        self.assertEqual(self.cumul('2025-08'), self.attendu([self.aout]))
+
+    def test_mises_a_jour_par_queryset(self):
+        maximum = next(v for v in self.vagues if v.temperature_max == 45.0)
+        VagueChaleur.objects(id=maximum.id).update(set__temperature_max=39.0)
+        maximum.temperature_max = 39.0
+        self.verifier()
+
+        # Changement de mois et de zone de plusieurs vagues en une écriture
+        autre_zone = creer_zone(2)
+        deplacees = [v for v in self.vagues if v.temperature_max < 41.0]
+        VagueChaleur.objects(id__in=[v.id for v in deplacees]).update(
+            set__zone_geographique=autre_zone, set__date_debut=datetime.datetime(2025, 8, 1)
+        )
+        restantes = [v for v in self.vagues if v not in deplacees]
+        self.assertEqual(self.cumul('2025-07'), self.attendu(restantes))
+        self.assertEqual(self.cumul('tout'), self.attendu(restantes + [self.aout]))
+        self.assertEqual(self.cumul('2025-08'), self.attendu([self.aout]))
+        self.assertEqual(self.cumul('2025-08', zone=False), self.attendu([self.aout] + deplacees))
+        self.assertEqual(self.cumul('tout', zone=False), self.attendu(self.vagues + [self.aout]))
+
+        VagueChaleur.objects(id=self.aout.id).modify(set__temperature_max=30.0)
+        self.aout.temperature_max = 30.0
+        self.assertEqual(self.cumul('2025-08'), self.attendu([self.aout]))
+        self.assertEqual(self.cumul('tout', zone=False), self.attendu(self.vagues + [self.aout]))
+
+    def test_modification_du_maximum(self):
+        maximum = next(v for v in self.vagues if v.temperature_max == 45.0)
+        maximum.temperature_max = 39.0
+        maximum.save()
+        self.verifier()
@@ -1,35 +1,61 @@
 from rest_framework import status, viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from .models import Statistique
+from .models import Statistique, CumulVagues
 from .serializers import StatistiqueSerializer
+from . import agregations, cumuls
 from vagues_chaleur.models import VagueChaleur
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from utils.swagger_decorators import PARAMETRES_SELECTION, PARAMETRE_FLUX
+from utils.pagination import PaginationCurseur
+from utils.brut import page, element
+from utils.mongo import lecture_secondaire
+from utils.conditionnel import conditionnel
+from utils.cache_reponses import en_cache
+from django.utils.dateparse import parse_datetime
+import datetime
+from bson import ObjectId
+
+
+def lire_date(valeur):
+    """Date ISO 8601 d'un paramètre de requête (UTC si sans fuseau), None si absente"""
+    if not valeur:
+        return None
+    date = parse_datetime(valeur)
+    if date is None:
+        raise ValueError(valeur)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return date
+
 
 class StatistiqueViewSet(viewsets.ViewSet):
     @swagger_auto_schema(
+        manual_parameters=PARAMETRES_SELECTION + [PARAMETRE_FLUX],
         operation_description="Lister toutes les statistiques.",
         responses={200: openapi.Response(
             description="Liste des statistiques",
             examples={
-                "application/json": [
-                    {
-                        "id": "1",
-                        "nombre_vague": 3,
-                        "temperature_moyenne": 41.2,
-                        "vague_chaleur": "662f1e7b8e4b0c001e8b4568",
-                        "created_at": "2024-07-24T12:00:00Z",
-                        "updated_at": "2024-07-24T12:00:00Z"
-                    }
-                ]
+                "application/json": {
+                    "next": "http://localhost:8000/api/statistiques/?curseur=W3siJG9pZCI6ICI2NjJmMWU3YjhlNGIwYzAwMWU4YjQ1NjcifSwgeyIkb2lkIjogIjY2MmYxZTdiOGU0YjBjMDAxZThiNDU2NyJ9XQ",
+                    "results": [
+                        {
+                            "id": "1",
+                            "nombre_vague": 3,
+                            "temperature_moyenne": 41.2,
+                            "vague_chaleur": "662f1e7b8e4b0c001e8b4568",
+                            "created_at": "2024-07-24T12:00:00Z",
+                            "updated_at": "2024-07-24T12:00:00Z"
+                        }
+                    ]
+                }
             }
         )}
     )
+    @conditionnel(Statistique, VagueChaleur, secondaire=True)
     def list(self, request):
-        statistiques = Statistique.objects.all()
-        serializer = StatistiqueSerializer(statistiques, many=True)
-        return Response(serializer.data)
+        return page(PaginationCurseur(tri='-id'), lecture_secondaire(Statistique.objects.all()), request, StatistiqueSerializer)
     
     @swagger_auto_schema(
         operation_description="Créer une statistique.",
@@ -69,13 +95,13 @@ class StatistiqueViewSet(viewsets.ViewSet):
             return Response(StatistiqueSerializer(statistique).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @swagger_auto_schema(manual_parameters=PARAMETRES_SELECTION)
+    @conditionnel(Statistique, VagueChaleur)
     def retrieve(self, request, pk=None):
-        try:
-            statistique = Statistique.objects.get(id=pk)
-            serializer = StatistiqueSerializer(statistique)
-            return Response(serializer.data)
-        except Statistique.DoesNotExist:
+        data = element(Statistique.objects(id=pk), request, StatistiqueSerializer)
+        if data is None:
             return Response({'error': 'Statistique introuvable'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
     
     def update(self, request, pk=None):
         try:
@@ -96,7 +122,9 @@ class StatistiqueViewSet(viewsets.ViewSet):
         except Statistique.DoesNotExist:
             return Response({'error': 'Statistique introuvable'}, status=status.HTTP_404_NOT_FOUND)
     
+    @swagger_auto_schema(manual_parameters=PARAMETRES_SELECTION)
     @action(detail=False, methods=['get'])
+    @conditionnel(Statistique, VagueChaleur, secondaire=True)
     def par_vague(self, request):
         """Récupérer les statistiques par vague de chaleur"""
         vague_id = request.query_params.get('vague_id')
@@ -109,11 +137,10 @@ class StatistiqueViewSet(viewsets.ViewSet):
         
         try:
             vague = VagueChaleur.objects.get(id=vague_id)
-            statistique = Statistique.objects.filter(vague_chaleur=vague).first()
+            data = element(lecture_secondaire(Statistique.objects.filter(vague_chaleur=vague)), request, StatistiqueSerializer)
             
-            if statistique:
-                serializer = StatistiqueSerializer(statistique)
-                return Response(serializer.data)
+            if data is not None:
+                return Response(data)
             else:
                 return Response(
                     {'message': 'Aucune statistique trouvée pour cette vague de chaleur'}, 
@@ -126,20 +153,129 @@ class StatistiqueViewSet(viewsets.ViewSet):
             )
     
     @action(detail=False, methods=['get'])
+    @en_cache(Statistique)
     def resume_global(self, request):
-        """Récupérer un résumé global des statistiques"""
-        statistiques = Statistique.objects.all()
+        """Récupérer un résumé global des statistiques (agrégation MongoDB)"""
+        resume = agregations.resume_global()
         
-        if not statistiques:
+        if resume is None:
             return Response({'message': 'Aucune statistique disponible'})
         
-        # Calculer des métriques globales
-        total_vagues = sum(stat.nombre_vague for stat in statistiques)
-        temp_moyenne_globale = sum(stat.temperature_moyenne for stat in statistiques) / len(statistiques)
+        return Response(resume)
+    
+    @swagger_auto_schema(
+        operation_description="Résumé détaillé : totaux et répartitions des vagues de chaleur "
+            "par zone, par mois et par bande d'intensité, calculés côté serveur.",
+        manual_parameters=[
+            openapi.Parameter('debut', openapi.IN_QUERY, description="Vagues débutant à partir de cette date (ISO 8601)", type=openapi.TYPE_STRING, format="date-time"),
+            openapi.Parameter('fin', openapi.IN_QUERY, description="Vagues débutant avant cette date (ISO 8601)", type=openapi.TYPE_STRING, format="date-time"),
+        ],
+        responses={
+            200: openapi.Response(
+                description="Résumé détaillé",
+                examples={
+                    "application/json": {
+                        "total_statistiques": 12,
+                        "total_vagues_enregistrees": 30,
+                        "temperature_moyenne_globale": 41.2,
+                        "par_zone": [
+                            {
+                                "zone_geographique_id": "662f1e7b8e4b0c001e8b4567",
+                                "ville": "Dakar",
+                                "rue": "Avenue Cheikh Anta Diop",
+                                "numero": 12,
+                                "nombre_vagues": 4,
+                                "temperature_max_moyenne": 43.5,
+                                "temperature_max_record": 46.0,
+                                "intensite_moyenne": 2.1,
+                                "humidite_moyenne": 0.35
+                            }
+                        ],
+                        "par_mois": [
+                            {"mois": "2024-07", "nombre_vagues": 3, "temperature_max_moyenne": 44.1, "temperature_max_record": 46.0, "intensite_moyenne": 2.4, "humidite_moyenne": 0.3}
+                        ],
+                        "par_intensite": [
+                            {"bande": "2-3", "intensite_min": 2, "intensite_max": 3, "nombre_vagues": 5, "temperature_max_moyenne": 43.0, "temperature_max_record": 45.5, "intensite_moyenne": 2.5, "humidite_moyenne": 0.32}
+                        ]
+                    }
+                }
+            ),
+            400: openapi.Response(
+                description="Date invalide",
+                examples={"application/json": {"error": "debut et fin doivent être des dates ISO 8601"}}
+            ),
+        }
+    )
+    @action(detail=False, methods=['get'])
+    def resume_detaille(self, request):
+        """Récupérer le résumé global enrichi des répartitions par zone, mois et intensité"""
+        try:
+            debut = lire_date(request.query_params.get('debut'))
+            fin = lire_date(request.query_params.get('fin'))
+        except ValueError:
+            return Response(
+                {'error': 'debut et fin doivent être des dates ISO 8601'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        return Response({
-            'total_statistiques': len(statistiques),
-            'total_vagues_enregistrees': total_vagues,
-            'temperature_moyenne_globale': round(temp_moyenne_globale, 2)
-        })
+        resume = agregations.resume_global() or {
+            'total_statistiques': 0,
+            'total_vagues_enregistrees': 0,
+            'temperature_moyenne_globale': None
+        }
+        resume.update(agregations.repartitions(debut, fin))
+        return Response(resume)
+    
+    @swagger_auto_schema(
+        operation_description="Cumuls des vagues de chaleur maintenus en continu : un document "
+            "par zone et par période, lu sans parcourir l'historique.",
+        manual_parameters=[
+            openapi.Parameter('zone_id', openapi.IN_QUERY, description="ID de la zone (toutes les zones si absent)", type=openapi.TYPE_STRING),
+            openapi.Parameter('periode', openapi.IN_QUERY, description="Mois AAAA-MM, ou 'tout' (par défaut)", type=openapi.TYPE_STRING),
+        ],
+        responses={
+            200: openapi.Response(
+                description="Cumul de la zone sur la période",
+                examples={
+                    "application/json": {
+                        "zone_geographique_id": "662f1e7b8e4b0c001e8b4567",
+                        "periode": "2024-07",
+                        "nombre_vagues": 3,
+                        "temperature_max_moyenne": 44.1,
+                        "temperature_max_min": 42.0,
+                        "temperature_max_record": 46.0,
+                        "intensite_moyenne": 2.4,
+                        "updated_at": "2024-07-24T12:00:00Z"
+                    }
+                }
+            ),
+            400: openapi.Response(
+                description="Paramètre invalide",
+                examples={"application/json": {"error": "periode doit être au format AAAA-MM ou 'tout'"}}
+            ),
+        }
+    )
+    @action(detail=False, methods=['get'])
+    def cumuls(self, request):
+        """Récupérer le cumul d'une zone (ou de toutes les zones) sur une période"""
+        zone_id = request.query_params.get('zone_id')
+        periode = request.query_params.get('periode', cumuls.TOUTES_PERIODES)
+        
+        if zone_id and not ObjectId.is_valid(zone_id):
+            return Response({'error': 'zone_id invalide'}, status=status.HTTP_400_BAD_REQUEST)
+        if periode != cumuls.TOUTES_PERIODES:
+            try:
+                if cumuls.periode(cumuls.bornes_periode(periode)[0]) != periode:
+                    raise ValueError(periode)
+            except ValueError:
+                return Response(
+                    {'error': "periode doit être au format AAAA-MM ou 'tout'"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        cle = {'zone': ObjectId(zone_id) if zone_id else None, 'periode': periode}
+        cumul = lecture_secondaire(CumulVagues._get_collection()).find_one(cle) or {
+            **cle, 'nombre': 0, 'somme_temperature': 0.0, 'somme_intensite': 0.0
+        }
+        return Response(cumuls.representation(cumul))
 
@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+from django.core import checks
+from django.utils.module_loading import autodiscover_modules
+
+
+class UtilsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'utils'
+
+    def ready(self):
+        from .mongo import connecter
+        connecter()
+        # Chaque application déclare ses index MongoDB dans son module indexes.py
+        autodiscover_modules('indexes')
+        from .indexes import verifier_index
+        checks.register(verifier_index)
@@ -0,0 +1,140 @@
+import asyncio
+import functools
+import os
+import weakref
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from pymongo import AsyncMongoClient
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated, MethodNotAllowed
+from authentification.models import User
+from utils.auth import decoder_token, verifier_actif, token_de_la_requete, principaux
+from utils.rendu import morceaux_async, negocier, verifier_flux
+
+# Un client asynchrone par boucle d'événements : un AsyncMongoClient ne peut
+# pas être partagé entre boucles (une par worker uvicorn)
+_clients = weakref.WeakKeyDictionary()
+
+
+def parametres_client():
+    """Paramètres de settings.MONGODB traduits pour pymongo"""
+    parametres = dict(settings.MONGODB)
+    parametres.pop('db', None)
+    source = parametres.pop('authentication_source', None)
+    if source:
+        parametres['authSource'] = source
+    return parametres
+
+
+def client():
+    boucle = asyncio.get_running_loop()
+    existant = _clients.get(boucle)
+    if existant is None:
+        existant = _clients[boucle] = AsyncMongoClient(**parametres_client())
+    return existant
+
+
+def collection(document_cls):
+    """Collection asynchrone d'un Document mongoengine"""
+    return client()[settings.MONGODB['db']][document_cls._get_collection_name()]
+
+
+async def charger_references(document_cls, ids, champs):
+    """Équivalent asynchrone de utils.prefetch.charger_references, en documents bruts"""
+    ids = {i for i in ids if i is not None}
+    if not ids:
+        return {}
+    projection = {document_cls._fields[champ].db_field: 1 for champ in champs}
+    curseur = collection(document_cls).find({'_id': {'$in': list(ids)}}, projection)
+    return {document['_id']: document async for document in curseur}
+
+
+async def utilisateur_du_token(token):
+    """Version asynchrone de utils.auth.utilisateur_du_token, sur le même cache"""
+    payload = decoder_token(token)
+    user_id = payload.get("user_id")
+    user = principaux.lire(user_id)
+    if user is None:
+        document = await collection(User).find_one({'user_id': user_id})
+        if document is None:
+            raise AuthenticationFailed("Utilisateur introuvable")
+        user = User._from_son(document)
+        principaux.ecrire(user)
+
+    verifier_actif(user)
+    return user, payload
+
+
+async def authentifier(request):
+    """
+    Utilisateur du token de la requête ; None sans en-tête, comme
+    JWTAuthentication. Mémorisé sur la requête : décorateurs et vue
+    l'authentifient une seule fois.
+    """
+    if not hasattr(request, '_utilisateur_async'):
+        token = token_de_la_requete(request)
+        user = None
+        if token is not None:
+            user, _ = await utilisateur_du_token(token)
+        request._utilisateur_async = user
+    return request._utilisateur_async
+
+
+def reponse(request, donnees, status=status.HTTP_200_OK):
+    """Réponse rendue comme celles de DRF, au format négocié (mêmes octets que les vues synchrones)"""
+    rendu = negocier(request)
+    return HttpResponse(rendu.render(donnees), status=status, content_type=rendu.media_type)
+
+
+def reponse_flux(pagination, collection, filtre, request, projection, representer, taille):
+    """
+    Équivalent asynchrone de utils.brut.flux : la collection est parcourue
+    dans l'ordre des pages et chaque lot de `taille` documents est représenté
+    par la coroutine `representer(documents)` puis envoyé.
+    """
+    verifier_flux(negocier(request))
+    curseur = pagination.ordonner_collection(collection, filtre, request, projection).batch_size(taille)
+
+    async def lots():
+        lot = []
+        async for document in curseur:
+            lot.append(document)
+            if len(lot) == taille:
+                yield await representer(lot)
+                lot = []
+        if lot:
+            yield await representer(lot)
+
+    return StreamingHttpResponse(morceaux_async(lots()), content_type='application/json')
+
+
+def vue_async(vue):
+    """
+    Vue asynchrone en lecture seule hors de DRF : le format de réponse est
+    négocié, seules GET et HEAD sont acceptées et les APIException sont
+    rendues comme le ferait DRF.
+    """
+    @functools.wraps(vue)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            negocier(request)
+            if request.method not in ('GET', 'HEAD'):
+                raise MethodNotAllowed(request.method)
+            resultat = await vue(request, *args, **kwargs)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+            resultat = reponse(request, detail, status=exc.status_code)
+            if isinstance(exc, (AuthenticationFailed, NotAuthenticated)):
+                resultat['WWW-Authenticate'] = 'Bearer'
+            if getattr(exc, 'wait', None):
+                resultat['Retry-After'] = str(int(exc.wait))
+        # Comme DRF : le format dépend de l'en-tête Accept
+        patch_vary_headers(resultat, ('Accept',))
+        return resultat
+    return wrapper
+
+
+if hasattr(os, 'register_at_fork'):
+    # Les clients (et leurs boucles) du parent ne servent pas dans l'enfant
+    os.register_at_fork(after_in_child=_clients.clear)
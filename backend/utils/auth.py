@@ -1,29 +1,119 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
 import jwt
 from django.conf import settings
+from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from authentification.models import User
 
-# Middleware ou décorateur pour authentifier l'utilisateur depuis le token JWT
-def authenticate_request(view_func):
-    def wrapper(self, request, *args, **kwargs):
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Bearer "):
-            raise AuthenticationFailed("Token JWT manquant")
 
-        token = auth_header.split(" ")[1]
-        print("token", token)
-        try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        except jwt.ExpiredSignatureError:
-            raise AuthenticationFailed("Token expiré")
-        except jwt.InvalidTokenError:
-            raise AuthenticationFailed("Token invalide")
-        print("payload:", payload)
-
-        user = User.objects(user_id=payload["user_id"]).first()
+class CachePrincipaux:
+    """
+    Cache LRU borné des utilisateurs authentifiés, par user_id. Chaque entrée
+    expire après `ttl` secondes, ce qui borne la fraîcheur entre processus ;
+    dans le processus, les signaux de User et ses mises à jour groupées
+    (QuerySetUtilisateurs) invalident l'entrée à chaque écriture.
+    Les documents sont conservés sous forme brute et reconstruits à chaque
+    lecture : une requête ne peut pas modifier l'utilisateur d'une autre.
+    """
+    def __init__(self, taille, ttl):
+        self.taille = taille
+        self.ttl = ttl
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def lire(self, user_id):
+        with self._verrou:
+            entree = self._entrees.get(user_id)
+            if entree is None:
+                return None
+            donnees, expiration = entree
+            if expiration <= time.monotonic():
+                del self._entrees[user_id]
+                return None
+            self._entrees.move_to_end(user_id)
+        return User._from_son(donnees)
+
+    def ecrire(self, user):
+        with self._verrou:
+            self._entrees[user.user_id] = (user.to_mongo(), time.monotonic() + self.ttl)
+            self._entrees.move_to_end(user.user_id)
+            while len(self._entrees) > self.taille:
+                self._entrees.popitem(last=False)
+
+    def invalider(self, user_id):
+        with self._verrou:
+            self._entrees.pop(user_id, None)
+
+    def vider(self):
+        with self._verrou:
+            self._entrees.clear()
+
+
+principaux = CachePrincipaux(
+    taille=getattr(settings, 'AUTH_CACHE_TAILLE', 10000),
+    ttl=getattr(settings, 'AUTH_CACHE_TTL', 60),
+)
+
+
+def decoder_token(token):
+    try:
+        return jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+    except jwt.ExpiredSignatureError:
+        raise AuthenticationFailed("Token expiré")
+    except jwt.InvalidTokenError:
+        raise AuthenticationFailed("Token invalide")
+
+
+def verifier_actif(user):
+    if not user.is_active:
+        raise AuthenticationFailed("Compte désactivé")
+
+
+def token_de_la_requete(request, mot_cle="Bearer"):
+    """Token de l'en-tête `Authorization: Bearer <token>`, ou None"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith(f"{mot_cle} "):
+        return None
+    return auth_header.split(" ", 1)[1].strip()
+
+
+def utilisateur_du_token(token):
+    """Décode le JWT et retourne l'utilisateur actif correspondant (cache puis MongoDB)"""
+    payload = decoder_token(token)
+    user_id = payload.get("user_id")
+    user = principaux.lire(user_id)
+    if user is None:
+        user = User.objects(user_id=user_id).first()
         if not user:
             raise AuthenticationFailed("Utilisateur introuvable")
+        principaux.ecrire(user)
+
+    verifier_actif(user)
+    return user, payload
+
+
+class JWTAuthentication(BaseAuthentication):
+    """Authentification DRF par en-tête `Authorization: Bearer <token>`"""
+    mot_cle = "Bearer"
 
-        request.user = user  # Injecte manuellement l'utilisateur dans la requête
+    def authenticate(self, request):
+        token = token_de_la_requete(request, self.mot_cle)
+        if token is None:
+            return None
+        return utilisateur_du_token(token)
+
+    def authenticate_header(self, request):
+        return self.mot_cle
+
+
+# Décorateur des vues réservées aux utilisateurs authentifiés par JWTAuthentication
+def authenticate_request(view_func):
+    @functools.wraps(view_func)
+    def wrapper(self, request, *args, **kwargs):
+        if not isinstance(request.user, User):
+            raise AuthenticationFailed("Token JWT manquant")
         return view_func(self, request, *args, **kwargs)
     return wrapper
@@ -0,0 +1,330 @@
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+from utils.rendu import morceaux, parcourir_async, verifier_flux
+
+_ABSENT = object()
+
+
+def valeur(document_cls, document, champ):
+    """
+    Valeur d'un champ lue dans un document Mongo brut, convertie et complétée
+    par le défaut du champ comme le ferait mongoengine au chargement.
+    """
+    field = document_cls._fields[champ]
+    if field.db_field in document:
+        brute = document[field.db_field]
+        return field.to_python(brute) if brute is not None else None
+    defaut = field.default
+    return defaut() if callable(defaut) else defaut
+
+
+class Mappeur:
+    """
+    Conversion précompilée d'un document brut en dictionnaire, équivalente à
+    `valeur` champ par champ : les champs mongoengine sont résolus une seule
+    fois. `noms` renomme des champs dans la représentation ; avec
+    `identifiant`, la clé 'id' (str de l'_id) vient en tête.
+    """
+    def __init__(self, document_cls, champs, noms=None, identifiant=True):
+        self.document_cls = document_cls
+        self.noms = noms or {}
+        self.identifiant = identifiant
+        self.champs = tuple(champs)
+        self._conversions = tuple(
+            (self.noms.get(champ, champ), field.db_field, field.to_python, field.default)
+            for champ, field in ((champ, document_cls._fields[champ]) for champ in self.champs)
+        )
+        self._restreints = {}
+
+    def restreint(self, champs):
+        """Mappeur limité aux `champs` demandés, dans l'ordre de déclaration ; mis en cache"""
+        cle = frozenset(champs)
+        if cle not in self._restreints:
+            self._restreints[cle] = Mappeur(
+                self.document_cls, [c for c in self.champs if c in cle], self.noms, self.identifiant
+            )
+        return self._restreints[cle]
+
+    def __call__(self, document):
+        data = {'id': str(document['_id'])} if self.identifiant else {}
+        for nom, db_field, to_python, defaut in self._conversions:
+            brute = document.get(db_field, _ABSENT)
+            if brute is _ABSENT:
+                data[nom] = defaut() if callable(defaut) else defaut
+            else:
+                data[nom] = to_python(brute) if brute is not None else None
+        return data
+
+
+def charger_documents(document_cls, ids, champs):
+    """Comme utils.prefetch.charger_references, en documents bruts (as_pymongo)"""
+    ids = {i for i in ids if i is not None}
+    if not ids:
+        return {}
+    return {
+        document['_id']: document
+        for document in document_cls.objects(pk__in=list(ids)).only(*champs).as_pymongo()
+    }
+
+
+def liste_parametre(parametres, nom):
+    valeur = parametres.get(nom)
+    if valeur is None:
+        return None
+    return {element.strip() for element in valeur.split(',') if element.strip()}
+
+
+class Selection:
+    """
+    Champs demandés (?fields=) et relations développées (?expand=). Sans
+    aucun des deux, la représentation est complète, relations développées ;
+    sinon seuls les champs demandés sont lus (plus l'id), et une relation
+    n'est développée que si elle figure dans expand : demandée dans fields
+    seulement, elle vaut son identifiant, sans lecture de la cible.
+    """
+    def __init__(self, champs=None, developpees=None):
+        self.complete = champs is None and developpees is None
+        self.champs = champs
+        self.developpees = developpees or set()
+
+    @classmethod
+    def depuis(cls, request, lecture):
+        """Sélection des paramètres de la requête, validée contre les champs de `lecture`"""
+        parametres = getattr(request, 'query_params', request.GET)
+        champs = liste_parametre(parametres, 'fields')
+        developpees = liste_parametre(parametres, 'expand')
+        if champs is not None:
+            inconnus = champs - {'id'} - set(lecture.noms())
+            if inconnus:
+                raise ValidationError({'fields': f"Champs inconnus : {', '.join(sorted(inconnus))}"})
+        if developpees is not None:
+            inconnues = developpees - set(lecture.relations)
+            if inconnues:
+                raise ValidationError({'expand': f"Relations inconnues : {', '.join(sorted(inconnues))}"})
+        return cls(champs, developpees)
+
+    def inclut(self, nom):
+        return self.champs is None or nom in self.champs or nom in self.developpees
+
+    def developpe(self, nom):
+        return self.complete or nom in self.developpees
+
+
+COMPLETE = Selection()
+
+
+class Reference:
+    """
+    Relation portée par un ReferenceField, développée par une requête $in
+    projetée sur les champs de `mappeur`. Sans cible, la clé vaut None si
+    `nulle`, sinon elle est omise (comme dans les sérialiseurs).
+    """
+    def __init__(self, document_cls, mappeur, nulle=False):
+        self.document_cls = document_cls
+        self.mappeur = mappeur
+        self.nulle = nulle
+
+    def champs_lus(self, nom):
+        return (nom,)
+
+    def a_charger(self, nom, documents):
+        """(Document, ids, champs) à lire pour développer la relation"""
+        return self.document_cls, {d.get(nom) for d in documents}, self.mappeur.champs
+
+    def charger(self, nom, documents, developpee):
+        if not developpee:
+            return {}
+        return charger_documents(*self.a_charger(nom, documents))
+
+    def representer(self, nom, document, charges, developpee):
+        identifiant = document.get(nom)
+        if not developpee:
+            return str(identifiant) if identifiant is not None else None
+        cible = charges.get(identifiant)
+        return self.mappeur(cible) if cible else None
+
+    def reduire(self, representation):
+        """Identifiant d'une représentation développée"""
+        return representation['id'] if representation else None
+
+
+class Lecture:
+    """
+    Chemin de lecture brut d'une ressource, déclaré par son sérialiseur
+    (`lecture_brute`) : les documents sont lus par pymongo, projetés sur les
+    champs utiles à la sélection, et représentés sans instancier de Document.
+    Complète, la représentation est identique à celle du sérialiseur.
+    """
+    mappeur = None
+    relations = {}
+
+    @property
+    def champs(self):
+        return self.projection(COMPLETE)
+
+    def noms(self):
+        return self.mappeur.champs + tuple(self.relations)
+
+    def projection(self, selection):
+        """Champs à lire (only) pour représenter la sélection"""
+        champs = [champ for champ in self.mappeur.champs if selection.inclut(champ)]
+        for nom, relation in self.relations.items():
+            if selection.inclut(nom):
+                champs.extend(relation.champs_lus(nom))
+        return tuple(champs)
+
+    def projection_mongo(self, selection, *supplementaires):
+        """Projection pymongo de la sélection, None pour le document entier"""
+        if selection.complete:
+            return None
+        fields = self.mappeur.document_cls._fields
+        return {
+            fields[champ].db_field if champ in fields else champ: 1
+            for champ in self.projection(selection) + supplementaires
+        }
+
+    def charger(self, documents, selection):
+        return {
+            nom: relation.charger(nom, documents, selection.developpe(nom))
+            for nom, relation in self.relations.items() if selection.inclut(nom)
+        }
+
+    def assembler(self, documents, charges, selection):
+        """Représentations des documents, relations lues dans `charges` ({nom: {id: document}})"""
+        mappeur = self.mappeur if selection.champs is None else self.mappeur.restreint(selection.champs)
+        relations = [
+            (nom, relation, selection.developpe(nom))
+            for nom, relation in self.relations.items() if selection.inclut(nom)
+        ]
+        representations = []
+        for document in documents:
+            data = mappeur(document)
+            for nom, relation, developpee in relations:
+                valeur = relation.representer(nom, document, charges.get(nom, {}), developpee)
+                if valeur is not None or relation.nulle:
+                    data[nom] = valeur
+            representations.append(data)
+        return representations
+
+    def representer(self, documents, selection=COMPLETE):
+        return self.assembler(documents, self.charger(documents, selection), selection)
+
+    def filtrer(self, representation, selection):
+        """Applique la sélection à une représentation complète (données en cache)"""
+        if selection.complete:
+            return representation
+        data = {'id': representation['id']}
+        for nom, valeur in representation.items():
+            if nom == 'id' or not selection.inclut(nom):
+                continue
+            relation = self.relations.get(nom)
+            data[nom] = valeur if relation is None or selection.developpe(nom) else relation.reduire(valeur)
+        return data
+
+
+def lecture_brute(serializer_cls):
+    """Lecture brute du sérialiseur, None si absente ou désactivée (LECTURE_BRUTE)"""
+    if not getattr(settings, 'LECTURE_BRUTE', True):
+        return None
+    return getattr(serializer_cls, 'lecture_brute', None)
+
+
+def lecture_et_selection(request, serializer_cls):
+    """
+    (lecture, sélection) de la requête ; lecture None pour passer par le
+    sérialiseur. Une sélection partielle passe toujours par la lecture brute,
+    seule à projeter les champs.
+    """
+    lecture = getattr(serializer_cls, 'lecture_brute', None)
+    if lecture is None:
+        return None, COMPLETE
+    selection = Selection.depuis(request, lecture)
+    if selection.complete and lecture_brute(serializer_cls) is None:
+        return None, selection
+    return lecture, selection
+
+
+def representations(queryset, request, serializer_cls):
+    """Représentations de tout un queryset selon ?fields=/?expand="""
+    lecture, selection = lecture_et_selection(request, serializer_cls)
+    if lecture is None:
+        return serializer_cls(queryset, many=True).data
+    return lecture.representer(list(queryset.only(*lecture.projection(selection)).as_pymongo()), selection)
+
+
+def element(queryset, request, serializer_cls):
+    """Représentation du premier document du queryset selon ?fields=/?expand=, None s'il n'y en a pas"""
+    lecture, selection = lecture_et_selection(request, serializer_cls)
+    if lecture is None:
+        instance = queryset.first()
+        return serializer_cls(instance).data if instance is not None else None
+    document = queryset.only(*lecture.projection(selection)).as_pymongo().first()
+    return lecture.representer([document], selection)[0] if document is not None else None
+
+
+def selectionner(donnees, request, serializer_cls):
+    """Applique ?fields=/?expand= à des représentations complètes déjà calculées (caches)"""
+    lecture = serializer_cls.lecture_brute
+    selection = Selection.depuis(request, lecture)
+    return [lecture.filtrer(representation, selection) for representation in donnees]
+
+
+def flux_demande(request):
+    parametres = getattr(request, 'query_params', request.GET)
+    return parametres.get('flux') == '1'
+
+
+def taille_lot_flux():
+    return getattr(settings, 'FLUX_TAILLE_LOT', 1000)
+
+
+def par_lots(iterable, taille):
+    # Un seul parcours : un QuerySetNoCache repart du début à chaque iter()
+    lot = []
+    for element in iterable:
+        lot.append(element)
+        if len(lot) == taille:
+            yield lot
+            lot = []
+    if lot:
+        yield lot
+
+
+def flux(pagination, queryset, request, serializer_cls):
+    """
+    Tout le queryset en flux (?flux=1), dans l'ordre des pages et depuis le
+    curseur éventuel : les documents sont lus, complétés de leurs relations
+    et encodés par lots de FLUX_TAILLE_LOT, sans cache de résultats
+    (no_cache) ; la mémoire ne dépend pas du nombre de documents. Sous
+    ASGI, Django lirait un itérateur synchrone en entier avant d'envoyer la
+    réponse : le corps y est un itérateur asynchrone (parcourir_async).
+    """
+    verifier_flux(request.accepted_renderer)
+    taille = taille_lot_flux()
+    requete = pagination.ordonner(queryset, request).no_cache()
+    lecture, selection = lecture_et_selection(request, serializer_cls)
+    if lecture is None:
+        lots = (serializer_cls(lot, many=True).data for lot in par_lots(requete.batch_size(taille), taille))
+    else:
+        documents = requete.only(*lecture.projection(selection)).as_pymongo().batch_size(taille)
+        lots = (lecture.representer(lot, selection) for lot in par_lots(documents, taille))
+    corps = morceaux(lots)
+    if isinstance(request._request, ASGIRequest):
+        corps = parcourir_async(corps)
+    return StreamingHttpResponse(corps, content_type='application/json')
+
+
+def page(pagination, queryset, request, serializer_cls):
+    """Réponse paginée d'un queryset selon ?fields=/?expand=, ou en flux avec ?flux=1"""
+    if flux_demande(request):
+        return flux(pagination, queryset, request, serializer_cls)
+    lecture, selection = lecture_et_selection(request, serializer_cls)
+    if lecture is None:
+        elements = pagination.paginate_queryset(queryset, request)
+        return pagination.get_paginated_response(serializer_cls(elements, many=True).data)
+    # Le champ de tri est lu pour construire le curseur de la page suivante
+    projection = lecture.projection(selection) + (('id',) if pagination.champ == '_id' else (pagination.champ,))
+    documents = pagination.paginer_documents(queryset.only(*projection), request)
+    return pagination.get_paginated_response(lecture.representer(documents, selection))
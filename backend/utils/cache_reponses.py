@@ -0,0 +1,351 @@
+import asyncio
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+from rest_framework.response import Response
+from utils import versions
+from utils.asynchrone import authentifier, collection
+from utils.rendu import negocier
+
+ANONYME = 'ANONYME'
+
+
+def parametre(nom, defaut):
+    return getattr(settings, nom, defaut)
+
+
+class BackendMemoire:
+    """Réponses du seul processus courant, LRU borné"""
+    local = True
+
+    def __init__(self):
+        self.taille = parametre('CACHE_REPONSES_TAILLE', 1000)
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def lire(self, cle):
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is None:
+                return None
+            valeur, expiration = entree
+            if expiration <= time.monotonic():
+                del self._entrees[cle]
+                return None
+            self._entrees.move_to_end(cle)
+            return valeur
+
+    def ecrire(self, cle, valeur, ttl):
+        with self._verrou:
+            self._entrees[cle] = (valeur, time.monotonic() + ttl)
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille:
+                self._entrees.popitem(last=False)
+
+    def verrouiller(self, cle, duree):
+        # Un seul processus : la coalescence locale suffit
+        return True
+
+    def liberer(self, cle):
+        pass
+
+
+class BackendDjango:
+    """
+    Réponses partagées par tous les processus dans le cache Django
+    CACHE_REPONSES_ALIAS (Redis, Memcached ; LocMemCache en local)
+    """
+    local = False
+
+    def __init__(self):
+        self.cache = caches[parametre('CACHE_REPONSES_ALIAS', 'default')]
+
+    def lire(self, cle):
+        return self.cache.get(cle)
+
+    def ecrire(self, cle, valeur, ttl):
+        self.cache.set(cle, valeur, ttl)
+
+    def verrouiller(self, cle, duree):
+        return self.cache.add(f"{cle}:calcul", 1, duree)
+
+    def liberer(self, cle):
+        self.cache.delete(f"{cle}:calcul")
+
+
+class Calcul:
+    """Calcul en cours d'une entrée : les requêtes concurrentes attendent son résultat"""
+    def __init__(self):
+        self.termine = threading.Event()
+        self.valeur = None
+
+
+class CacheReponses:
+    """
+    Cache des réponses des lectures fréquentes. Une entrée est indexée par
+    l'URL complète, le type de média, le rôle de l'utilisateur et l'état des
+    collections lues (`etat_lecture`), relu en base à chaque requête : une
+    écriture de n'importe quel processus (utils.versions.toucher) change
+    l'état et rend inaccessibles les entrées qui en dépendent, qui expirent
+    ensuite (TTL, LRU). Les requêtes simultanées sur une entrée
+    absente attendent un seul calcul (dans le processus, et entre processus
+    sur un backend partagé).
+    """
+    def __init__(self):
+        self.pid = os.getpid()
+        self.backend = import_string(
+            parametre('CACHE_REPONSES_BACKEND', 'utils.cache_reponses.BackendMemoire')
+        )()
+        self.ttl = parametre('CACHE_REPONSES_TTL', 60)
+        self.attente = parametre('CACHE_REPONSES_ATTENTE', 2.0)
+        self._calculs = {}
+        self._calculs_async = {}
+        self._verrou = threading.Lock()
+        self._compteurs = defaultdict(lambda: {'succes': 0, 'echecs': 0, 'coalescees': 0})
+
+    def cle(self, chemin, media, role, etat):
+        empreinte = repr((chemin, media, role, etat))
+        return 'reponses:' + hashlib.blake2b(empreinte.encode(), digest_size=16).hexdigest()
+
+    def compter(self, nom, compteur):
+        with self._verrou:
+            self._compteurs[nom][compteur] += 1
+
+    def _attendre_autre_processus(self, cle):
+        """Entrée calculée par un autre processus, None après CACHE_REPONSES_ATTENTE secondes"""
+        limite = time.monotonic() + self.attente
+        while time.monotonic() < limite:
+            time.sleep(0.05)
+            valeur = self.backend.lire(cle)
+            if valeur is not None:
+                return valeur
+        return None
+
+    def obtenir(self, nom, cle, calculer):
+        """
+        Entrée `cle`, calculée par `calculer()` -> (valeur, réponse) si absente ;
+        valeur None : réponse non mise en cache. Retourne (valeur, réponse).
+        """
+        valeur = self.backend.lire(cle)
+        if valeur is not None:
+            self.compter(nom, 'succes')
+            return valeur, None
+
+        with self._verrou:
+            calcul = self._calculs.get(cle)
+            meneur = calcul is None
+            if meneur:
+                calcul = self._calculs[cle] = Calcul()
+        if not meneur:
+            calcul.termine.wait(self.attente)
+            if calcul.valeur is not None:
+                self.compter(nom, 'coalescees')
+                return calcul.valeur, None
+            self.compter(nom, 'echecs')
+            return calculer()
+
+        verrou = False
+        try:
+            verrou = self.backend.verrouiller(cle, self.attente)
+            if not verrou:
+                valeur = self._attendre_autre_processus(cle)
+                if valeur is not None:
+                    calcul.valeur = valeur
+                    self.compter(nom, 'coalescees')
+                    return valeur, None
+            self.compter(nom, 'echecs')
+            valeur, reponse = calculer()
+            if valeur is not None:
+                self.backend.ecrire(cle, valeur, self.ttl)
+                calcul.valeur = valeur
+            return valeur, reponse
+        finally:
+            if verrou:
+                self.backend.liberer(cle)
+            calcul.termine.set()
+            with self._verrou:
+                self._calculs.pop(cle, None)
+
+    async def appeler(self, fonction, *args):
+        """Appel du backend depuis une boucle : un backend partagé fait des E/S, hors de la boucle"""
+        if self.backend.local:
+            return fonction(*args)
+        return await asyncio.to_thread(fonction, *args)
+
+    async def obtenir_async(self, nom, cle, calculer):
+        """
+        Équivalent asynchrone d'`obtenir` : `calculer` est une coroutine. La
+        coalescence est faite par boucle, sans verrou entre processus.
+        """
+        valeur = await self.appeler(self.backend.lire, cle)
+        if valeur is not None:
+            self.compter(nom, 'succes')
+            return valeur, None
+
+        boucle = asyncio.get_running_loop()
+        calcul = self._calculs_async.get((boucle, cle))
+        if calcul is not None:
+            valeur = await asyncio.shield(calcul)
+            if valeur is not None:
+                self.compter(nom, 'coalescees')
+                return valeur, None
+            self.compter(nom, 'echecs')
+            return await calculer()
+
+        calcul = self._calculs_async[(boucle, cle)] = boucle.create_future()
+        valeur = None
+        try:
+            self.compter(nom, 'echecs')
+            valeur, reponse = await calculer()
+            if valeur is not None:
+                await self.appeler(self.backend.ecrire, cle, valeur, self.ttl)
+            return valeur, reponse
+        finally:
+            calcul.set_result(valeur)
+            del self._calculs_async[(boucle, cle)]
+
+    def metriques(self):
+        with self._verrou:
+            endpoints = {}
+            for nom, compteurs in self._compteurs.items():
+                servies = compteurs['succes'] + compteurs['coalescees']
+                total = servies + compteurs['echecs']
+                endpoints[nom] = dict(compteurs, taux_succes=round(servies / total, 4) if total else None)
+            return {
+                'backend': type(self.backend).__name__,
+                'ttl_s': self.ttl,
+                'endpoints': endpoints,
+            }
+
+
+_cache = None
+_verrou = threading.Lock()
+
+
+def cache():
+    """Cache des réponses du processus courant, recréé après un fork"""
+    global _cache
+    with _verrou:
+        if _cache is None or _cache.pid != os.getpid():
+            _cache = CacheReponses()
+    return _cache
+
+
+def actif():
+    return parametre('CACHE_REPONSES_ACTIF', True)
+
+
+def metriques():
+    return cache().metriques() if actif() else None
+
+
+def etat_lecture(request, document_classes):
+    """
+    État des collections lues par une requête : l'ETag posé par
+    @conditionnel, qui valide le contenu même de la réponse (versions,
+    nombre de documents de la source), sinon la version de chaque collection
+    """
+    etag = getattr(request, 'etag_lecture', None)
+    if etag is not None:
+        return etag
+    return sorted((nom, version) for nom, (version, _) in versions.lire(document_classes).items())
+
+
+async def etat_lecture_async(request, document_classes):
+    etag = getattr(request, 'etag_lecture', None)
+    if etag is not None:
+        return etag
+    documents = await collection(versions.Version).find(versions.filtre(document_classes)).to_list(None)
+    return sorted((nom, version) for nom, (version, _) in versions.etats(documents).items())
+
+
+def role_de(user):
+    return getattr(user, 'role', None) or ANONYME
+
+
+def entree(reponse):
+    return reponse.status_code, reponse['Content-Type'], reponse.content
+
+
+def reponse_de(valeur):
+    status, content_type, contenu = valeur
+    return HttpResponse(contenu, status=status, content_type=content_type)
+
+
+def en_cache(*document_classes):
+    """
+    Met en cache les réponses 200 d'une méthode de ViewSet lisant
+    `document_classes`, rendues une fois pour toutes ; l'API navigable
+    (text/html) n'est jamais mise en cache. À placer sous @action et
+    sous @conditionnel.
+    """
+    def decorateur(methode):
+        nom = nom_de(methode)
+
+        @functools.wraps(methode)
+        def wrapper(self, request, *args, **kwargs):
+            if not actif() or request.accepted_renderer.media_type == 'text/html':
+                return methode(self, request, *args, **kwargs)
+
+            def calculer():
+                reponse = methode(self, request, *args, **kwargs)
+                if not isinstance(reponse, Response) or reponse.status_code != 200:
+                    return None, reponse
+                reponse.accepted_renderer = request.accepted_renderer
+                reponse.accepted_media_type = request.accepted_media_type
+                reponse.renderer_context = self.get_renderer_context()
+                reponse.render()
+                return entree(reponse), reponse
+
+            instance = cache()
+            cle = instance.cle(
+                request.get_full_path(), request.accepted_media_type, role_de(request.user),
+                etat_lecture(request, document_classes)
+            )
+            valeur, reponse = instance.obtenir(nom, cle, calculer)
+            return reponse if reponse is not None else reponse_de(valeur)
+        return wrapper
+    return decorateur
+
+
+def nom_de(vue):
+    """Nom d'une lecture dans les métriques : application.méthode, commun aux vues synchrone et asynchrone"""
+    return f"{vue.__module__.split('.')[0]}.{vue.__name__}"
+
+
+def en_cache_async(*document_classes):
+    """
+    Équivalent d'`en_cache` pour une vue asynchrone (sous @vue_async) : mêmes
+    entrées que la vue synchrone de la même route.
+    """
+    def decorateur(vue):
+        nom = nom_de(vue)
+
+        @functools.wraps(vue)
+        async def wrapper(request, *args, **kwargs):
+            if not actif():
+                return await vue(request, *args, **kwargs)
+
+            async def calculer():
+                reponse = await vue(request, *args, **kwargs)
+                if reponse.status_code != 200 or reponse.streaming:
+                    return None, reponse
+                return entree(reponse), reponse
+
+            user = await authentifier(request)
+            instance = cache()
+            cle = instance.cle(
+                request.get_full_path(), negocier(request).media_type, role_de(user),
+                await etat_lecture_async(request, document_classes)
+            )
+            valeur, reponse = await instance.obtenir_async(nom, cle, calculer)
+            return reponse if reponse is not None else reponse_de(valeur)
+        return wrapper
+    return decorateur
@@ -0,0 +1,118 @@
+import calendar
+import functools
+import hashlib
+from bson import ObjectId
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from utils import versions
+from utils.asynchrone import authentifier, collection
+from utils.mongo import lecture_secondaire
+
+
+def validateurs(request, etats, compte=None, horodatage=None):
+    """
+    (ETag, Last-Modified) d'une lecture : l'URL complète (filtres, curseur,
+    fields/expand) et l'Accept déterminent la représentation, les versions
+    des collections lues et, selon le cas, le nombre de documents de la
+    source ou l'updated_at du document en déterminent le contenu.
+    """
+    empreinte = repr((
+        request.get_full_path(),
+        request.META.get('HTTP_ACCEPT', ''),
+        sorted((nom, version) for nom, (version, _) in etats.items()),
+        compte,
+        horodatage,
+    ))
+    etag = '"%s"' % hashlib.blake2b(empreinte.encode(), digest_size=16).hexdigest()
+    dates = [date for _, date in etats.values() if date is not None]
+    if horodatage is not None:
+        dates.append(horodatage)
+    return etag, calendar.timegm(max(dates).utctimetuple()) if dates else None
+
+
+def poser(reponse, etag, modifie_le):
+    """En-têtes de validation d'une réponse 200 ou 304 ; le client revalide à chaque lecture"""
+    if reponse.status_code not in (200, 304):
+        return reponse
+    reponse['ETag'] = etag
+    if modifie_le is not None:
+        reponse['Last-Modified'] = http_date(modifie_le)
+    patch_vary_headers(reponse, ('Accept',))
+    patch_cache_control(reponse, private=True, no_cache=True)
+    return reponse
+
+
+def etat(request, document_classes, source, pk=None, secondaire=False):
+    """
+    Validateurs d'une lecture, None si le document demandé n'existe pas (la
+    vue répond elle-même). Une liste dépend des versions des collections et
+    du nombre de documents de la source, qui change aussi sur les
+    suppressions de l'index TTL, non versionnées ; un détail dépend de
+    l'updated_at du document et des versions des autres collections.
+    """
+    lire = lecture_secondaire if secondaire else (lambda source: source)
+    if pk is None:
+        return validateurs(
+            request, versions.lire(document_classes, lire(versions.Version._get_collection())),
+            compte=lire(source._get_collection()).estimated_document_count()
+        )
+    if not ObjectId.is_valid(pk):
+        return None
+    document = lire(source._get_collection()).find_one({'_id': ObjectId(pk)}, {'updated_at': 1})
+    if document is None:
+        return None
+    horodatage = document.get('updated_at')
+    # Sans updated_at, la version de sa collection tient lieu d'horodatage
+    autres = [cls for cls in document_classes if cls is not source or horodatage is None]
+    etats = versions.lire(autres, lire(versions.Version._get_collection())) if autres else {}
+    return validateurs(request, etats, horodatage=horodatage)
+
+
+def conditionnel(*document_classes, source=None, secondaire=False):
+    """
+    GET conditionnel d'une méthode de ViewSet lisant `document_classes` (la
+    première est la source, ou `source(request)`) : If-None-Match et
+    If-Modified-Since satisfaits, la réponse est un 304 sans lecture ni
+    sérialisation. `secondaire` : les validateurs sont lus avec la même
+    préférence que les données (utils.mongo.lecture_secondaire). L'ETag
+    est transmis à @en_cache (request.etag_lecture), qui en fait sa clé.
+    À placer sous @action.
+    """
+    def decorateur(methode):
+        @functools.wraps(methode)
+        def wrapper(self, request, *args, **kwargs):
+            cible = source(request) if source else document_classes[0]
+            valeurs = etat(request, document_classes, cible, kwargs.get('pk'), secondaire)
+            if valeurs is None:
+                return methode(self, request, *args, **kwargs)
+            etag, modifie_le = valeurs
+            request.etag_lecture = etag
+            reponse = get_conditional_response(request, etag=etag, last_modified=modifie_le)
+            if reponse is None:
+                reponse = methode(self, request, *args, **kwargs)
+            return poser(reponse, etag, modifie_le)
+        return wrapper
+    return decorateur
+
+
+def conditionnel_async(*document_classes, secondaire=False):
+    """
+    Équivalent de `conditionnel` pour les listes des vues asynchrones (sous
+    @vue_async) : mêmes validateurs que la vue synchrone de la même route.
+    L'utilisateur est authentifié avant, comme DRF le fait avant la méthode.
+    """
+    def decorateur(vue):
+        @functools.wraps(vue)
+        async def wrapper(request, *args, **kwargs):
+            await authentifier(request)
+            lire = lecture_secondaire if secondaire else (lambda source: source)
+            documents = await lire(collection(versions.Version)).find(versions.filtre(document_classes)).to_list(None)
+            compte = await lire(collection(document_classes[0])).estimated_document_count()
+            etag, modifie_le = validateurs(request, versions.etats(documents), compte=compte)
+            request.etag_lecture = etag
+            reponse = get_conditional_response(request, etag=etag, last_modified=modifie_le)
+            if reponse is None:
+                reponse = await vue(request, *args, **kwargs)
+            return poser(reponse, etag, modifie_le)
+        return wrapper
+    return decorateur
@@ -24,3 +24,28 @@ class TypeNotification(Enum):
     @classmethod
     def choices(cls):
         return [(type_notif.name, type_notif.value) for type_notif in cls]
+
+class StatutDiffusion(Enum):
+    EN_ATTENTE = "en_attente"
+    EN_COURS = "en_cours"
+    TERMINEE = "terminee"
+    ECHEC = "echec"
+
+    def __str__(self):
+        return self.value
+
+    @classmethod
+    def choices(cls):
+        return [(statut.name, statut.value) for statut in cls]
+
+class StatutEnvoi(Enum):
+    EN_ATTENTE = "en_attente"
+    ENVOYEE = "envoyee"
+    ECHEC = "echec"
+
+    def __str__(self):
+        return self.value
+
+    @classmethod
+    def choices(cls):
+        return [(statut.name, statut.value) for statut in cls]
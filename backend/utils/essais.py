@@ -0,0 +1,180 @@
+"""
+Outils communs des tests (python manage.py test) : base MongoDB jetable,
+comptage des commandes envoyées au serveur et jeux de données minimaux.
+Les tests ont besoin d'un serveur MongoDB (celui de docker-compose, ou
+MONGO_HOST/MONGO_PORT) ; sans serveur joignable, ils sont ignorés.
+"""
+import contextlib
+import datetime
+import os
+from unittest import SkipTest
+import jwt
+import mongoengine
+from django.conf import settings
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+from mongoengine.base import _document_registry
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+from rest_framework.test import APIClient
+from utils import indexes
+
+
+class CompteurCommandes(monitoring.CommandListener):
+    """Commandes pymongo envoyées au serveur pendant `compter()`, hors commandes de service"""
+    SERVICE = {'hello', 'ismaster', 'isMaster', 'ping', 'endSessions', 'saslStart', 'saslContinue', 'buildInfo'}
+
+    def __init__(self):
+        self.actif = False
+        self.commandes = []
+
+    @contextlib.contextmanager
+    def compter(self):
+        self.commandes = []
+        self.actif = True
+        try:
+            yield self.commandes
+        finally:
+            self.actif = False
+
+    def started(self, event):
+        if self.actif and event.command_name not in self.SERVICE:
+            self.commandes.append((event.command_name, event.command.get(event.command_name)))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class TestMongo(SimpleTestCase):
+    """
+    Tests sur la base MONGO_TEST_DB (par défaut la base configurée suffixée
+    de _test), supprimée avant chaque test ; les caches de processus sont
+    vidés. `commandes.compter()` relève les commandes envoyées au serveur.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.base = os.environ.get('MONGO_TEST_DB', f"{settings.MONGODB['db']}_test")
+        mongodb = dict(settings.MONGODB, db=cls.base, serverSelectionTimeoutMS=2000)
+        cls.enterClassContext(override_settings(MONGODB=mongodb))
+        cls.commandes = CompteurCommandes()
+        mongoengine.disconnect()
+        cls.addClassCleanup(cls.reconnecter)
+        mongoengine.connect(**mongodb, event_listeners=[cls.commandes])
+        try:
+            mongoengine.get_connection().admin.command('ping')
+        except PyMongoError as erreur:
+            raise SkipTest(f"MongoDB injoignable : {erreur}")
+
+    @classmethod
+    def reconnecter(cls):
+        from utils.mongo import connecter
+        mongoengine.disconnect()
+        connecter()
+
+    def setUp(self):
+        mongoengine.get_connection().drop_database(self.base)
+        # Collections et index recréés à la première utilisation de chaque Document,
+        # index déclarés (utils.indexes) créés comme par ensure_indexes
+        for document_cls in _document_registry.values():
+            document_cls._collection = None
+        for document_cls in indexes.documents():
+            for spec in document_cls._meta['index_specs']:
+                indexes.creer(document_cls, spec)
+        self.vider_caches()
+        self.client = APIClient()
+
+    def vider_caches(self):
+        from utils import cache_reponses
+        from utils.auth import principaux
+        from notifications import coalescence
+        from vagues_chaleur import cache
+        principaux.vider()
+        cache.invalider()
+        coalescence._coalesceur = None
+        cache_reponses._cache = None
+        for alias in settings.CACHES:
+            caches[alias].clear()
+
+    def nombre_commandes(self, url, **entetes):
+        """Commandes envoyées au serveur par un GET réussi de `url`"""
+        with self.commandes.compter() as commandes:
+            reponse = self.client.get(url, **entetes)
+        self.assertEqual(reponse.status_code, 200, reponse.content[:300])
+        return len(commandes)
+
+    def assertRequetesConstantes(self, ajouter, urls):
+        """
+        Même nombre de commandes pour chaque URL de `urls()` après `ajouter(1)`
+        puis après `ajouter(9)` lignes, par la lecture brute comme par les
+        sérialiseurs (LECTURE_BRUTE=0).
+        """
+        for lecture_brute in (True, False):
+            with self.subTest(lecture_brute=lecture_brute), override_settings(LECTURE_BRUTE=lecture_brute):
+                self.setUp()
+                ajouter(1)
+                une_ligne = {url: self.nombre_commandes(url) for url in urls()}
+                ajouter(9)
+                dix_lignes = {url: self.nombre_commandes(url) for url in urls()}
+                self.assertEqual(une_ligne, dix_lignes)
+
+    def assertLecturesIdentiques(self, urls):
+        """Mêmes octets pour chaque URL par la lecture brute et par les sérialiseurs (LECTURE_BRUTE=0)"""
+        for url in urls:
+            corps = []
+            for lecture_brute in (True, False):
+                # Sans cache de réponses : chaque chemin est réellement exécuté
+                self.vider_caches()
+                with override_settings(LECTURE_BRUTE=lecture_brute):
+                    reponse = self.client.get(url)
+                self.assertEqual(reponse.status_code, 200, reponse.content[:300])
+                corps.append(reponse.content)
+            with self.subTest(url=url):
+                self.assertEqual(corps[0], corps[1])
+
+    def entetes(self, user):
+        """En-tête d'authentification JWT de `user`"""
+        token = jwt.encode({'user_id': user.user_id}, settings.SECRET_KEY, algorithm='HS256')
+        return {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+
+def maintenant():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def creer_utilisateur(numero, **champs):
+    from authentification.models import User
+    return User(
+        last_name=f'Diop{numero}', first_name='Awa', email=f'awa{numero}@exemple.sn',
+        phone_number=f'+22177000{numero:04d}', password='x', **champs
+    ).save()
+
+
+def creer_zone(numero=1, **champs):
+    from zones_geographiques.models import ZoneGeographique
+    valeurs = dict(ville='Dakar', rue=f'Rue {numero}', numero=numero, latitude='14.69', longitude='-17.44', rayon=5)
+    valeurs.update(champs)
+    return ZoneGeographique(**valeurs).save()
+
+
+def creer_vague(zone=None, debut_jours=-1, fin_jours=1, **champs):
+    from vagues_chaleur.models import VagueChaleur
+    instant = maintenant()
+    valeurs = dict(
+        temperature_max=42.0, intensite=2.0, humidite=30.0,
+        date_debut=instant + datetime.timedelta(days=debut_jours),
+        date_fin=instant + datetime.timedelta(days=fin_jours),
+        duree=instant, zone_geographique=zone,
+    )
+    valeurs.update(champs)
+    return VagueChaleur(**valeurs).save()
+
+
+def creer_notification(utilisateur, vague, **champs):
+    from notifications.models import Notification
+    valeurs = dict(libelle='Alerte', type='SMS', date_envoi=maintenant(), utilisateur=utilisateur, vague_chaleur=vague)
+    valeurs.update(champs)
+    return Notification(**valeurs).save()
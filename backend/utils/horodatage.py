@@ -0,0 +1,82 @@
+import datetime
+from mongoengine import Document, DateTimeField
+from mongoengine.queryset import QuerySet
+from utils import versions
+
+
+def maintenant():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def horodater(update):
+    """Ajoute set__updated_at à une mise à jour mongoengine qui ne le fixe pas elle-même"""
+    if '__raw__' in update or any(cle.split('__')[-1] == 'updated_at' for cle in update):
+        return
+    update['set__updated_at'] = maintenant()
+
+
+class QuerySetVersionne(QuerySet):
+    """QuerySet dont les écritures groupées incrémentent la version de la collection"""
+    def insert(self, *args, **kwargs):
+        resultat = super().insert(*args, **kwargs)
+        versions.toucher(self._document)
+        return resultat
+
+    def update(self, *args, **kwargs):
+        resultat = super().update(*args, **kwargs)
+        versions.toucher(self._document)
+        return resultat
+
+    def modify(self, *args, **kwargs):
+        resultat = super().modify(*args, **kwargs)
+        versions.toucher(self._document)
+        return resultat
+
+    def delete(self, *args, **kwargs):
+        resultat = super().delete(*args, **kwargs)
+        versions.toucher(self._document)
+        return resultat
+
+
+class QuerySetHorodate(QuerySetVersionne):
+    """Comme QuerySetVersionne, et update/modify maintiennent updated_at"""
+    def update(self, *args, **kwargs):
+        horodater(kwargs)
+        return super().update(*args, **kwargs)
+
+    def modify(self, *args, **kwargs):
+        if not kwargs.get('remove'):
+            horodater(kwargs)
+        return super().modify(*args, **kwargs)
+
+
+class Versionne(Document):
+    """Document dont toute écriture incrémente la version de la collection (utils.versions)"""
+    meta = {
+        'abstract': True,
+        'queryset_class': QuerySetVersionne,
+    }
+
+    def save(self, *args, **kwargs):
+        resultat = super().save(*args, **kwargs)
+        versions.toucher(type(self))
+        return resultat
+
+
+class Horodate(Versionne):
+    """
+    Document versionné horodaté : created_at à la création, updated_at à
+    chaque save() et mise à jour par QuerySet. Les écritures pymongo directes
+    fixent elles-mêmes updated_at et appellent versions.toucher.
+    """
+    created_at = DateTimeField(default=maintenant)
+    updated_at = DateTimeField(default=maintenant)
+
+    meta = {
+        'abstract': True,
+        'queryset_class': QuerySetHorodate,
+    }
+
+    def save(self, *args, **kwargs):
+        self.updated_at = maintenant()
+        return super().save(*args, **kwargs)
@@ -0,0 +1,104 @@
+import logging
+from django.conf import settings
+from django.core import checks
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Options d'index comparées avec la base ; les autres (nom, background...) sont ignorées
+OPTIONS_COMPAREES = ('unique', 'sparse', 'expireAfterSeconds', 'partialFilterExpression')
+
+_registre = {}
+
+
+def declarer(document_cls, *specs):
+    """
+    Déclare les index d'un Document, dans la syntaxe de meta['indexes'] de
+    mongoengine. Les index des champs `unique` et géographiques sont ajoutés
+    automatiquement. Les Documents déclarés ici ont `auto_create_index` à False :
+    leurs index sont créés par `manage.py ensure_indexes`, pas à la première requête.
+    """
+    document_cls._meta['auto_create_index'] = False
+    document_cls._meta['index_specs'] = document_cls._build_index_specs(list(specs))
+    _registre[document_cls] = document_cls._meta['index_specs']
+
+
+def documents():
+    return sorted(_registre, key=lambda document_cls: document_cls._get_collection_name())
+
+
+def cle(champs):
+    return tuple((champ, direction) for champ, direction in champs)
+
+
+def options(spec):
+    return {
+        option: spec[option]
+        for option in OPTIONS_COMPAREES
+        if spec.get(option) not in (None, False)
+    }
+
+
+def ecarts(document_cls):
+    """
+    Compare les index attendus d'un Document avec ceux de la base :
+    manquants (specs), differents ((spec, nom de l'index existant)) et
+    en_trop (noms), l'index _id_ excepté.
+    """
+    existants = {
+        cle(info['key']): (nom, info)
+        for nom, info in document_cls._get_collection().index_information().items()
+        if nom != '_id_'
+    }
+    manquants, differents = [], []
+    for spec in _registre[document_cls]:
+        existant = existants.pop(cle(spec['fields']), None)
+        if existant is None:
+            manquants.append(spec)
+        elif options(existant[1]) != options(spec):
+            differents.append((spec, existant[0]))
+    en_trop = [nom for nom, _ in existants.values()]
+    return {'manquants': manquants, 'differents': differents, 'en_trop': en_trop}
+
+
+def creer(document_cls, spec):
+    """Crée un index sans bloquer la collection (construction en arrière-plan avant MongoDB 4.2)"""
+    spec = dict(spec)
+    champs = spec.pop('fields')
+    spec.pop('cls', None)
+    return document_cls._get_collection().create_index(champs, background=True, **spec)
+
+
+def decrire(spec):
+    champs = ', '.join(f"{champ}:{direction}" for champ, direction in spec['fields'])
+    suffixe = ''.join(f" {option}={valeur}" for option, valeur in options(spec).items())
+    return f"({champs}){suffixe}"
+
+
+def verifier_index(app_configs, **kwargs):
+    """Vérification au démarrage : avertit des index déclarés absents de la base"""
+    if not getattr(settings, 'INDEX_VERIFICATION_DEMARRAGE', True):
+        return []
+    avertissements = []
+    for document_cls in documents():
+        collection = document_cls._get_collection_name()
+        try:
+            ecart = ecarts(document_cls)
+        except PyMongoError as erreur:
+            return [checks.Warning(
+                f"Index MongoDB non vérifiés : {erreur}",
+                id='utils.W002',
+            )]
+        for spec in ecart['manquants']:
+            avertissements.append(checks.Warning(
+                f"Index manquant sur {collection} : {decrire(spec)}",
+                hint="Lancer python manage.py ensure_indexes",
+                id='utils.W001',
+            ))
+        for spec, nom in ecart['differents']:
+            avertissements.append(checks.Warning(
+                f"Index {nom} de {collection} différent de la déclaration {decrire(spec)}",
+                hint="Lancer python manage.py ensure_indexes --remplacer",
+                id='utils.W001',
+            ))
+    return avertissements
@@ -0,0 +1,42 @@
+import gzip
+from django.core.management.base import BaseCommand
+from utils.management.commands.benchmark_lecture import RESSOURCES, chronometrer
+from utils.rendu import rendus
+
+
+class Command(BaseCommand):
+    help = ("Compare, sur une page des premiers documents de chaque ressource, les formats "
+            "de réponse proposés (JSON, MessagePack, CBOR) : taille brute et compressée "
+            "(gzip), durée médiane d'encodage, rapport à JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nombre', type=int, default=500, help="Documents lus par ressource")
+        parser.add_argument('--repetitions', type=int, default=5)
+        parser.add_argument('--ressource', choices=sorted(RESSOURCES), action='append',
+                            help="Ressource à mesurer (toutes par défaut ; répétable)")
+
+    def handle(self, *args, **options):
+        formats = rendus()
+        self.stdout.write(f"Formats : {', '.join(rendu.format for rendu in formats)} (référence : {formats[0].format})")
+        for nom in options['ressource'] or RESSOURCES:
+            document_cls, serializer_cls = RESSOURCES[nom]
+            lecture = serializer_cls.lecture_brute
+            elements = list(
+                document_cls.objects.order_by('id').only(*lecture.champs).limit(options['nombre']).as_pymongo()
+            )
+            # Même forme qu'une page de liste
+            donnees = {'next': None, 'results': lecture.representer(elements)}
+
+            reference = None
+            self.stdout.write(f"{nom} ({len(elements)} documents)")
+            for rendu in formats:
+                duree, octets = chronometrer(lambda: rendu.render(donnees), options['repetitions'])
+                compresses = len(gzip.compress(octets))
+                if reference is None:
+                    reference = (len(octets), compresses, duree)
+                taille_ref, compresses_ref, duree_ref = reference
+                self.stdout.write(
+                    f"  {rendu.format:<8} {len(octets):>9} o ({len(octets) / taille_ref:4.0%})  "
+                    f"gzip {compresses:>8} o ({compresses / compresses_ref:4.0%})  "
+                    f"encodage {duree:7.2f} ms (x{duree_ref / duree if duree else 0:.1f})"
+                )
@@ -0,0 +1,74 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from notifications.models import Notification
+from notifications.serializers import NotificationSerializer
+from recommandations.models import Recommandation
+from recommandations.serializers import RecommandationSerializer
+from statistiques.models import Statistique
+from statistiques.serializers import StatistiqueSerializer
+from vagues_chaleur.models import VagueChaleur
+from vagues_chaleur.serializers import VagueChaleurSerializer
+from zones_geographiques.models import ZoneGeographique
+from zones_geographiques.serializers import ZoneGeographiqueSerializer
+
+RESSOURCES = {
+    'notifications': (Notification, NotificationSerializer),
+    'vagues': (VagueChaleur, VagueChaleurSerializer),
+    'zones': (ZoneGeographique, ZoneGeographiqueSerializer),
+    'recommandations': (Recommandation, RecommandationSerializer),
+    'statistiques': (Statistique, StatistiqueSerializer),
+}
+
+
+def chronometrer(fonction, repetitions):
+    """Durée médiane en millisecondes et résultat de la dernière exécution"""
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        resultat = fonction()
+        durees.append((time.perf_counter() - debut) * 1000)
+    return statistics.median(durees), resultat
+
+
+class Command(BaseCommand):
+    help = ("Compare, sur les premiers documents de chaque ressource, la lecture par "
+            "les sérialiseurs (Documents mongoengine) et la lecture brute des listes "
+            "(utils.brut) : durée médiane requête + rendu JSON, et identité des octets.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nombre', type=int, default=500, help="Documents lus par ressource")
+        parser.add_argument('--repetitions', type=int, default=5)
+        parser.add_argument('--ressource', choices=sorted(RESSOURCES), action='append',
+                            help="Ressource à mesurer (toutes par défaut ; répétable)")
+
+    def handle(self, *args, **options):
+        rendu = JSONRenderer()
+        nombre = options['nombre']
+        differences = 0
+        for nom in options['ressource'] or RESSOURCES:
+            document_cls, serializer_cls = RESSOURCES[nom]
+            lecture = serializer_cls.lecture_brute
+
+            def documents():
+                elements = list(document_cls.objects.order_by('id').no_dereference().limit(nombre))
+                return rendu.render(serializer_cls(elements, many=True).data)
+
+            def brut():
+                elements = list(document_cls.objects.order_by('id').only(*lecture.champs).limit(nombre).as_pymongo())
+                return rendu.render(lecture.representer(elements))
+
+            duree_documents, octets_documents = chronometrer(documents, options['repetitions'])
+            duree_brute, octets_bruts = chronometrer(brut, options['repetitions'])
+            identiques = octets_documents == octets_bruts
+            differences += not identiques
+            gain = duree_documents / duree_brute if duree_brute else 0
+            ligne = (f"{nom:<16} {len(octets_bruts):>9} o  sérialiseur {duree_documents:8.1f} ms  "
+                     f"brut {duree_brute:8.1f} ms  x{gain:.1f}")
+            if identiques:
+                self.stdout.write(ligne)
+            else:
+                self.stdout.write(self.style.ERROR(f"{ligne}  SORTIES DIFFÉRENTES"))
+        if differences:
+            raise CommandError(f"{differences} ressource(s) aux sorties différentes entre les deux lectures")
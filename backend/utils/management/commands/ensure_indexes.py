@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from utils import indexes
+
+
+class Command(BaseCommand):
+    help = ("Crée les index MongoDB déclarés dans les modules indexes.py des "
+            "applications et signale les écarts avec la base (index manquants, "
+            "aux options différentes ou non déclarés).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verifier', action='store_true',
+                            help="Signale les écarts sans rien modifier ; code de sortie 1 si la base diffère")
+        parser.add_argument('--remplacer', action='store_true',
+                            help="Supprime puis recrée les index dont les options diffèrent")
+        parser.add_argument('--supprimer-en-trop', action='store_true',
+                            help="Supprime les index présents en base mais non déclarés")
+
+    def handle(self, *args, **options):
+        ecarts_restants = 0
+        for document_cls in indexes.documents():
+            collection = document_cls._get_collection()
+            nom_collection = collection.name
+            ecart = indexes.ecarts(document_cls)
+
+            for spec in ecart['manquants']:
+                if options['verifier']:
+                    self.stdout.write(f"{nom_collection} : index manquant {indexes.decrire(spec)}")
+                    ecarts_restants += 1
+                    continue
+                nom = indexes.creer(document_cls, spec)
+                self.stdout.write(self.style.SUCCESS(f"{nom_collection} : index {nom} créé"))
+
+            for spec, nom in ecart['differents']:
+                if options['remplacer'] and not options['verifier']:
+                    collection.drop_index(nom)
+                    nom = indexes.creer(document_cls, spec)
+                    self.stdout.write(self.style.SUCCESS(f"{nom_collection} : index {nom} recréé"))
+                    continue
+                self.stdout.write(self.style.WARNING(
+                    f"{nom_collection} : index {nom} différent de la déclaration {indexes.decrire(spec)}"
+                ))
+                ecarts_restants += 1
+
+            for nom in ecart['en_trop']:
+                if options['supprimer_en_trop'] and not options['verifier']:
+                    collection.drop_index(nom)
+                    self.stdout.write(self.style.SUCCESS(f"{nom_collection} : index {nom} supprimé"))
+                    continue
+                self.stdout.write(self.style.WARNING(f"{nom_collection} : index {nom} non déclaré"))
+                ecarts_restants += 1
+
+        if options['verifier'] and ecarts_restants:
+            raise CommandError(f"{ecarts_restants} écart(s) entre les index déclarés et la base")
+        self.stdout.write(self.style.SUCCESS(f"Index à jour, {ecarts_restants} écart(s) restant(s)"))
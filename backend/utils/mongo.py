@@ -0,0 +1,48 @@
+import logging
+import os
+import mongoengine
+from mongoengine.queryset.base import BaseQuerySet
+from django.conf import settings
+from pymongo import ReadPreference
+from pymongo.read_preferences import SecondaryPreferred
+
+logger = logging.getLogger(__name__)
+
+
+def connecter():
+    """
+    Enregistre la connexion mongoengine sans ouvrir de socket : le client
+    pymongo se connecte à la première requête, dans le processus qui l'utilise.
+    """
+    mongoengine.connect(**settings.MONGODB, connect=False)
+
+
+def reconnecter_apres_fork():
+    # Un client pymongo ne doit pas traverser un fork : le processus enfant
+    # abandonne celui hérité du parent et en recrée un à la première requête
+    mongoengine.disconnect()
+    connecter()
+
+
+def preference_lecture():
+    """Préférence de lecture des endpoints en lecture seule, primaire par défaut"""
+    if not getattr(settings, 'MONGO_LECTURE_SECONDAIRE', False):
+        return ReadPreference.PRIMARY
+    staleness = getattr(settings, 'MONGO_MAX_STALENESS_S', -1)
+    return SecondaryPreferred(max_staleness=staleness)
+
+
+def lecture_secondaire(source):
+    """
+    Applique la préférence de lecture analytique à un QuerySet mongoengine ou à
+    une collection pymongo. Sans MONGO_LECTURE_SECONDAIRE, la source est inchangée.
+    """
+    if not getattr(settings, 'MONGO_LECTURE_SECONDAIRE', False):
+        return source
+    if isinstance(source, BaseQuerySet):
+        return source.read_preference(preference_lecture())
+    return source.with_options(read_preference=preference_lecture())
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reconnecter_apres_fork)
@@ -0,0 +1,164 @@
+import base64
+import binascii
+from bson import ObjectId, json_util
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from utils.prefetch import id_reference
+
+
+def encoder_curseur(valeur, identifiant):
+    """Encode la position (valeur du champ de tri, _id) en curseur opaque"""
+    brut = json_util.dumps([valeur, identifiant])
+    return base64.urlsafe_b64encode(brut.encode()).decode().rstrip('=')
+
+
+def decoder_curseur(curseur):
+    try:
+        brut = base64.urlsafe_b64decode(curseur + '=' * (-len(curseur) % 4))
+        valeur, identifiant = json_util.loads(brut)
+    except (binascii.Error, ValueError, TypeError):
+        raise ValidationError({'curseur': 'Curseur invalide'})
+    if not isinstance(identifiant, ObjectId):
+        raise ValidationError({'curseur': 'Curseur invalide'})
+    return valeur, identifiant
+
+
+def condition_apres(champ, descendant, valeur, identifiant, unique=False):
+    """Filtre Mongo des documents situés strictement après la position (valeur, _id)"""
+    operateur = '$lt' if descendant else '$gt'
+    if champ == '_id':
+        return {'_id': {operateur: identifiant}}
+    if unique:
+        return {champ: {operateur: valeur}}
+    return {'$or': [
+        {champ: {operateur: valeur}},
+        {champ: valeur, '_id': {operateur: identifiant}},
+    ]}
+
+
+class PaginationCurseur(BasePagination):
+    """
+    Pagination par clé (keyset) sur le couple indexé (champ de tri, _id).
+    Le coût d'une page ne dépend pas de sa position : pas de skip.
+    `unique` indique que le champ de tri est unique dans le filtre, l'_id n'est
+    alors pas nécessaire pour départager et l'index (filtre, champ) suffit.
+    """
+    parametre_curseur = 'curseur'
+    parametre_taille = 'taille'
+
+    def __init__(self, tri='_id', unique=False):
+        self.unique = unique
+        self.descendant = tri.startswith('-')
+        self.champ = tri.lstrip('-')
+        if self.champ in ('id', 'pk'):
+            self.champ = '_id'
+        self.suivant = None
+        self.request = None
+
+    def parametres(self, request):
+        # Requête DRF ou HttpRequest des vues asynchrones
+        return getattr(request, 'query_params', request.GET)
+
+    def taille_page(self, request):
+        taille_defaut = getattr(settings, 'PAGINATION_TAILLE_PAGE', 50)
+        taille_max = getattr(settings, 'PAGINATION_TAILLE_MAX', 500)
+        try:
+            taille = int(self.parametres(request).get(self.parametre_taille, taille_defaut))
+        except ValueError:
+            raise ValidationError({self.parametre_taille: 'Doit être un entier'})
+        return min(max(taille, 1), taille_max)
+
+    def ordonner(self, queryset, request):
+        """Queryset trié comme les pages, à partir du curseur éventuel, sans limite"""
+        self.request = request
+        curseur = self.parametres(request).get(self.parametre_curseur)
+        if curseur:
+            valeur, identifiant = decoder_curseur(curseur)
+            queryset = queryset.filter(__raw__=condition_apres(self.champ, self.descendant, valeur, identifiant, self.unique))
+        
+        signe = '-' if self.descendant else '+'
+        champ_tri = 'id' if self.champ == '_id' else self.champ
+        tri = [signe + champ_tri] if champ_tri == 'id' or self.unique else [signe + champ_tri, signe + 'id']
+        return queryset.no_dereference().order_by(*tri)
+
+    def _page(self, queryset, request):
+        """Queryset de la page demandée, un élément de plus pour détecter la suivante"""
+        taille = self.taille_page(request)
+        return self.ordonner(queryset, request).limit(taille + 1), taille
+
+    def paginate_queryset(self, queryset, request, view=None):
+        requete, taille = self._page(queryset, request)
+        page = list(requete)
+        self.suivant = None
+        if len(page) > taille:
+            page = page[:taille]
+            dernier = page[-1]
+            valeur = dernier.pk if self.champ == '_id' else id_reference(dernier._data.get(self.champ))
+            self.suivant = encoder_curseur(valeur, dernier.pk)
+        return page
+
+    def paginer_documents(self, queryset, request):
+        """Même pagination en documents bruts (as_pymongo), sans instancier de Document"""
+        requete, taille = self._page(queryset, request)
+        page = list(requete.as_pymongo())
+        self.suivant = None
+        if len(page) > taille:
+            page = page[:taille]
+            dernier = page[-1]
+            self.suivant = encoder_curseur(dernier.get(self.champ), dernier['_id'])
+        return page
+
+    def ordonner_collection(self, collection, filtre, request, projection=None):
+        """Curseur pymongo trié comme les pages, à partir du curseur éventuel, sans limite"""
+        self.request = request
+        curseur = self.parametres(request).get(self.parametre_curseur)
+        if curseur:
+            valeur, identifiant = decoder_curseur(curseur)
+            condition = condition_apres(self.champ, self.descendant, valeur, identifiant, self.unique)
+            filtre = {**filtre, **condition} if not filtre.keys() & condition.keys() else {'$and': [filtre, condition]}
+
+        sens = -1 if self.descendant else 1
+        tri = [(self.champ, sens)] if self.champ == '_id' or self.unique else [(self.champ, sens), ('_id', sens)]
+        return collection.find(filtre, projection).sort(tri)
+
+    async def paginer_collection(self, collection, filtre, request, projection=None):
+        """
+        Même pagination sur une collection pymongo asynchrone ; retourne des
+        documents bruts. Une `projection` inclut toujours le champ de tri.
+        """
+        taille = self.taille_page(request)
+        if projection is not None:
+            projection = {**projection, self.champ: 1}
+        page = await self.ordonner_collection(collection, filtre, request, projection).limit(taille + 1).to_list(None)
+        self.suivant = None
+        if len(page) > taille:
+            page = page[:taille]
+            dernier = page[-1]
+            self.suivant = encoder_curseur(dernier.get(self.champ), dernier['_id'])
+        return page
+
+    def donnees_paginees(self, data):
+        return {
+            'next': self.get_next_link(),
+            'results': data,
+        }
+
+    def get_next_link(self):
+        if self.suivant is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.parametre_curseur, self.suivant)
+
+    def get_paginated_response(self, data):
+        return Response(self.donnees_paginees(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,68 @@
+from bson import DBRef
+from mongoengine import Document
+from mongoengine.queryset import QuerySet
+from rest_framework import serializers
+
+
+def id_reference(valeur):
+    """Retourne l'identifiant d'une référence (Document, DBRef ou ObjectId) sans la déréférencer"""
+    if isinstance(valeur, DBRef):
+        return valeur.id
+    if isinstance(valeur, Document):
+        return valeur.pk
+    return valeur
+
+
+def charger_references(document_cls, ids, champs):
+    """Charge les documents référencés en une seule requête $in, projetée sur les champs utiles"""
+    ids = {i for i in ids if i is not None}
+    if not ids:
+        return {}
+    return {
+        document.pk: document
+        for document in document_cls.objects(pk__in=list(ids)).only(*champs).no_dereference()
+    }
+
+
+class PrefetchListSerializer(serializers.ListSerializer):
+    """
+    Sérialisation many=True en nombre de requêtes constant : les références de
+    toutes les instances sont chargées d'un coup avant la représentation.
+    """
+    def to_representation(self, data):
+        if isinstance(data, QuerySet):
+            data = data.no_dereference()
+        instances = list(data)
+        self.child.references = self.child.precharger(instances)
+        try:
+            return [self.child.to_representation(instance) for instance in instances]
+        finally:
+            self.child.references = None
+
+
+class PrefetchMixin:
+    """
+    À combiner avec serializers.Serializer. `references_prechargees` associe à
+    chaque ReferenceField le Document cible et les champs utilisés par la
+    représentation ; `reference()` lit alors le cache au lieu de déréférencer.
+    """
+    references_prechargees = {}
+    references = None
+
+    class Meta:
+        list_serializer_class = PrefetchListSerializer
+
+    def precharger(self, instances):
+        return {
+            champ: charger_references(
+                document_cls,
+                (id_reference(instance._data.get(champ)) for instance in instances),
+                champs
+            )
+            for champ, (document_cls, champs) in self.references_prechargees.items()
+        }
+
+    def reference(self, instance, champ):
+        if self.references is None:
+            return getattr(instance, champ)
+        return self.references[champ].get(id_reference(instance._data.get(champ)))
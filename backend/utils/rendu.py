@@ -0,0 +1,193 @@
+import datetime
+import cbor2
+import msgpack
+import orjson
+from asgiref.sync import sync_to_async
+from bson import ObjectId
+from rest_framework.exceptions import NotAcceptable, ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+# Dates UTC en 'Z' comme l'encodeur de DRF ; clés non str converties
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+_encodeur_drf = JSONEncoder()
+
+
+def par_defaut(obj):
+    """Types qu'orjson ne connaît pas : ObjectId, puis ceux de l'encodeur de DRF (Decimal, timedelta...)"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    return _encodeur_drf.default(obj)
+
+
+def encoder(donnees):
+    """
+    JSON compact en UTF-8, mêmes octets que JSONRenderer de DRF : orjson
+    encode nativement dates, UUID et dictionnaires, sans passer par Python.
+    """
+    contenu = orjson.dumps(donnees, default=par_defaut, option=OPTIONS)
+    # Séparateurs de ligne Unicode échappés comme le fait DRF (JSONP, <script>)
+    if b'\xe2\x80' in contenu:
+        contenu = contenu.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return contenu
+
+
+class RenduJSON(JSONRenderer):
+    """JSONRenderer sur orjson ; l'indentation demandée (Accept: ...; indent=4) reste confiée à DRF"""
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return encoder(data)
+
+
+def en_utc(date):
+    """Date naïve lue dans MongoDB : UTC"""
+    return date if date.tzinfo is not None else date.replace(tzinfo=datetime.timezone.utc)
+
+
+def par_defaut_msgpack(obj):
+    # Les dates aware sont encodées nativement (datetime=True), les naïves ici
+    if isinstance(obj, datetime.datetime):
+        return msgpack.Timestamp.from_datetime(en_utc(obj))
+    return par_defaut(obj)
+
+
+def par_defaut_cbor(encodeur, obj):
+    encodeur.encode(par_defaut(obj))
+
+
+class RenduBinaire(BaseRenderer):
+    """
+    Format binaire compact, choisi par l'en-tête Accept (ou ?format=) : mêmes
+    données que le JSON, mais nombres binaires et dates en horodatages
+    natifs au lieu de chaînes ISO 8601.
+    """
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return self.encoder(data)
+
+
+class RenduMessagePack(RenduBinaire):
+    """MessagePack, dates en extension Timestamp (type -1) : 6 à 10 octets au lieu de 21 à 29 en JSON"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+
+    def encoder(self, donnees):
+        return msgpack.packb(donnees, default=par_defaut_msgpack, datetime=True)
+
+
+class RenduCBOR(RenduBinaire):
+    """CBOR (RFC 8949), dates en secondes epoch (tag 1)"""
+    media_type = 'application/cbor'
+    format = 'cbor'
+
+    def encoder(self, donnees):
+        return cbor2.dumps(
+            donnees, default=par_defaut_cbor, datetime_as_timestamp=True, timezone=datetime.timezone.utc
+        )
+
+
+class AnalyseurMessagePack(BaseParser):
+    """Corps de requête MessagePack ; les Timestamp sont lus en dates UTC"""
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), timestamp=3)
+        except (ValueError, msgpack.UnpackException):
+            raise ParseError("Corps MessagePack invalide")
+
+
+class AnalyseurCBOR(BaseParser):
+    """Corps de requête CBOR"""
+    media_type = 'application/cbor'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return cbor2.loads(stream.read())
+        except (ValueError, cbor2.CBORDecodeError):
+            raise ParseError("Corps CBOR invalide")
+
+
+def rendus():
+    """Rendus configurés hors API navigable, utilisables par les vues asynchrones"""
+    return [
+        rendu() for rendu in api_settings.DEFAULT_RENDERER_CLASSES
+        if rendu.media_type != 'text/html'
+    ]
+
+
+def negocier(request):
+    """
+    Rendu d'une requête hors DRF choisi comme le fait DRF : ?format=, sinon
+    l'en-tête Accept, le premier rendu configuré à défaut ; mémorisé sur la
+    requête. NotAcceptable si aucun ne convient (l'erreur est rendue en JSON).
+    """
+    if not hasattr(request, '_rendu'):
+        disponibles = rendus()
+        request._rendu = disponibles[0]
+        format_demande = request.GET.get(api_settings.URL_FORMAT_OVERRIDE)
+        if format_demande:
+            choisis = [rendu for rendu in disponibles if rendu.format == format_demande]
+        else:
+            media_type = request.get_preferred_type([rendu.media_type for rendu in disponibles])
+            choisis = [rendu for rendu in disponibles if rendu.media_type == media_type]
+        if not choisis:
+            raise NotAcceptable(available_renderers=disponibles)
+        request._rendu = choisis[0]
+    return request._rendu
+
+
+def verifier_flux(rendu):
+    """Le flux (?flux=1) est du JSON : un format binaire n'y est pas proposé"""
+    if isinstance(rendu, RenduBinaire):
+        raise NotAcceptable("Le flux (?flux=1) n'est disponible qu'en JSON")
+
+
+DEBUT_FLUX = b'{"next":null,"results":['
+FIN_FLUX = b']}'
+
+
+def morceaux(lots):
+    """
+    Corps d'une liste en flux, de même forme qu'une dernière page : chaque
+    lot de représentations est encodé et envoyé dès qu'il est prêt.
+    """
+    yield DEBUT_FLUX
+    separateur = b''
+    for donnees in lots:
+        if donnees:
+            yield separateur + encoder(donnees)[1:-1]
+            separateur = b','
+    yield FIN_FLUX
+
+
+async def morceaux_async(lots):
+    """`morceaux` pour un itérateur asynchrone de lots"""
+    yield DEBUT_FLUX
+    separateur = b''
+    async for donnees in lots:
+        if donnees:
+            yield separateur + encoder(donnees)[1:-1]
+            separateur = b','
+    yield FIN_FLUX
+
+
+async def parcourir_async(morceaux):
+    """
+    Itérateur synchrone de morceaux (lecture d'un curseur pymongo) parcouru
+    depuis la boucle : chaque morceau est produit dans un thread puis envoyé
+    """
+    iterateur = iter(morceaux)
+    suivant = sync_to_async(next)
+    while (morceau := await suivant(iterateur, None)) is not None:
+        yield morceau
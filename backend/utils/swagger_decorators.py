@@ -17,4 +17,30 @@ def swagger_bearer_auth(**kwargs):
         )
     )
     
-    return swagger_auto_schema(**kwargs)
\ No newline at end of file
+    return swagger_auto_schema(**kwargs)
+
+# Sélection des champs des lectures (utils.brut.Selection)
+PARAMETRES_SELECTION = [
+    openapi.Parameter(
+        'fields',
+        openapi.IN_QUERY,
+        description="Champs à renvoyer, séparés par des virgules (l'id est toujours inclus) ; "
+                    "une relation non développée vaut son identifiant",
+        type=openapi.TYPE_STRING,
+    ),
+    openapi.Parameter(
+        'expand',
+        openapi.IN_QUERY,
+        description="Relations à développer, séparées par des virgules ; sans fields ni expand, "
+                    "toutes les relations sont développées",
+        type=openapi.TYPE_STRING,
+    ),
+]
+
+# Liste complète en flux (utils.brut.flux) au lieu d'une page
+PARAMETRE_FLUX = openapi.Parameter(
+    'flux',
+    openapi.IN_QUERY,
+    description="1 : toute la liste en une réponse diffusée par lots (export), sans pagination",
+    type=openapi.TYPE_STRING,
+)
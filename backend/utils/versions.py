@@ -0,0 +1,72 @@
+import datetime
+import threading
+from mongoengine import Document, StringField, IntField, DateTimeField
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+
+class Version(Document):
+    """
+    Version d'une collection, incrémentée à chaque écriture : validateur
+    HTTP des lectures (utils.conditionnel) et clé du cache des réponses
+    (utils.cache_reponses) sans relire les documents.
+    """
+    collection = StringField(primary_key=True)
+    version = IntField(default=0)
+    modifie_le = DateTimeField()
+
+    meta = {
+        'collection': 'versions',
+    }
+
+
+# Écritures versionnées de ce processus : un état des versions gardé en
+# mémoire (vagues_chaleur.cache) est relu dès que ce processus a écrit
+_ecritures_locales = 0
+_verrou = threading.Lock()
+
+
+def ecritures_locales():
+    return _ecritures_locales
+
+
+def toucher(*document_classes):
+    """Incrémente la version des collections des Documents après une écriture"""
+    global _ecritures_locales
+    maintenant = datetime.datetime.now(datetime.timezone.utc)
+    noms = {document_cls._get_collection_name() for document_cls in document_classes}
+    operations = [
+        UpdateOne(
+            {'_id': nom},
+            {'$inc': {'version': 1}, '$set': {'modifie_le': maintenant}},
+            upsert=True
+        )
+        for nom in noms
+    ]
+    try:
+        Version._get_collection().bulk_write(operations, ordered=False)
+    except BulkWriteError as erreur:
+        # Première écriture simultanée d'une collection : le perdant est rejoué
+        rejouees = [operations[e['index']] for e in erreur.details['writeErrors'] if e['code'] == 11000]
+        if len(rejouees) < len(erreur.details['writeErrors']):
+            raise
+        Version._get_collection().bulk_write(rejouees, ordered=False)
+    finally:
+        # Compté après l'écriture : un lecteur qui a vu l'ancien compte relira les versions
+        with _verrou:
+            _ecritures_locales += 1
+
+
+def filtre(document_classes):
+    return {'_id': {'$in': sorted({document_cls._get_collection_name() for document_cls in document_classes})}}
+
+
+def etats(documents):
+    """{collection: (version, modifie_le)} de documents bruts de la collection versions"""
+    return {document['_id']: (document.get('version', 0), document.get('modifie_le')) for document in documents}
+
+
+def lire(document_classes, collection=None):
+    """{collection: (version, modifie_le)} ; une collection jamais écrite est absente"""
+    collection = Version._get_collection() if collection is None else collection
+    return etats(collection.find(filtre(document_classes)))
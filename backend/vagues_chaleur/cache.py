@@ -0,0 +1,140 @@
+import datetime
+import threading
+from django.conf import settings
+from utils import versions
+from utils.asynchrone import collection, charger_references
+from zones_geographiques.models import ZoneGeographique
+from .models import VagueChaleur
+from .representations import representation_vague, CHAMPS_ZONE
+from .serializers import VagueChaleurSerializer
+
+# Cache de processus des vagues actives : (représentations, expiration, état des versions)
+_entree = (None, None, None)
+# Dernier état des versions lu : (état, valable jusqu'à, écritures locales à la lecture)
+_verification = (None, None, None)
+_verrou = threading.Lock()
+
+# Collections lues par la représentation : les vagues et leur zone développée
+COLLECTIONS = (VagueChaleur, ZoneGeographique)
+
+
+def maintenant():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def en_utc(date):
+    """Les dates relues depuis Mongo sont naïves mais exprimées en UTC"""
+    if date.tzinfo is None:
+        return date.replace(tzinfo=datetime.timezone.utc)
+    return date
+
+
+def invalider():
+    """Vide le cache du processus"""
+    global _entree, _verification
+    with _verrou:
+        _entree = (None, None, None)
+        _verification = (None, None, None)
+
+
+def etat(documents):
+    """Clé du cache : versions (utils.versions) des collections lues, communes à tous les processus"""
+    return tuple(sorted((nom, version) for nom, (version, _) in versions.etats(documents).items()))
+
+
+def etat_recent(instant):
+    """
+    État des versions lu il y a moins de VAGUES_ACTIVES_VERIFICATION
+    secondes, si ce processus n'a rien écrit depuis ; None sinon
+    """
+    etat_lu, limite, ecritures = _verification
+    if etat_lu is not None and instant < limite and ecritures == versions.ecritures_locales():
+        return etat_lu
+    return None
+
+
+def retenir(instant, ecritures, etat_lu):
+    global _verification
+    delai = datetime.timedelta(seconds=getattr(settings, 'VAGUES_ACTIVES_VERIFICATION', 1.0))
+    with _verrou:
+        _verification = (etat_lu, instant + delai, ecritures)
+
+
+def borne(instant, fins, prochain_debut):
+    """Instant du prochain changement de l'ensemble actif : une fin ou un début de vague"""
+    bornes = [instant + datetime.timedelta(seconds=getattr(settings, 'VAGUES_ACTIVES_TTL', 60))]
+    # Une vague reste active tant que date_fin >= maintenant
+    bornes.extend(en_utc(fin) + datetime.timedelta(milliseconds=1) for fin in fins)
+    if prochain_debut is not None:
+        bornes.append(en_utc(prochain_debut))
+    return min(bornes)
+
+
+def prochaine_borne(instant, vagues):
+    prochaine = VagueChaleur.objects(date_debut__gt=instant).order_by('date_debut').only('date_debut').first()
+    return borne(instant, (vague.date_fin for vague in vagues), prochaine.date_debut if prochaine else None)
+
+
+def lire(instant, etat_courant):
+    """Représentations encore valides pour l'état courant des versions, ou None"""
+    donnees, expiration, etat_entree = _entree
+    if donnees is not None and etat_entree == etat_courant and instant < expiration:
+        return donnees
+    return None
+
+
+def enregistrer(donnees, expiration, etat_calcul):
+    global _entree
+    with _verrou:
+        _entree = (donnees, expiration, etat_calcul)
+
+
+def vagues_actives():
+    """
+    Représentations des vagues actives. Le chemin chaud ne lit que les
+    versions des vagues et des zones, au plus une fois par
+    VAGUES_ACTIVES_VERIFICATION secondes : toute écriture, quelle que soit la
+    méthode (save, update, delete), change la clé du cache, aussitôt dans
+    le processus écrivain et en au plus ce délai dans les autres. Le
+    recalcul a lieu aussi à la prochaine borne date_debut/date_fin, ou au
+    plus tard après VAGUES_ACTIVES_TTL secondes.
+    """
+    instant = maintenant()
+    etat_courant = etat_recent(instant)
+    if etat_courant is None:
+        # Lu avant le calcul : une écriture pendant le calcul rend l'entrée obsolète
+        ecritures = versions.ecritures_locales()
+        etat_courant = etat(versions.Version._get_collection().find(versions.filtre(COLLECTIONS)))
+        retenir(instant, ecritures, etat_courant)
+    donnees = lire(instant, etat_courant)
+    if donnees is not None:
+        return donnees
+    
+    vagues = list(VagueChaleur.objects(date_fin__gte=instant, date_debut__lte=instant).no_dereference())
+    donnees = VagueChaleurSerializer(vagues, many=True).data
+    enregistrer(donnees, prochaine_borne(instant, vagues), etat_courant)
+    return donnees
+
+
+async def vagues_actives_async():
+    """Même cache que vagues_actives, recalculé avec le pilote asynchrone"""
+    instant = maintenant()
+    etat_courant = etat_recent(instant)
+    if etat_courant is None:
+        ecritures = versions.ecritures_locales()
+        etat_courant = etat(await collection(versions.Version).find(versions.filtre(COLLECTIONS)).to_list(None))
+        retenir(instant, ecritures, etat_courant)
+    donnees = lire(instant, etat_courant)
+    if donnees is not None:
+        return donnees
+
+    vagues = collection(VagueChaleur)
+    documents = await vagues.find({'date_fin': {'$gte': instant}, 'date_debut': {'$lte': instant}}).to_list(None)
+    zones = await charger_references(
+        ZoneGeographique, (document.get('zone_geographique') for document in documents), CHAMPS_ZONE
+    )
+    donnees = [representation_vague(document, zones) for document in documents]
+    prochaine = await vagues.find_one({'date_debut': {'$gt': instant}}, {'date_debut': 1}, sort=[('date_debut', 1)])
+    expiration = borne(instant, (document['date_fin'] for document in documents), prochaine['date_debut'] if prochaine else None)
+    enregistrer(donnees, expiration, etat_courant)
+    return donnees
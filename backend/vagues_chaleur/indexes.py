@@ -0,0 +1,12 @@
+from utils.indexes import declarer
+from .models import VagueChaleur
+
+declarer(
+    VagueChaleur,
+    # Clés de pagination (champ de tri, _id) de la liste et du filtre par zone,
+    # bornes mensuelles des cumuls
+    ['date_debut', 'id'],
+    ['zone_geographique', 'date_debut', 'id'],
+    # Vagues actives : date_fin >= maintenant >= date_debut
+    ['date_fin', 'date_debut'],
+)
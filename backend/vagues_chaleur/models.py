@@ -1,8 +1,39 @@
-import datetime
+from django.dispatch import Signal
 from mongoengine import Document, StringField, FloatField, DateTimeField, ReferenceField, ListField
 from zones_geographiques.models import ZoneGeographique
+from utils.horodatage import Horodate, QuerySetHorodate
 
-class VagueChaleur(Document):
+# Mise à jour groupée de vagues (QuerySet update/modify), que les signaux de
+# mongoengine ne voient pas : arguments `avant` et `apres`, documents bruts
+mise_a_jour_groupee = Signal()
+
+
+class QuerySetVagues(QuerySetHorodate):
+    """
+    Les mises à jour groupées envoient `mise_a_jour_groupee` avec les vagues
+    visées avant et après l'écriture : les agrégats tenus à jour par les
+    signaux de save() (statistiques.cumuls) suivent aussi ces écritures.
+    """
+    def _ecrire(self, ecriture, *args, **kwargs):
+        if not mise_a_jour_groupee.has_listeners(self._document):
+            return ecriture(*args, **kwargs)
+        avant = list(self.clone().as_pymongo())
+        resultat = ecriture(*args, **kwargs)
+        ids = [document['_id'] for document in avant]
+        apres = {document['_id']: document for document in self._document.objects(id__in=ids).as_pymongo()}
+        if kwargs.get('upsert'):
+            # Vague créée si le filtre ne trouvait rien
+            apres.update((document['_id'], document) for document in self.clone().as_pymongo())
+        mise_a_jour_groupee.send(sender=self._document, avant=avant, apres=list(apres.values()))
+        return resultat
+
+    def update(self, *args, **kwargs):
+        return self._ecrire(super().update, *args, **kwargs)
+
+    def modify(self, *args, **kwargs):
+        return self._ecrire(super().modify, *args, **kwargs)
+
+class VagueChaleur(Horodate):
     temperature_max = FloatField(required=True)
     intensite = FloatField(required=True)
     humidite = FloatField(required=True)
@@ -13,14 +44,12 @@ class VagueChaleur(Document):
     # Relations
     # Une vague de chaleur provient d'une zone géographique (0..*)
     zone_geographique = ReferenceField(ZoneGeographique)
-    
-    created_at = DateTimeField(default=datetime.datetime.now(datetime.timezone.utc))
-    updated_at = DateTimeField(default=datetime.datetime.now(datetime.timezone.utc))
 
     def __str__(self):
         return f"Vague de chaleur - {self.temperature_max}°C du {self.date_debut} au {self.date_fin}"
 
     meta = {
-        'collection': 'vagues_chaleur'
+        'collection': 'vagues_chaleur',
+        'queryset_class': QuerySetVagues,
     }
 
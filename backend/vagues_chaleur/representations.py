@@ -0,0 +1,21 @@
+from utils.brut import Mappeur, Lecture, Reference, COMPLETE
+from zones_geographiques.models import ZoneGeographique
+from .models import VagueChaleur
+
+CHAMPS_VAGUE = ('temperature_max', 'intensite', 'humidite', 'date_debut', 'date_fin', 'duree', 'created_at', 'updated_at')
+CHAMPS_ZONE = ('ville', 'rue', 'numero')
+
+
+class LectureVagues(Lecture):
+    mappeur = Mappeur(VagueChaleur, CHAMPS_VAGUE)
+    relations = {
+        'zone_geographique': Reference(ZoneGeographique, Mappeur(ZoneGeographique, CHAMPS_ZONE), nulle=True),
+    }
+
+
+lecture = LectureVagues()
+
+
+def representation_vague(document, zones, selection=COMPLETE):
+    """Représentation de VagueChaleurSerializer construite depuis un document brut"""
+    return lecture.assembler([document], {'zone_geographique': zones}, selection)[0]
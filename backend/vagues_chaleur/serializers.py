@@ -1,8 +1,10 @@
 from rest_framework import serializers
 from .models import VagueChaleur
 from zones_geographiques.models import ZoneGeographique
+from utils.prefetch import PrefetchMixin
+from .representations import LectureVagues
 
-class VagueChaleurSerializer(serializers.Serializer):
+class VagueChaleurSerializer(PrefetchMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     temperature_max = serializers.FloatField()
     intensite = serializers.FloatField()
@@ -14,6 +16,13 @@ class VagueChaleurSerializer(serializers.Serializer):
     created_at = serializers.DateTimeField(read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
     
+    # Listes : lecture des documents bruts, à l'identique de to_representation
+    lecture_brute = LectureVagues()
+    
+    references_prechargees = {
+        'zone_geographique': (ZoneGeographique, ('ville', 'rue', 'numero')),
+    }
+    
     def create(self, validated_data):
         zone_id = validated_data.pop('zone_geographique_id', None)
         vague = VagueChaleur(**validated_data)
@@ -58,12 +67,13 @@ class VagueChaleurSerializer(serializers.Serializer):
         }
         
         # Ajouter les informations de la zone géographique
-        if instance.zone_geographique:
+        zone = self.reference(instance, 'zone_geographique')
+        if zone:
             data['zone_geographique'] = {
-                'id': str(instance.zone_geographique.id),
-                'ville': instance.zone_geographique.ville,
-                'rue': instance.zone_geographique.rue,
-                'numero': instance.zone_geographique.numero
+                'id': str(zone.id),
+                'ville': zone.ville,
+                'rue': zone.rue,
+                'numero': zone.numero
             }
         else:
             data['zone_geographique'] = None
@@ -1,3 +1,303 @@
-from django.test import TestCase
+import datetime
+from unittest import mock
+import cbor2
+import msgpack
+import orjson
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory, override_settings
+from utils.brut import Selection
+from utils.essais import TestMongo, creer_zone, creer_vague
+from utils.rendu import RenduJSON
+from utils.versions import Version
+from zones_geographiques.models import ZoneGeographique
+from . import cache, views_async
+from .models import VagueChaleur
+from .representations import lecture
 
-# Create your tests here.
+
+class RequetesListesTests(TestMongo):
+    """Les listes font un nombre de requêtes indépendant du nombre de lignes (références chargées par $in)"""
+
+    def setUp(self):
+        super().setUp()
+        self.zones = []
+
+    def ajouter(self, nombre):
+        for _ in range(nombre):
+            zone = creer_zone(len(self.zones) + 1)
+            self.zones.append(zone)
+            creer_vague(zone)
+            creer_vague(self.zones[0])
+
+    def urls(self):
+        return [
+            '/api/vagues-chaleur/',
+            f'/api/vagues-chaleur/par_zone/?zone_id={self.zones[0].id}',
+            '/api/vagues-chaleur/actives/',
+        ]
+
+    def test_nombre_de_requetes_constant(self):
+        self.assertRequetesConstantes(self.ajouter, self.urls)
+
+    def test_lecture_brute_identique(self):
+        self.ajouter(3)
+        # Vague sans zone
+        sans_zone = creer_vague()
+        self.assertLecturesIdentiques(self.urls() + [
+            f'/api/vagues-chaleur/{sans_zone.id}/',
+            f'/api/vagues-chaleur/par_zone/?zone_id={self.zones[1].id}',
+        ])
+
+
+class SelectionTests(TestMongo):
+    """?fields= et ?expand= : champs validés, relations en identifiant sauf si développées, lecture restreinte"""
+
+    def setUp(self):
+        super().setUp()
+        self.zone = creer_zone()
+        self.vague = creer_vague(self.zone)
+        creer_vague(creer_zone(2), temperature_max=44.0)
+        creer_vague()
+
+    def urls(self):
+        return [
+            '/api/vagues-chaleur/',
+            f'/api/vagues-chaleur/{self.vague.id}/',
+            '/api/vagues-chaleur/actives/',
+        ]
+
+    def lire(self, url, parametres):
+        reponse = self.client.get(url + ('&' if '?' in url else '?') + parametres)
+        self.assertEqual(reponse.status_code, 200, reponse.content[:300])
+        donnees = reponse.json()
+        donnees = donnees.get('results', donnees) if isinstance(donnees, dict) else donnees
+        return sorted(donnees if isinstance(donnees, list) else [donnees], key=lambda v: v['id'])
+
+    def test_parametres_inconnus(self):
+        for url in self.urls():
+            for parametres in ('fields=id,inconnu', 'expand=inconnue', 'expand=temperature_max'):
+                with self.subTest(url=url, parametres=parametres):
+                    reponse = self.client.get(f'{url}?{parametres}')
+                    self.assertEqual(reponse.status_code, 400)
+
+    def test_relation_en_identifiant(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                vague = next(v for v in self.lire(url, 'fields=id,zone_geographique') if v['id'] == str(self.vague.id))
+                self.assertEqual(vague, {'id': str(self.vague.id), 'zone_geographique': str(self.zone.id)})
+                vague = next(v for v in self.lire(url, 'fields=id&expand=zone_geographique') if v['id'] == str(self.vague.id))
+                self.assertEqual(vague['zone_geographique']['ville'], 'Dakar')
+
+    def test_lecture_restreinte(self):
+        self.assertEqual(lecture.projection(Selection({'temperature_max'})), ('temperature_max',))
+        self.assertEqual(lecture.projection(Selection({'zone_geographique'})), ('zone_geographique',))
+        for url in self.urls()[:2]:
+            with self.subTest(url=url):
+                with self.commandes.compter() as commandes:
+                    vagues = self.lire(url, 'fields=temperature_max,zone_geographique')
+                self.assertEqual({tuple(v) for v in vagues}, {('id', 'temperature_max', 'zone_geographique')})
+                # La relation demandée sans expand ne lit pas les zones, développée elle les lit
+                self.assertNotIn(ZoneGeographique._get_collection_name(), [cible for nom, cible in commandes if nom == 'find'])
+                with self.commandes.compter() as commandes:
+                    self.lire(url, 'fields=temperature_max&expand=zone_geographique')
+                self.assertIn(ZoneGeographique._get_collection_name(), [cible for nom, cible in commandes if nom == 'find'])
+
+    def test_cache_filtre_comme_la_lecture_brute(self):
+        documents = list(VagueChaleur.objects.as_pymongo())
+        for parametres in ('fields=temperature_max', 'fields=zone_geographique', 'fields=id&expand=zone_geographique', 'expand=zone_geographique'):
+            with self.subTest(parametres=parametres):
+                self.assertEqual(
+                    self.lire('/api/vagues-chaleur/actives/', parametres),
+                    self.lire('/api/vagues-chaleur/', parametres),
+                )
+                selection = Selection.depuis(RequestFactory().get('/?' + parametres), lecture)
+                self.assertEqual(
+                    [lecture.filtrer(representation, selection) for representation in lecture.representer(documents)],
+                    lecture.representer(documents, selection),
+                )
+
+
+class CacheActivesTests(TestMongo):
+    """Le cache des vagues actives suit les versions des vagues et des zones, quel que soit l'écrivain"""
+
+    def actives(self):
+        reponse = self.client.get('/api/vagues-chaleur/actives/')
+        self.assertEqual(reponse.status_code, 200)
+        return reponse.json()
+
+    def test_mise_a_jour_par_queryset(self):
+        vague = creer_vague(creer_zone())
+        self.assertEqual([v['temperature_max'] for v in self.actives()], [42.0])
+        VagueChaleur.objects(id=vague.id).update(set__temperature_max=45.0)
+        self.assertEqual([v['temperature_max'] for v in self.actives()], [45.0])
+        VagueChaleur.objects(id=vague.id).delete()
+        self.assertEqual(self.actives(), [])
+
+    def test_ecriture_d_une_zone(self):
+        zone = creer_zone()
+        creer_vague(zone)
+        self.assertEqual(self.actives()[0]['zone_geographique']['ville'], 'Dakar')
+        ZoneGeographique.objects(id=zone.id).update(set__ville='Thiès')
+        self.assertEqual(self.actives()[0]['zone_geographique']['ville'], 'Thiès')
+
+    def test_ecriture_d_un_autre_processus(self):
+        vague = creer_vague(creer_zone())
+        depart = cache.maintenant()
+        with mock.patch.object(cache, 'maintenant', return_value=depart):
+            self.actives()
+            # Un autre worker écrit : seule la collection versions en garde la trace
+            VagueChaleur._get_collection().update_one({'_id': vague.id}, {'$set': {'temperature_max': 47.0}})
+            Version._get_collection().update_one({'_id': 'vagues_chaleur'}, {'$inc': {'version': 1}})
+            # Vue au plus VAGUES_ACTIVES_VERIFICATION secondes plus tard
+            self.assertEqual([v['temperature_max'] for v in self.actives()], [42.0])
+        with mock.patch.object(cache, 'maintenant', return_value=depart + datetime.timedelta(seconds=1)):
+            self.assertEqual([v['temperature_max'] for v in self.actives()], [47.0])
+
+    @override_settings(VAGUES_ACTIVES_VERIFICATION=0)
+    def test_ecriture_d_un_autre_processus_sans_delai(self):
+        vague = creer_vague(creer_zone())
+        self.actives()
+        VagueChaleur._get_collection().update_one({'_id': vague.id}, {'$set': {'temperature_max': 47.0}})
+        Version._get_collection().update_one({'_id': 'vagues_chaleur'}, {'$inc': {'version': 1}})
+        self.assertEqual([v['temperature_max'] for v in self.actives()], [47.0])
+
+    def test_lecture_servie_par_le_cache(self):
+        creer_vague(creer_zone())
+        self.actives()
+        with self.commandes.compter() as commandes:
+            self.actives()
+        # Ni les vagues ni les versions, vérifiées il y a moins d'une seconde
+        self.assertEqual(commandes, [])
+
+
+class ConditionnelTests(TestMongo):
+    """GET conditionnels : 304 tant que les collections lues n'ont pas changé, nouvel ETag sinon"""
+
+    def setUp(self):
+        super().setUp()
+        self.zone = creer_zone()
+        self.vague = creer_vague(self.zone)
+
+    def lire(self, url, **entetes):
+        reponse = self.client.get(url, **entetes)
+        self.assertIn(reponse.status_code, (200, 304))
+        return reponse
+
+    def assertNonModifie(self, url, etag):
+        reponse = self.lire(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 304)
+        self.assertEqual(reponse.content, b'')
+        self.assertEqual(reponse['ETag'], etag)
+
+    def assertModifie(self, url, etag):
+        reponse = self.lire(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertNotEqual(reponse['ETag'], etag)
+        return reponse['ETag']
+
+    def test_liste(self):
+        url = '/api/vagues-chaleur/'
+        reponse = self.lire(url)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertIn('no-cache', reponse['Cache-Control'])
+        self.assertIn('Accept', reponse['Vary'])
+        etag = reponse['ETag']
+        self.assertNonModifie(url, etag)
+
+        creer_vague(self.zone)
+        etag = self.assertModifie(url, etag)
+        self.assertNonModifie(url, etag)
+        # Collection liée : la zone est incluse dans chaque vague
+        ZoneGeographique.objects(id=self.zone.id).update(set__ville='Thiès')
+        etag = self.assertModifie(url, etag)
+        VagueChaleur.objects(id=self.vague.id).delete()
+        self.assertModifie(url, etag)
+
+    def test_detail(self):
+        url = f'/api/vagues-chaleur/{self.vague.id}/'
+        reponse = self.lire(url)
+        etag, modifie_le = reponse['ETag'], reponse['Last-Modified']
+        self.assertNonModifie(url, etag)
+        self.assertEqual(self.lire(url, HTTP_IF_MODIFIED_SINCE=modifie_le).status_code, 304)
+
+        # Une autre vague ne change pas ce détail
+        creer_vague(self.zone)
+        self.assertNonModifie(url, etag)
+        self.vague.temperature_max = 45.0
+        self.vague.save()
+        self.assertModifie(url, etag)
+
+    def test_representation(self):
+        url = '/api/vagues-chaleur/'
+        json = self.lire(url)['ETag']
+        self.assertNotEqual(self.lire(url, HTTP_ACCEPT='application/msgpack')['ETag'], json)
+        self.assertNotEqual(self.lire(url + '?fields=id')['ETag'], json)
+        self.assertEqual(self.lire(url, HTTP_IF_NONE_MATCH=json, HTTP_ACCEPT='application/msgpack').status_code, 200)
+
+    def test_memes_validateurs_en_asynchrone(self):
+        url = f'/api/vagues-chaleur/par_zone/?zone_id={self.zone.id}'
+        etag = self.lire(url)['ETag']
+        reponse = async_to_sync(views_async.par_zone)(RequestFactory().get(url, HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(reponse.status_code, 304)
+        self.assertEqual(reponse['ETag'], etag)
+
+
+class FormatsBinairesTests(TestMongo):
+    """MessagePack et CBOR portent les mêmes données que le JSON, dans les réponses comme dans les corps"""
+    FORMATS = {
+        'application/msgpack': (
+            lambda donnees: msgpack.packb(donnees, datetime=True),
+            lambda octets: msgpack.unpackb(octets, timestamp=3),
+        ),
+        'application/cbor': (
+            lambda donnees: cbor2.dumps(donnees, datetime_as_timestamp=True),
+            cbor2.loads,
+        ),
+    }
+
+    def dates(self, donnees):
+        """Données JSON, dates ISO 8601 lues en UTC : le JSON garde les dates naïves lues en base, UTC"""
+        if isinstance(donnees, dict):
+            return {cle: self.dates(valeur) for cle, valeur in donnees.items()}
+        if isinstance(donnees, list):
+            return [self.dates(valeur) for valeur in donnees]
+        if isinstance(donnees, str):
+            try:
+                date = datetime.datetime.fromisoformat(donnees)
+            except ValueError:
+                return donnees
+            return date if date.tzinfo else date.replace(tzinfo=datetime.timezone.utc)
+        return donnees
+
+    def en_json(self, donnees):
+        return self.dates(orjson.loads(RenduJSON().render(donnees)))
+
+    def test_reponses(self):
+        zone = creer_zone()
+        vague = creer_vague(zone)
+        creer_vague()
+        for url in ('/api/vagues-chaleur/', f'/api/vagues-chaleur/{vague.id}/', '/api/zones-geographiques/'):
+            attendu = self.dates(self.client.get(url).json())
+            for media, (_, decoder) in self.FORMATS.items():
+                with self.subTest(url=url, media=media):
+                    reponse = self.client.get(url, HTTP_ACCEPT=media)
+                    self.assertEqual(reponse.status_code, 200)
+                    self.assertEqual(reponse['Content-Type'], media)
+                    self.assertEqual(self.en_json(decoder(reponse.content)), attendu)
+
+    def test_corps_de_requete(self):
+        debut = datetime.datetime(2026, 5, 1, 12, 30, tzinfo=datetime.timezone.utc)
+        corps = {
+            'temperature_max': 44.5, 'intensite': 3.0, 'humidite': 20.0,
+            'date_debut': debut, 'date_fin': debut + datetime.timedelta(days=3), 'duree': debut,
+        }
+        for media, (encoder, decoder) in self.FORMATS.items():
+            with self.subTest(media=media):
+                reponse = self.client.post(
+                    '/api/vagues-chaleur/', encoder(corps), content_type=media, HTTP_ACCEPT=media
+                )
+                self.assertEqual(reponse.status_code, 201, reponse.content)
+                cree = decoder(reponse.content)
+                self.assertEqual({champ: cree[champ] for champ in corps}, corps)
+                relue = self.client.get(f"/api/vagues-chaleur/{cree['id']}/").json()
+                self.assertEqual(self.dates(relue)['date_debut'], debut)
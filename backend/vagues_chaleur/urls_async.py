@@ -0,0 +1,7 @@
+from django.urls import path
+from . import views_async
+
+urlpatterns = [
+    path('vagues-chaleur/actives/', views_async.actives),
+    path('vagues-chaleur/par_zone/', views_async.par_zone),
+]
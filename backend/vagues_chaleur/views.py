@@ -3,33 +3,44 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from .models import VagueChaleur
 from .serializers import VagueChaleurSerializer
+from .cache import vagues_actives
+from notifications.diffusion import lancer_diffusion
 from zones_geographiques.models import ZoneGeographique
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from utils.swagger_decorators import PARAMETRES_SELECTION, PARAMETRE_FLUX
+from utils.pagination import PaginationCurseur
+from utils.brut import page, element, selectionner
+from utils.mongo import lecture_secondaire
+from utils.conditionnel import conditionnel
+from utils.cache_reponses import en_cache
 
 class VagueChaleurViewSet(viewsets.ViewSet):
     @swagger_auto_schema(
+        manual_parameters=PARAMETRES_SELECTION + [PARAMETRE_FLUX],
         operation_description="Lister toutes les vagues de chaleur.",
         responses={200: openapi.Response(
             description="Liste des vagues de chaleur",
             examples={
-                "application/json": [
-                    {
-                        "id": "662f1e7b8e4b0c001e8b4568",
-                        "nom": "Vague intense juillet",
-                        "date_debut": "2024-07-20T12:00:00Z",
-                        "date_fin": "2024-07-25T12:00:00Z",
-                        "temperature_max": 45.2,
-                        "zone_geographique": "662f1e7b8e4b0c001e8b4567"
-                    }
-                ]
+                "application/json": {
+                    "next": "http://localhost:8000/api/vagues-chaleur/?curseur=W3siJGRhdGUiOiAiMjAyNC0wNy0yMFQxMjowMDowMFoifSwgeyIkb2lkIjogIjY2MmYxZTdiOGU0YjBjMDAxZThiNDU2OCJ9XQ",
+                    "results": [
+                        {
+                            "id": "662f1e7b8e4b0c001e8b4568",
+                            "nom": "Vague intense juillet",
+                            "date_debut": "2024-07-20T12:00:00Z",
+                            "date_fin": "2024-07-25T12:00:00Z",
+                            "temperature_max": 45.2,
+                            "zone_geographique": "662f1e7b8e4b0c001e8b4567"
+                        }
+                    ]
+                }
             }
         )}
     )
+    @conditionnel(VagueChaleur, ZoneGeographique, secondaire=True)
     def list(self, request):
-        vagues = VagueChaleur.objects.all()
-        serializer = VagueChaleurSerializer(vagues, many=True)
-        return Response(serializer.data)
+        return page(PaginationCurseur(tri='-date_debut'), lecture_secondaire(VagueChaleur.objects.all()), request, VagueChaleurSerializer)
     
     @swagger_auto_schema(
         operation_description="Créer une nouvelle vague de chaleur.",
@@ -54,7 +65,8 @@ class VagueChaleurViewSet(viewsets.ViewSet):
                         "date_debut": "2024-07-20T12:00:00Z",
                         "date_fin": "2024-07-25T12:00:00Z",
                         "temperature_max": 45.2,
-                        "zone_geographique": "662f1e7b8e4b0c001e8b4567"
+                        "zone_geographique": "662f1e7b8e4b0c001e8b4567",
+                        "diffusion_id": "662f1e7b8e4b0c001e8b4570"
                     }
                 }
             ),
@@ -68,10 +80,16 @@ class VagueChaleurViewSet(viewsets.ViewSet):
         serializer = VagueChaleurSerializer(data=request.data)
         if serializer.is_valid():
             vague = serializer.save()
-            return Response(VagueChaleurSerializer(vague).data, status=status.HTTP_201_CREATED)
+            data = VagueChaleurSerializer(vague).data
+            # Les alertes aux habitants de la zone partent en arrière-plan
+            data['diffusion_id'] = None
+            if vague.zone_geographique:
+                data['diffusion_id'] = str(lancer_diffusion(vague).id)
+            return Response(data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     @swagger_auto_schema(
+        manual_parameters=PARAMETRES_SELECTION,
         operation_description="Récupérer une vague de chaleur par son ID.",
         responses={
             200: openapi.Response(
@@ -93,13 +111,12 @@ class VagueChaleurViewSet(viewsets.ViewSet):
             ),
         }
     )
+    @conditionnel(VagueChaleur, ZoneGeographique)
     def retrieve(self, request, pk=None):
-        try:
-            vague = VagueChaleur.objects.get(id=pk)
-            serializer = VagueChaleurSerializer(vague)
-            return Response(serializer.data)
-        except VagueChaleur.DoesNotExist:
+        data = element(VagueChaleur.objects(id=pk), request, VagueChaleurSerializer)
+        if data is None:
             return Response({'error': 'Vague de chaleur introuvable'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
     
     @swagger_auto_schema(
         operation_description="Mettre à jour une vague de chaleur.",
@@ -168,23 +185,27 @@ class VagueChaleurViewSet(viewsets.ViewSet):
     
     @swagger_auto_schema(
         operation_description="Récupérer les vagues de chaleur par zone géographique.",
-        manual_parameters=[
+        manual_parameters=PARAMETRES_SELECTION + [
+            PARAMETRE_FLUX,
             openapi.Parameter('zone_id', openapi.IN_QUERY, description="ID de la zone géographique", type=openapi.TYPE_STRING)
         ],
         responses={
             200: openapi.Response(
                 description="Liste des vagues de chaleur pour la zone",
                 examples={
-                    "application/json": [
-                        {
-                            "id": "662f1e7b8e4b0c001e8b4568",
-                            "nom": "Vague intense juillet",
-                            "date_debut": "2024-07-20T12:00:00Z",
-                            "date_fin": "2024-07-25T12:00:00Z",
-                            "temperature_max": 45.2,
-                            "zone_geographique": "662f1e7b8e4b0c001e8b4567"
-                        }
-                    ]
+                    "application/json": {
+                        "next": "http://localhost:8000/api/vagues-chaleur/par_zone/?zone_id=662f1e7b8e4b0c001e8b4567&curseur=W3siJGRhdGUiOiAiMjAyNC0wNy0yMFQxMjowMDowMFoifSwgeyIkb2lkIjogIjY2MmYxZTdiOGU0YjBjMDAxZThiNDU2OCJ9XQ",
+                        "results": [
+                            {
+                                "id": "662f1e7b8e4b0c001e8b4568",
+                                "nom": "Vague intense juillet",
+                                "date_debut": "2024-07-20T12:00:00Z",
+                                "date_fin": "2024-07-25T12:00:00Z",
+                                "temperature_max": 45.2,
+                                "zone_geographique": "662f1e7b8e4b0c001e8b4567"
+                            }
+                        ]
+                    }
                 }
             ),
             400: openapi.Response(
@@ -198,6 +219,8 @@ class VagueChaleurViewSet(viewsets.ViewSet):
         }
     )
     @action(detail=False, methods=['get'])
+    @conditionnel(VagueChaleur, ZoneGeographique, secondaire=True)
+    @en_cache(VagueChaleur, ZoneGeographique)
     def par_zone(self, request):
         """Récupérer les vagues de chaleur par zone géographique"""
         zone_id = request.query_params.get('zone_id')
@@ -210,9 +233,9 @@ class VagueChaleurViewSet(viewsets.ViewSet):
         
         try:
             zone = ZoneGeographique.objects.get(id=zone_id)
-            vagues = VagueChaleur.objects.filter(zone_geographique=zone)
-            serializer = VagueChaleurSerializer(vagues, many=True)
-            return Response(serializer.data)
+            return page(
+                PaginationCurseur(tri='-date_debut'), lecture_secondaire(VagueChaleur.objects.filter(zone_geographique=zone)), request, VagueChaleurSerializer
+            )
         except ZoneGeographique.DoesNotExist:
             return Response(
                 {'error': 'Zone géographique introuvable'}, 
@@ -220,6 +243,7 @@ class VagueChaleurViewSet(viewsets.ViewSet):
             )
     
     @swagger_auto_schema(
+        manual_parameters=PARAMETRES_SELECTION,
         operation_description="Récupérer les vagues de chaleur actuellement actives.",
         responses={
             200: openapi.Response(
@@ -242,14 +266,5 @@ class VagueChaleurViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'])
     def actives(self, request):
         """Récupérer les vagues de chaleur actuellement actives"""
-        from datetime import datetime
-        maintenant = datetime.now()
-        
-        vagues_actives = VagueChaleur.objects.filter(
-            date_debut__lte=maintenant,
-            date_fin__gte=maintenant
-        )
-        
-        serializer = VagueChaleurSerializer(vagues_actives, many=True)
-        return Response(serializer.data)
+        return Response(selectionner(vagues_actives(), request, VagueChaleurSerializer))
 
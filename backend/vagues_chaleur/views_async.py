@@ -0,0 +1,64 @@
+from bson import ObjectId
+from rest_framework import status
+from utils.asynchrone import vue_async, authentifier, collection, reponse, reponse_flux
+from utils.brut import Selection, selectionner, flux_demande, taille_lot_flux
+from utils.conditionnel import conditionnel_async
+from utils.cache_reponses import en_cache_async
+from utils.mongo import lecture_secondaire
+from utils.pagination import PaginationCurseur
+from zones_geographiques.models import ZoneGeographique
+from .cache import vagues_actives_async
+from .models import VagueChaleur
+from .representations import representation_vague, lecture, CHAMPS_ZONE
+from .serializers import VagueChaleurSerializer
+
+
+@vue_async
+async def actives(request):
+    """Récupérer les vagues de chaleur actuellement actives"""
+    await authentifier(request)
+    return reponse(request, selectionner(await vagues_actives_async(), request, VagueChaleurSerializer))
+
+
+@vue_async
+@conditionnel_async(VagueChaleur, ZoneGeographique, secondaire=True)
+@en_cache_async(VagueChaleur, ZoneGeographique)
+async def par_zone(request):
+    """Récupérer les vagues de chaleur par zone géographique"""
+    await authentifier(request)
+    zone_id = request.GET.get('zone_id')
+    
+    if not zone_id:
+        return reponse(
+            request,
+            {'error': 'zone_id requis en paramètre'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    zone = None
+    if ObjectId.is_valid(zone_id):
+        zone = await collection(ZoneGeographique).find_one({'_id': ObjectId(zone_id)}, CHAMPS_ZONE)
+    if zone is None:
+        return reponse(
+            request,
+            {'error': 'Zone géographique introuvable'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    selection = Selection.depuis(request, lecture)
+    pagination = PaginationCurseur(tri='-date_debut')
+    filtre = {'zone_geographique': zone['_id']}
+
+    async def representer(vagues):
+        # Toutes les vagues appartiennent à la zone déjà chargée
+        return [representation_vague(vague, {zone['_id']: zone}, selection) for vague in vagues]
+
+    if flux_demande(request):
+        return reponse_flux(
+            pagination, lecture_secondaire(collection(VagueChaleur)), filtre, request,
+            lecture.projection_mongo(selection), representer, taille_lot_flux()
+        )
+    vagues = await pagination.paginer_collection(
+        lecture_secondaire(collection(VagueChaleur)), filtre, request, lecture.projection_mongo(selection)
+    )
+    return reponse(request, pagination.donnees_paginees(await representer(vagues)))
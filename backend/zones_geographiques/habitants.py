@@ -0,0 +1,90 @@
+import datetime
+from pymongo.errors import BulkWriteError
+from authentification.models import User
+from utils import versions
+from utils.brut import Mappeur
+from .models import HabitantZone
+
+# Champs utilisateur exposés dans la représentation des habitants
+CHAMPS_HABITANT = ('id', 'first_name', 'last_name', 'email')
+
+habitant_brut = Mappeur(User, CHAMPS_HABITANT[1:], noms={'first_name': 'prenom', 'last_name': 'nom'})
+
+
+def utilisateurs_existants(utilisateurs_ids):
+    """Retourne les ObjectId des utilisateurs existants parmi les ids fournis (une seule requête $in)"""
+    return [
+        utilisateur.id
+        for utilisateur in User.objects(id__in=list(utilisateurs_ids)).only('id')
+    ]
+
+
+def ajouter_habitants(zone, utilisateurs_ids):
+    """Insère en lot les appartenances manquantes, les doublons sont ignorés"""
+    if not utilisateurs_ids:
+        return 0
+    maintenant = datetime.datetime.now(datetime.timezone.utc)
+    documents = [
+        {'zone': zone.id, 'utilisateur': utilisateur_id, 'created_at': maintenant}
+        for utilisateur_id in utilisateurs_ids
+    ]
+    try:
+        return len(HabitantZone._get_collection().insert_many(documents, ordered=False).inserted_ids)
+    except BulkWriteError as erreur:
+        # Les violations de l'index unique (zone, utilisateur) sont des habitants déjà présents
+        autres = [e for e in erreur.details['writeErrors'] if e['code'] != 11000]
+        if autres:
+            raise
+        return erreur.details['nInserted']
+    finally:
+        versions.toucher(HabitantZone)
+
+
+def remplacer_habitants(zone, utilisateurs_ids):
+    """
+    Remplace les habitants de la zone par un différentiel : les appartenances
+    manquantes sont insérées avant la suppression des retirées, les autres
+    restent en place (pas de lecture de la zone vidée entre deux écritures)
+    """
+    actuels = set(HabitantZone._get_collection().distinct('utilisateur', {'zone': zone.id}))
+    ajoutes = ajouter_habitants(zone, [u for u in dict.fromkeys(utilisateurs_ids) if u not in actuels])
+    retires = actuels - set(utilisateurs_ids)
+    if retires:
+        HabitantZone.objects(zone=zone, utilisateur__in=list(retires)).delete()
+    return ajoutes
+
+
+def utilisateurs_par_zone(zones_ids):
+    """ObjectId des habitants groupés par zone, triés : une requête sur l'index (zone, utilisateur)"""
+    appartenances = HabitantZone._get_collection().find(
+        {'zone': {'$in': list(zones_ids)}},
+        {'_id': 0, 'zone': 1, 'utilisateur': 1}
+    ).sort([('zone', 1), ('utilisateur', 1)])
+    
+    utilisateurs = {zone_id: [] for zone_id in zones_ids}
+    for appartenance in appartenances:
+        utilisateurs[appartenance['zone']].append(appartenance['utilisateur'])
+    return utilisateurs
+
+
+def habitants_ids_par_zone(zones_ids):
+    """Identifiants (str) des habitants groupés par zone, sans lire les utilisateurs"""
+    return {
+        zone_id: [str(u) for u in ids]
+        for zone_id, ids in utilisateurs_par_zone(zones_ids).items()
+    }
+
+
+def habitants_par_zone(zones_ids):
+    """Représentations des habitants groupées par zone : une requête par collection"""
+    ids_par_zone = utilisateurs_par_zone(zones_ids)
+    
+    tous_ids = {u for ids in ids_par_zone.values() for u in ids}
+    utilisateurs = {
+        utilisateur['_id']: habitant_brut(utilisateur)
+        for utilisateur in User.objects(id__in=list(tous_ids)).only(*CHAMPS_HABITANT).as_pymongo()
+    }
+    return {
+        zone_id: [utilisateurs[u] for u in ids if u in utilisateurs]
+        for zone_id, ids in ids_par_zone.items()
+    }
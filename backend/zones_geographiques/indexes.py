@@ -0,0 +1,17 @@
+from utils.indexes import declarer
+from .models import ZoneGeographique, HabitantZone
+
+declarer(
+    ZoneGeographique,
+    # Zones proches d'un point et zones le contenant ($geoNear)
+    [('position', '2dsphere')],
+    'rayon',
+)
+
+declarer(
+    HabitantZone,
+    # Unicité du couple, ajout/retrait atomiques et pagination des habitants d'une zone
+    {'fields': ['zone', 'utilisateur'], 'unique': True},
+    # Zones d'un utilisateur, suppression en cascade d'un utilisateur
+    ['utilisateur', 'zone'],
+)
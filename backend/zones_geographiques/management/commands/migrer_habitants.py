@@ -0,0 +1,44 @@
+import datetime
+from django.core.management.base import BaseCommand
+from pymongo.errors import BulkWriteError
+from utils import versions
+from zones_geographiques.models import ZoneGeographique, HabitantZone
+
+
+class Command(BaseCommand):
+    help = ("Déplace les tableaux `habitants` embarqués dans les zones vers la "
+            "collection d'appartenance habitants_zones, zone par zone.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--taille-lot', type=int, default=5000,
+                            help="Nombre d'appartenances insérées par lot")
+
+    def handle(self, *args, **options):
+        zones = ZoneGeographique._get_collection()
+        appartenances = HabitantZone._get_collection()
+        taille_lot = options['taille_lot']
+        nb_zones = nb_appartenances = 0
+
+        for zone in zones.find({'habitants': {'$exists': True}}, {'habitants': 1}):
+            maintenant = datetime.datetime.now(datetime.timezone.utc)
+            habitants = zone.get('habitants') or []
+            for debut in range(0, len(habitants), taille_lot):
+                documents = [
+                    {'zone': zone['_id'], 'utilisateur': utilisateur_id, 'created_at': maintenant}
+                    for utilisateur_id in habitants[debut:debut + taille_lot]
+                ]
+                try:
+                    nb_appartenances += len(appartenances.insert_many(documents, ordered=False).inserted_ids)
+                except BulkWriteError as erreur:
+                    # Relance sûre : les appartenances déjà migrées violent l'index unique
+                    if any(e['code'] != 11000 for e in erreur.details['writeErrors']):
+                        raise
+                    nb_appartenances += erreur.details['nInserted']
+
+            zones.update_one({'_id': zone['_id']}, {'$unset': {'habitants': ''}})
+            nb_zones += 1
+
+        versions.toucher(HabitantZone)
+        self.stdout.write(self.style.SUCCESS(
+            f"{nb_zones} zone(s) migrée(s), {nb_appartenances} appartenance(s) créée(s)"
+        ))
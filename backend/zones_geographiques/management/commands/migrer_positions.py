@@ -0,0 +1,54 @@
+import time
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from zones_geographiques.models import ZoneGeographique, point_geojson
+
+
+class Command(BaseCommand):
+    help = ("Renseigne le champ GeoJSON `position` des zones existantes à partir "
+            "des coordonnées texte, par lots, sans bloquer la collection.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--taille-lot', type=int, default=1000,
+                            help="Nombre de zones traitées par lot")
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Pause en secondes entre deux lots pour limiter la charge")
+
+    def handle(self, *args, **options):
+        collection = ZoneGeographique._get_collection()
+        taille_lot = options['taille_lot']
+        filtre = {'position': {'$exists': False}}
+        dernier_id = None
+        migrees = invalides = 0
+
+        while True:
+            requete = dict(filtre)
+            if dernier_id is not None:
+                requete['_id'] = {'$gt': dernier_id}
+            lot = list(
+                collection.find(requete, {'latitude': 1, 'longitude': 1})
+                .sort('_id', 1)
+                .limit(taille_lot)
+            )
+            if not lot:
+                break
+
+            operations = []
+            for zone in lot:
+                point = point_geojson(zone.get('latitude'), zone.get('longitude'))
+                if point is None:
+                    invalides += 1
+                    self.stderr.write(f"Coordonnées invalides pour la zone {zone['_id']}")
+                    continue
+                operations.append(UpdateOne({'_id': zone['_id']}, {'$set': {'position': point}}))
+
+            if operations:
+                migrees += collection.bulk_write(operations, ordered=False).modified_count
+            dernier_id = lot[-1]['_id']
+
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{migrees} zone(s) migrée(s), {invalides} zone(s) aux coordonnées invalides"
+        ))
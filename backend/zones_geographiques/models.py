@@ -1,8 +1,9 @@
 import datetime
-from mongoengine import Document, StringField, IntField, FloatField, DateTimeField, ReferenceField, ListField
+from mongoengine import Document, StringField, IntField, FloatField, DateTimeField, ReferenceField, PointField, CASCADE
 from authentification.models import User
+from utils.horodatage import Horodate, Versionne
 
-class ZoneGeographique(Document):
+class ZoneGeographique(Horodate):
     ville = StringField(required=True, max_length=100)
     rue = StringField(required=True, max_length=200)
     numero = IntField(required=True)
@@ -10,16 +11,48 @@ class ZoneGeographique(Document):
     longitude = StringField(required=True)
     rayon = FloatField(required=True)
     
-    # Relation avec Utilisateur (un utilisateur habite dans une zone géographique)
-    habitants = ListField(ReferenceField(User))
+    # Point GeoJSON [longitude, latitude] dérivé de latitude/longitude,
+    # indexé en 2dsphere pour les recherches géographiques
+    position = PointField()
     
-    created_at = DateTimeField(default=datetime.datetime.now(datetime.timezone.utc))
-    updated_at = DateTimeField(default=datetime.datetime.now(datetime.timezone.utc))
+    # Les habitants sont stockés dans la collection d'appartenance HabitantZone
+
+    def clean(self):
+        """Synchronise le point GeoJSON avec les coordonnées texte"""
+        self.position = point_geojson(self.latitude, self.longitude)
 
     def __str__(self):
         return f"{self.numero} {self.rue}, {self.ville}"
 
     meta = {
-        'collection': 'zones_geographiques'
+        'collection': 'zones_geographiques',
+        # Tolère l'ancien tableau `habitants` tant que migrer_habitants n'a pas été lancé
+        'strict': False,
+    }
+
+
+class HabitantZone(Versionne):
+    """Appartenance d'un utilisateur à une zone géographique (un document par couple)"""
+    zone = ReferenceField(ZoneGeographique, required=True, reverse_delete_rule=CASCADE)
+    utilisateur = ReferenceField(User, required=True, reverse_delete_rule=CASCADE)
+    
+    created_at = DateTimeField(default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
+    def __str__(self):
+        return f"Habitant {self.utilisateur} de la zone {self.zone}"
+
+    meta = {
+        'collection': 'habitants_zones',
     }
 
+
+def point_geojson(latitude, longitude):
+    """Convertit des coordonnées (texte ou nombre) en point GeoJSON, None si invalides"""
+    try:
+        lat = float(str(latitude).strip().replace(',', '.'))
+        lon = float(str(longitude).strip().replace(',', '.'))
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return {'type': 'Point', 'coordinates': [lon, lat]}
@@ -0,0 +1,30 @@
+from utils.brut import Mappeur, Lecture
+from .models import ZoneGeographique
+from .habitants import habitants_par_zone, habitants_ids_par_zone
+
+CHAMPS_ZONE = ('ville', 'rue', 'numero', 'latitude', 'longitude', 'rayon', 'created_at', 'updated_at')
+
+
+class Habitants:
+    """Habitants d'une zone (collection HabitantZone) : représentations développées, sinon identifiants"""
+    nulle = True
+
+    def champs_lus(self, nom):
+        return ()
+
+    def charger(self, nom, documents, developpee):
+        zones_ids = [document['_id'] for document in documents]
+        return habitants_par_zone(zones_ids) if developpee else habitants_ids_par_zone(zones_ids)
+
+    def representer(self, nom, document, charges, developpee):
+        return charges[document['_id']]
+
+    def reduire(self, representation):
+        return [habitant['id'] for habitant in representation]
+
+
+class LectureZones(Lecture):
+    mappeur = Mappeur(ZoneGeographique, CHAMPS_ZONE)
+    relations = {
+        'habitants': Habitants(),
+    }
@@ -1,8 +1,11 @@
 from rest_framework import serializers
-from .models import ZoneGeographique
-from authentification.models import User
+from .models import ZoneGeographique, point_geojson
+from .habitants import ajouter_habitants, remplacer_habitants, habitants_par_zone, utilisateurs_existants
+from bson import ObjectId
+from utils.prefetch import PrefetchMixin
+from .representations import LectureZones
 
-class ZoneGeographiqueSerializer(serializers.Serializer):
+class ZoneGeographiqueSerializer(PrefetchMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     ville = serializers.CharField(max_length=100)
     rue = serializers.CharField(max_length=200)
@@ -18,19 +21,31 @@ class ZoneGeographiqueSerializer(serializers.Serializer):
     created_at = serializers.DateTimeField(read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
     
+    # Listes : lecture des documents bruts, à l'identique de to_representation
+    lecture_brute = LectureZones()
+    
+    def precharger(self, instances):
+        # Les habitants ne sont pas une référence du document : deux requêtes
+        # (appartenances puis utilisateurs) pour toutes les zones
+        return {'habitants': habitants_par_zone([zone.id for zone in instances])}
+    
+    def validate(self, attrs):
+        if point_geojson(attrs.get('latitude'), attrs.get('longitude')) is None:
+            raise serializers.ValidationError("Coordonnées latitude/longitude invalides")
+        return attrs
+    
+    def validate_habitants(self, value):
+        # Les identifiants inconnus sont ignorés, comme auparavant
+        ids = [habitant_id for habitant_id in value if ObjectId.is_valid(habitant_id)]
+        return utilisateurs_existants(ids)
+    
     def create(self, validated_data):
         habitants_ids = validated_data.pop('habitants', [])
         zone = ZoneGeographique(**validated_data)
+        zone.save()
         
         # Ajouter les habitants
-        for habitant_id in habitants_ids:
-            try:
-                habitant = User.objects.get(id=habitant_id)
-                zone.habitants.append(habitant)
-            except User.DoesNotExist:
-                pass
-        
-        zone.save()
+        ajouter_habitants(zone, habitants_ids)
         return zone
     
     def update(self, instance, validated_data):
@@ -39,16 +54,10 @@ class ZoneGeographiqueSerializer(serializers.Serializer):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         
-        if habitants_ids is not None:
-            instance.habitants = []
-            for habitant_id in habitants_ids:
-                try:
-                    habitant = User.objects.get(id=habitant_id)
-                    instance.habitants.append(habitant)
-                except User.DoesNotExist:
-                    pass
-        
         instance.save()
+        
+        if habitants_ids is not None:
+            remplacer_habitants(instance, habitants_ids)
         return instance
         
     def to_representation(self, instance):
@@ -64,17 +73,9 @@ class ZoneGeographiqueSerializer(serializers.Serializer):
             'updated_at': instance.updated_at
         }
         
-        # Convertir les références d'utilisateurs en informations lisibles
-        if instance.habitants:
-            data['habitants'] = [
-                {
-                    'id': str(habitant.id),
-                    'prenom': habitant.first_name,
-                    'nom': habitant.last_name,
-                    'email': habitant.email
-                } for habitant in instance.habitants
-            ]
+        # Convertir les appartenances en informations lisibles
+        if self.references is not None:
+            data['habitants'] = self.references['habitants'][instance.id]
         else:
-            data['habitants'] = []
+            data['habitants'] = habitants_par_zone([instance.id])[instance.id]
         return data
-
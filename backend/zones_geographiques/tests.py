@@ -1,3 +1,153 @@
-from django.test import TestCase
+import math
+from utils.essais import TestMongo, creer_utilisateur, creer_zone
+from .habitants import remplacer_habitants
+from .models import HabitantZone
 
-# Create your tests here.
+
+class RequetesListesTests(TestMongo):
+    """Les listes font un nombre de requêtes indépendant du nombre de lignes (références chargées par $in)"""
+
+    def setUp(self):
+        super().setUp()
+        self.utilisateurs = []
+        self.zones = []
+
+    def ajouter(self, nombre):
+        for _ in range(nombre):
+            utilisateur = creer_utilisateur(len(self.utilisateurs))
+            self.utilisateurs.append(utilisateur)
+            zone = creer_zone(len(self.zones) + 1, rayon=50)
+            self.zones.append(zone)
+            HabitantZone(zone=zone, utilisateur=utilisateur).save()
+            if utilisateur is not self.utilisateurs[0]:
+                HabitantZone(zone=zone, utilisateur=self.utilisateurs[0]).save()
+                HabitantZone(zone=self.zones[0], utilisateur=utilisateur).save()
+
+    def urls(self):
+        return [
+            '/api/zones-geographiques/',
+            f'/api/zones-geographiques/{self.zones[0].id}/habitants/',
+            f'/api/zones-geographiques/par_habitant/?utilisateur_id={self.utilisateurs[0].id}',
+            '/api/zones-geographiques/proches/?latitude=14.69&longitude=-17.44',
+            '/api/zones-geographiques/contenant/?latitude=14.69&longitude=-17.44',
+        ]
+
+    def test_nombre_de_requetes_constant(self):
+        self.assertRequetesConstantes(self.ajouter, self.urls)
+
+    def test_lecture_brute_identique(self):
+        self.ajouter(3)
+        self.assertLecturesIdentiques(self.urls() + [f'/api/zones-geographiques/{self.zones[1].id}/'])
+
+
+class HabitantsTests(TestMongo):
+    """Zones d'un habitant paginées ; remplacement des habitants par différentiel, insertions d'abord"""
+
+    def setUp(self):
+        super().setUp()
+        self.utilisateurs = [creer_utilisateur(numero) for numero in range(3)]
+        self.zones = [creer_zone(numero) for numero in range(1, 6)]
+
+    def appartenances(self, zone):
+        return {
+            document['utilisateur']: document['_id']
+            for document in HabitantZone._get_collection().find({'zone': zone.id})
+        }
+
+    def test_par_habitant_pagine(self):
+        for zone in self.zones:
+            HabitantZone(zone=zone, utilisateur=self.utilisateurs[0]).save()
+        HabitantZone(zone=self.zones[0], utilisateur=self.utilisateurs[1]).save()
+        url = f'/api/zones-geographiques/par_habitant/?utilisateur_id={self.utilisateurs[0].id}&taille=2'
+        ids = []
+        while url:
+            reponse = self.client.get(url)
+            self.assertEqual(reponse.status_code, 200)
+            self.assertLessEqual(len(reponse.json()['results']), 2)
+            ids += [zone['id'] for zone in reponse.json()['results']]
+            url = reponse.json()['next']
+        self.assertEqual(ids, sorted(str(zone.id) for zone in self.zones))
+
+    def test_remplacement_par_differentiel(self):
+        zone = self.zones[0]
+        premier, deuxieme, troisieme = (u.id for u in self.utilisateurs)
+        for utilisateur_id in (premier, deuxieme):
+            HabitantZone(zone=zone, utilisateur=utilisateur_id).save()
+        avant = self.appartenances(zone)
+        with self.commandes.compter() as commandes:
+            self.assertEqual(remplacer_habitants(zone, [deuxieme, troisieme, troisieme]), 1)
+        apres = self.appartenances(zone)
+        self.assertEqual(set(apres), {deuxieme, troisieme})
+        # L'appartenance conservée n'est pas réécrite
+        self.assertEqual(apres[deuxieme], avant[deuxieme])
+        ecritures = [nom for nom, cible in commandes if cible == 'habitants_zones' and nom in ('insert', 'delete')]
+        self.assertEqual(ecritures, ['insert', 'delete'])
+
+    def test_remplacement_identique(self):
+        zone = self.zones[0]
+        HabitantZone(zone=zone, utilisateur=self.utilisateurs[0]).save()
+        with self.commandes.compter() as commandes:
+            self.assertEqual(remplacer_habitants(zone, [self.utilisateurs[0].id]), 0)
+        self.assertEqual([nom for nom, cible in commandes if nom in ('insert', 'delete')], [])
+
+
+# Degrés de latitude par km sur la sphère de $geoNear (rayon 6378,1 km)
+DEGRES_PAR_KM = 180 / (math.pi * 6378.1)
+
+
+class RechercheSpatialeTests(TestMongo):
+    """Zones proches d'un point triées par distance, zones dont le rayon contient un point"""
+    LATITUDE, LONGITUDE = 14.69, -17.44
+
+    def setUp(self):
+        super().setUp()
+        # Au nord du point, à 1, 3 et 12 km, créées dans le désordre
+        self.zones = {
+            km: creer_zone(km, latitude=str(self.LATITUDE + km * DEGRES_PAR_KM), longitude=str(self.LONGITUDE), rayon=2)
+            for km in (12, 1, 3)
+        }
+
+    def lire(self, action, latitude=LATITUDE, **parametres):
+        parametres = {'latitude': latitude, 'longitude': self.LONGITUDE, **parametres}
+        requete = '&'.join(f'{cle}={valeur}' for cle, valeur in parametres.items())
+        return self.client.get(f'/api/zones-geographiques/{action}/?{requete}')
+
+    def distances(self, reponse):
+        self.assertEqual(reponse.status_code, 200, reponse.content)
+        return [zone['distance_km'] for zone in reponse.json()]
+
+    def test_proches_par_distance(self):
+        reponse = self.lire('proches')
+        self.assertEqual([zone['id'] for zone in reponse.json()], [str(self.zones[km].id) for km in (1, 3, 12)])
+        self.assertEqual(self.distances(reponse), [1.0, 3.0, 12.0])
+
+    def test_proches_limite_et_distance_max(self):
+        self.assertEqual(self.distances(self.lire('proches', limite=2)), [1.0, 3.0])
+        self.assertEqual(self.distances(self.lire('proches', distance_max=5)), [1.0, 3.0])
+        self.assertEqual(self.distances(self.lire('proches', distance_max=0)), [])
+        self.assertEqual(self.distances(self.lire('proches', limite=1000)), [1.0, 3.0, 12.0])
+
+    def test_proches_parametres_invalides(self):
+        for parametres in (
+            {'limite': 0}, {'limite': -1}, {'limite': 'dix'},
+            {'distance_max': -1}, {'distance_max': 'nan'}, {'distance_max': 'inf'}, {'distance_max': '-inf'},
+            {'latitude': 'nan'}, {'latitude': 91},
+        ):
+            with self.subTest(**parametres):
+                self.assertEqual(self.lire('proches', **parametres).status_code, 400)
+
+    def test_contenant_limite_du_rayon(self):
+        # Rayons de 2 km : la zone à 3 km a sa limite au centre de la zone à 1 km
+        limite = self.LATITUDE + DEGRES_PAR_KM
+        for ecart, attendues in ((0.001, (1, 3)), (-0.001, (1,))):
+            with self.subTest(ecart=ecart):
+                reponse = self.lire('contenant', latitude=limite + ecart * DEGRES_PAR_KM)
+                self.assertEqual(reponse.status_code, 200)
+                self.assertEqual([zone['id'] for zone in reponse.json()], [str(self.zones[km].id) for km in attendues])
+
+    def test_contenant_sans_rayon_positif(self):
+        for zone in self.zones.values():
+            zone.rayon = -1
+            zone.save()
+        self.assertEqual(self.distances(self.lire('contenant')), [])
+        self.assertEqual(self.lire('contenant', latitude='nan').status_code, 400)
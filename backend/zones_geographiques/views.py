@@ -1,39 +1,85 @@
+import math
 from rest_framework import status, viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from .models import ZoneGeographique
+from utils.swagger_decorators import PARAMETRES_SELECTION, PARAMETRE_FLUX
+from utils.pagination import PaginationCurseur
+from utils.brut import page, element, lecture_et_selection
+from utils.mongo import lecture_secondaire
+from utils.conditionnel import conditionnel
+from utils.cache_reponses import en_cache
+from mongoengine.errors import NotUniqueError
+from bson import ObjectId
+from .models import ZoneGeographique, HabitantZone, point_geojson
 from .serializers import ZoneGeographiqueSerializer
+from .habitants import CHAMPS_HABITANT, habitant_brut
 from authentification.models import User
 
+
+def lire_point(query_params):
+    """Extrait le point GeoJSON des paramètres latitude/longitude, None si absent ou invalide"""
+    latitude = query_params.get('latitude')
+    longitude = query_params.get('longitude')
+    if latitude is None or longitude is None:
+        return None
+    return point_geojson(latitude, longitude)
+
+
+def projection_selection(request):
+    """Étapes $project limitant un pipeline $geoNear aux champs de ?fields="""
+    lecture, selection = lecture_et_selection(request, ZoneGeographiqueSerializer)
+    if lecture is None or selection.complete:
+        return []
+    champs = {ZoneGeographique._fields[champ].db_field: 1 for champ in lecture.projection(selection)}
+    return [{'$project': {**champs, 'distance': 1}}]
+
+
+def representations_avec_distance(resultats, request):
+    """Sérialise les documents issus d'un $geoNear en ajoutant la distance en km"""
+    distances = [document.pop('distance') for document in resultats]
+    lecture, selection = lecture_et_selection(request, ZoneGeographiqueSerializer)
+    if lecture is not None:
+        donnees = lecture.representer(resultats, selection)
+    else:
+        donnees = ZoneGeographiqueSerializer([ZoneGeographique._from_son(d) for d in resultats], many=True).data
+    for representation, distance in zip(donnees, distances):
+        representation['distance_km'] = round(distance / 1000, 3)
+    return donnees
+
+
 class ZoneGeographiqueViewSet(viewsets.ViewSet):
     @swagger_auto_schema(
+        manual_parameters=PARAMETRES_SELECTION + [PARAMETRE_FLUX],
         operation_description="Lister toutes les zones géographiques.",
         responses={200: openapi.Response(
             description="Liste des zones géographiques",
             examples={
-                "application/json": [
-                    {
-                        "id": "662f1e7b8e4b0c001e8b4567",
-                        "ville": "Dakar",
-                        "rue": "Avenue Cheikh Anta Diop",
-                        "numero": 12,
-                        "latitude": "14.6928",
-                        "longitude": "-17.4467",
-                        "rayon": 1.5,
-                        "habitants": [],
-                        "created_at": "2024-07-24T12:00:00Z",
-                        "updated_at": "2024-07-24T12:00:00Z"
-                    }
-                ]
+                "application/json": {
+                    "next": "http://localhost:8000/api/zones-geographiques/?curseur=W3siJG9pZCI6ICI2NjJmMWU3YjhlNGIwYzAwMWU4YjQ1NjcifSwgeyIkb2lkIjogIjY2MmYxZTdiOGU0YjBjMDAxZThiNDU2NyJ9XQ",
+                    "results": [
+                        {
+                            "id": "662f1e7b8e4b0c001e8b4567",
+                            "ville": "Dakar",
+                            "rue": "Avenue Cheikh Anta Diop",
+                            "numero": 12,
+                            "latitude": "14.6928",
+                            "longitude": "-17.4467",
+                            "rayon": 1.5,
+                            "habitants": [],
+                            "created_at": "2024-07-24T12:00:00Z",
+                            "updated_at": "2024-07-24T12:00:00Z"
+                        }
+                    ]
+                }
             }
         )}
     )
+    @conditionnel(ZoneGeographique, HabitantZone, User, secondaire=True)
+    @en_cache(ZoneGeographique, HabitantZone, User)
     def list(self, request):
-        zones = ZoneGeographique.objects.all()
-        serializer = ZoneGeographiqueSerializer(zones, many=True)
-        return Response(serializer.data)
+        return page(PaginationCurseur(tri='id'), lecture_secondaire(ZoneGeographique.objects.all()), request, ZoneGeographiqueSerializer)
     
     @swagger_auto_schema(
         operation_description="Créer une nouvelle zone géographique.",
@@ -82,6 +128,7 @@ class ZoneGeographiqueViewSet(viewsets.ViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     @swagger_auto_schema(
+        manual_parameters=PARAMETRES_SELECTION,
         operation_description="Récupérer une zone géographique par son ID.",
         responses={
             200: openapi.Response(
@@ -107,13 +154,12 @@ class ZoneGeographiqueViewSet(viewsets.ViewSet):
             ),
         }
     )
+    @conditionnel(ZoneGeographique, HabitantZone, User)
     def retrieve(self, request, pk=None):
-        try:
-            zone = ZoneGeographique.objects.get(id=pk)
-            serializer = ZoneGeographiqueSerializer(zone)
-            return Response(serializer.data)
-        except ZoneGeographique.DoesNotExist:
+        data = element(ZoneGeographique.objects(id=pk), request, ZoneGeographiqueSerializer)
+        if data is None:
             return Response({'error': 'Zone géographique introuvable'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
     
     @swagger_auto_schema(
         operation_description="Mettre à jour une zone géographique.",
@@ -213,9 +259,8 @@ class ZoneGeographiqueViewSet(viewsets.ViewSet):
     @action(detail=True, methods=['post'])
     def ajouter_habitant(self, request, pk=None):
         """Ajouter un habitant à une zone géographique"""
-        try:
-            zone = ZoneGeographique.objects.get(id=pk)
-        except ZoneGeographique.DoesNotExist:
+        zone = ZoneGeographique.objects(id=pk).only('id').first()
+        if zone is None:
             return Response({'error': 'Zone géographique introuvable'}, status=status.HTTP_404_NOT_FOUND)
             
         utilisateur_id = request.data.get('utilisateur_id')
@@ -226,22 +271,22 @@ class ZoneGeographiqueViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            utilisateur = User.objects.get(id=utilisateur_id)
-            if utilisateur not in zone.habitants:
-                zone.habitants.append(utilisateur)
-                zone.save()
-                return Response({'message': 'Habitant ajouté avec succès'})
-            else:
-                return Response(
-                    {'message': 'Utilisateur déjà habitant de cette zone'}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        except User.DoesNotExist:
+        utilisateur = User.objects(id=utilisateur_id).only('id').first()
+        if utilisateur is None:
             return Response(
                 {'error': 'Utilisateur introuvable'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
+        
+        # Insertion d'un seul document, l'index unique (zone, utilisateur) garantit l'atomicité
+        try:
+            HabitantZone(zone=zone, utilisateur=utilisateur).save()
+        except NotUniqueError:
+            return Response(
+                {'message': 'Utilisateur déjà habitant de cette zone'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({'message': 'Habitant ajouté avec succès'})
     
     @swagger_auto_schema(
         operation_description="Retirer un habitant d'une zone géographique.",
@@ -270,9 +315,8 @@ class ZoneGeographiqueViewSet(viewsets.ViewSet):
     @action(detail=True, methods=['delete'])
     def retirer_habitant(self, request, pk=None):
         """Retirer un habitant d'une zone géographique"""
-        try:
-            zone = ZoneGeographique.objects.get(id=pk)
-        except ZoneGeographique.DoesNotExist:
+        zone = ZoneGeographique.objects(id=pk).only('id').first()
+        if zone is None:
             return Response({'error': 'Zone géographique introuvable'}, status=status.HTTP_404_NOT_FOUND)
             
         utilisateur_id = request.data.get('utilisateur_id')
@@ -283,20 +327,195 @@ class ZoneGeographiqueViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            utilisateur = User.objects.get(id=utilisateur_id)
-            if utilisateur in zone.habitants:
-                zone.habitants.remove(utilisateur)
-                zone.save()
-                return Response({'message': 'Habitant retiré avec succès'})
-            else:
-                return Response(
-                    {'message': 'Utilisateur n\'est pas habitant de cette zone'}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        except User.DoesNotExist:
+        utilisateur = User.objects(id=utilisateur_id).only('id').first()
+        if utilisateur is None:
             return Response(
                 {'error': 'Utilisateur introuvable'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
-
+        
+        if HabitantZone.objects(zone=zone, utilisateur=utilisateur).delete():
+            return Response({'message': 'Habitant retiré avec succès'})
+        return Response(
+            {'message': 'Utilisateur n\'est pas habitant de cette zone'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    @swagger_auto_schema(
+        operation_description="Lister les habitants d'une zone géographique, page par page.",
+        manual_parameters=[
+            openapi.Parameter('curseur', openapi.IN_QUERY, description="Curseur opaque de la page suivante", type=openapi.TYPE_STRING),
+            openapi.Parameter('taille', openapi.IN_QUERY, description="Taille de page", type=openapi.TYPE_INTEGER),
+        ],
+        responses={
+            200: openapi.Response(
+                description="Page d'habitants",
+                examples={
+                    "application/json": {
+                        "next": "http://localhost:8000/api/zones-geographiques/662f1e7b8e4b0c001e8b4567/habitants/?curseur=W3siJG9pZCI6ICI2NjJmMWU3YjhlNGIwYzAwMWU4YjQ1NjkifSwgeyIkb2lkIjogIjY2MmYxZTdiOGU0YjBjMDAxZThiNDU2OSJ9XQ",
+                        "results": [
+                            {"id": "662f1e7b8e4b0c001e8b4569", "prenom": "Awa", "nom": "Diop", "email": "awa@email.com"}
+                        ]
+                    }
+                }
+            ),
+            404: openapi.Response(
+                description="Zone géographique introuvable",
+                examples={"application/json": {"error": "Zone géographique introuvable"}}
+            ),
+        }
+    )
+    @action(detail=True, methods=['get'])
+    @conditionnel(ZoneGeographique, HabitantZone, User)
+    def habitants(self, request, pk=None):
+        """Lister les habitants d'une zone (pagination par curseur sur l'index (zone, utilisateur))"""
+        zone = ZoneGeographique.objects(id=pk).only('id').first()
+        if zone is None:
+            return Response({'error': 'Zone géographique introuvable'}, status=status.HTTP_404_NOT_FOUND)
+        
+        pagination = PaginationCurseur(tri='utilisateur', unique=True)
+        appartenances = pagination.paginer_documents(
+            HabitantZone.objects(zone=zone).only('utilisateur'), request
+        )
+        ids = [a['utilisateur'] for a in appartenances]
+        utilisateurs = {
+            u['_id']: habitant_brut(u) for u in User.objects(id__in=ids).only(*CHAMPS_HABITANT).as_pymongo()
+        }
+        return pagination.get_paginated_response(
+            [utilisateurs[u] for u in ids if u in utilisateurs]
+        )
+    
+    @swagger_auto_schema(
+        operation_description="Récupérer les zones géographiques d'un utilisateur.",
+        manual_parameters=PARAMETRES_SELECTION + [PARAMETRE_FLUX] + [
+            openapi.Parameter('utilisateur_id', openapi.IN_QUERY, description="ID de l'utilisateur", type=openapi.TYPE_STRING, required=True)
+        ],
+        responses={
+            200: openapi.Response(description="Page des zones habitées par l'utilisateur ({next, results})"),
+            400: openapi.Response(
+                description="Paramètre manquant",
+                examples={"application/json": {"error": "utilisateur_id requis en paramètre"}}
+            ),
+        }
+    )
+    @action(detail=False, methods=['get'])
+    @conditionnel(ZoneGeographique, HabitantZone, User)
+    def par_habitant(self, request):
+        """Récupérer les zones d'un utilisateur (index (utilisateur, zone))"""
+        utilisateur_id = request.query_params.get('utilisateur_id')
+        
+        if not utilisateur_id or not ObjectId.is_valid(utilisateur_id):
+            return Response(
+                {'error': 'utilisateur_id requis en paramètre'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        zones_ids = HabitantZone._get_collection().distinct('zone', {'utilisateur': ObjectId(utilisateur_id)})
+        return page(
+            PaginationCurseur(tri='id'), ZoneGeographique.objects(id__in=zones_ids), request, ZoneGeographiqueSerializer
+        )
+    
+    @swagger_auto_schema(
+        operation_description="Récupérer les zones géographiques les plus proches d'un point.",
+        manual_parameters=PARAMETRES_SELECTION + [
+            openapi.Parameter('latitude', openapi.IN_QUERY, description="Latitude du point", type=openapi.TYPE_NUMBER, required=True),
+            openapi.Parameter('longitude', openapi.IN_QUERY, description="Longitude du point", type=openapi.TYPE_NUMBER, required=True),
+            openapi.Parameter('limite', openapi.IN_QUERY, description="Nombre maximum de zones (10 par défaut, 100 au plus)", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('distance_max', openapi.IN_QUERY, description="Distance maximale en km (positive ou nulle)", type=openapi.TYPE_NUMBER),
+        ],
+        responses={
+            200: openapi.Response(description="Zones triées par distance croissante"),
+            400: openapi.Response(
+                description="Paramètres invalides",
+                examples={"application/json": {"error": "latitude et longitude valides requises en paramètre"}}
+            ),
+        }
+    )
+    @action(detail=False, methods=['get'])
+    @conditionnel(ZoneGeographique, HabitantZone, User)
+    def proches(self, request):
+        """Récupérer les N zones les plus proches d'un point (index 2dsphere)"""
+        point = lire_point(request.query_params)
+        if point is None:
+            return Response(
+                {'error': 'latitude et longitude valides requises en paramètre'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            limite = int(request.query_params.get('limite', 10))
+            distance_max = request.query_params.get('distance_max')
+            distance_max = float(distance_max) * 1000 if distance_max is not None else None
+        except ValueError:
+            return Response(
+                {'error': 'limite et distance_max doivent être numériques'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # nan, inf ou une distance négative feraient échouer $geoNear
+        if limite < 1 or (distance_max is not None and not (math.isfinite(distance_max) and distance_max >= 0)):
+            return Response(
+                {'error': 'limite doit être strictement positive et distance_max un nombre fini positif ou nul'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limite = min(limite, 100)
+        
+        geo_near = {
+            'near': point,
+            'distanceField': 'distance',
+            'spherical': True,
+        }
+        if distance_max is not None:
+            geo_near['maxDistance'] = distance_max
+        
+        resultats = list(ZoneGeographique._get_collection().aggregate([
+            {'$geoNear': geo_near},
+            {'$limit': limite},
+            *projection_selection(request),
+        ]))
+        
+        return Response(representations_avec_distance(resultats, request))
+    
+    @swagger_auto_schema(
+        operation_description="Récupérer les zones géographiques dont le rayon contient un point.",
+        manual_parameters=PARAMETRES_SELECTION + [
+            openapi.Parameter('latitude', openapi.IN_QUERY, description="Latitude du point", type=openapi.TYPE_NUMBER, required=True),
+            openapi.Parameter('longitude', openapi.IN_QUERY, description="Longitude du point", type=openapi.TYPE_NUMBER, required=True),
+        ],
+        responses={
+            200: openapi.Response(description="Zones contenant le point, triées par distance croissante"),
+            400: openapi.Response(
+                description="Paramètres invalides",
+                examples={"application/json": {"error": "latitude et longitude valides requises en paramètre"}}
+            ),
+        }
+    )
+    @action(detail=False, methods=['get'])
+    @conditionnel(ZoneGeographique, HabitantZone, User)
+    def contenant(self, request):
+        """Récupérer les zones dont le cercle (position, rayon) contient un point"""
+        point = lire_point(request.query_params)
+        if point is None:
+            return Response(
+                {'error': 'latitude et longitude valides requises en paramètre'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Le plus grand rayon borne la recherche : aucune zone plus éloignée ne peut contenir le point
+        plus_grande = ZoneGeographique.objects.order_by('-rayon').only('rayon').first()
+        rayon = plus_grande.rayon if plus_grande is not None else None
+        # Sans rayon fini positif ou nul, aucune zone ne peut contenir le point (et maxDistance serait refusé)
+        if rayon is None or not (math.isfinite(rayon) and rayon >= 0):
+            return Response([])
+        
+        resultats = list(ZoneGeographique._get_collection().aggregate([
+            {'$geoNear': {
+                'near': point,
+                'distanceField': 'distance',
+                'spherical': True,
+                'maxDistance': rayon * 1000,
+            }},
+            {'$match': {'$expr': {'$lte': ['$distance', {'$multiply': ['$rayon', 1000]}]}}},
+            *projection_selection(request),
+        ]))
+        
+        return Response(representations_avec_distance(resultats, request))